@@ -0,0 +1,514 @@
+"""Structural parsing of single-table aggregate SELECTs over ``entries``.
+
+Report engines that compute aggregates outside a single SQLite query (the
+columnar engine, the shard fan-out) need to know a query's shape: what it
+groups by, which aggregate calls it makes and how the output is finished.
+``parse()`` splits a query into those parts without interpreting scalar
+expressions. Those stay token lists that can be rendered back to SQL, with
+column references or aggregate calls substituted, for SQLite to evaluate.
+Anything outside the supported shape raises Unsupported so the caller can
+fall back to running the SQL as is.
+"""
+
+import re
+
+# Columns of ``entries`` (the table or the compact layout's view).
+COLUMNS = ("id", "name", "value", "dob", "zip", "race", "ethnicity")
+
+# Aggregate functions that can be computed from partial results. MIN and
+# MAX with more than one argument are the scalar functions.
+AGGREGATES = ("count", "sum", "total", "avg", "min", "max")
+
+_UNMERGEABLE = ("group_concat", "string_agg", "json_group_array", "json_group_object")
+
+# Words that may precede "(" without being a function call.
+_KEYWORDS = {
+    "and", "or", "not", "in", "is", "as", "case", "when", "then", "else", "end", "between", "like",
+    "glob", "exists", "select", "from", "where", "group", "by", "having", "order", "limit", "offset",
+    "asc", "desc", "distinct", "all", "null", "escape", "collate", "filter", "over", "cast",
+}
+
+_TOKEN = re.compile(
+    r"""
+    (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+    | (?P<str>'(?:[^']|'')*')
+    | (?P<qident>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+    | (?P<num>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<op>\|\||<=|>=|<>|!=|==|<<|>>|[-+*/%<>=(),.;&|~])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+class Unsupported(Exception):
+    """The query is not a shape this module can decompose; run it as is."""
+
+
+class Token:
+    __slots__ = ("kind", "text", "start", "end")
+
+    def __init__(self, kind, text, start=0, end=0):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+
+    @property
+    def word(self):
+        """Lowercased identifier (quotes removed), or None for other tokens."""
+        if self.kind == "ident":
+            return self.text.lower()
+        if self.kind == "qident":
+            return self.text[1:-1].replace(self.text[0] * 2, self.text[0]).lower()
+        return None
+
+    def render(self):
+        return self.text
+
+
+class Column:
+    """A reference to a column of ``entries``, however it was qualified."""
+
+    __slots__ = ("name", "start", "end")
+
+    def __init__(self, name, start=0, end=0):
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def render(self):
+        return self.name
+
+
+class Group:
+    """A parenthesized expression."""
+
+    __slots__ = ("expr", "start", "end")
+
+    def __init__(self, expr, start=0, end=0):
+        self.expr = expr
+        self.start = start
+        self.end = end
+
+
+class Call:
+    __slots__ = ("name", "args", "distinct", "star", "start", "end")
+
+    def __init__(self, name, args, distinct=False, star=False, start=0, end=0):
+        self.name = name
+        self.args = args
+        self.distinct = distinct
+        self.star = star
+        self.start = start
+        self.end = end
+
+    @property
+    def is_aggregate(self):
+        return self.name in AGGREGATES and (self.name not in ("min", "max") or len(self.args) == 1)
+
+
+def tokenize(sql):
+    tokens = []
+    position = 0
+    while position < len(sql):
+        m = _TOKEN.match(sql, position)
+        if m is None:
+            raise Unsupported(f"Unexpected character {sql[position]!r}")
+        position = m.end()
+        if m.lastgroup != "space":
+            tokens.append(Token(m.lastgroup, m.group(), m.start(), m.end()))
+    while tokens and tokens[-1].text == ";":
+        tokens.pop()
+    if any(t.text == ";" for t in tokens):
+        raise Unsupported("Multiple statements")
+    return tokens
+
+
+def _nest(tokens, start=0, closing=False):
+    """Nest parentheses into Group and Call items; returns (items, next index)."""
+    items = []
+    i = start
+    while i < len(tokens):
+        token = tokens[i]
+        if token.text == ")":
+            if not closing:
+                raise Unsupported("Unbalanced parentheses")
+            return items, i + 1
+        if token.text == "(":
+            inner, i = _nest(tokens, i + 1, closing=True)
+            end = tokens[i - 1].end
+            previous = items[-1] if items else None
+            if isinstance(previous, Token) and previous.kind == "ident" and previous.word not in _KEYWORDS:
+                items[-1] = _call(previous.word, inner, previous.start, end)
+            elif isinstance(previous, Token) and previous.word == "cast":
+                items[-1] = Call("cast", [inner], start=previous.start, end=end)
+            else:
+                items.append(Group(inner, token.start, end))
+            continue
+        items.append(token)
+        i += 1
+    if closing:
+        raise Unsupported("Unbalanced parentheses")
+    return items, i
+
+
+def _call(name, inner, start, end):
+    if name in _UNMERGEABLE:
+        raise Unsupported(f"{name}() cannot be computed from partial results")
+    distinct = bool(inner) and _is_word(inner[0], "distinct")
+    if distinct:
+        inner = inner[1:]
+    star = len(inner) == 1 and isinstance(inner[0], Token) and inner[0].text == "*"
+    return Call(name, [] if star else _split(inner, ","), distinct, star, start, end)
+
+
+def _is_word(item, *words):
+    return isinstance(item, Token) and item.kind == "ident" and item.word in words
+
+
+def _split(items, separator):
+    parts = [[]]
+    for item in items:
+        if isinstance(item, Token) and item.text == separator:
+            parts.append([])
+        else:
+            parts[-1].append(item)
+    if any(not part for part in parts):
+        raise Unsupported("Empty expression")
+    return parts
+
+
+def _walk(expr):
+    for item in expr:
+        yield item
+        if isinstance(item, Group):
+            yield from _walk(item.expr)
+        elif isinstance(item, Call):
+            for arg in item.args:
+                yield from _walk(arg)
+
+
+def _resolve_columns(expr, qualifiers):
+    """Replace column identifiers (bare or qualified) with Column items, in place."""
+    out = []
+    i = 0
+    while i < len(expr):
+        item = expr[i]
+        if isinstance(item, Group):
+            _resolve_columns(item.expr, qualifiers)
+        elif isinstance(item, Call):
+            for arg in item.args:
+                _resolve_columns(arg, qualifiers)
+        elif isinstance(item, Token) and item.word is not None:
+            if (
+                item.word in qualifiers and i + 2 < len(expr) and isinstance(expr[i + 1], Token)
+                and expr[i + 1].text == "." and isinstance(expr[i + 2], Token) and expr[i + 2].word in COLUMNS
+            ):
+                out.append(Column(expr[i + 2].word, item.start, expr[i + 2].end))
+                i += 3
+                continue
+            if item.word in COLUMNS:
+                item = Column(item.word, item.start, item.end)
+        out.append(item)
+        i += 1
+    expr[:] = out
+    return expr
+
+
+def render(expr, substitute=None):
+    """SQL text for ``expr``; ``substitute(item)`` may return replacement text."""
+    parts = []
+    for item in expr:
+        text = substitute(item) if substitute is not None else None
+        if text is not None:
+            parts.append(text)
+        elif isinstance(item, Group):
+            parts.append("(" + render(item.expr, substitute) + ")")
+        elif isinstance(item, Call):
+            if item.name == "cast":
+                parts.append("CAST(" + render(item.args[0], substitute) + ")")
+                continue
+            args = "*" if item.star else ", ".join(render(arg, substitute) for arg in item.args)
+            parts.append(f"{item.name}({'DISTINCT ' if item.distinct else ''}{args})")
+        else:
+            parts.append(item.render())
+    return " ".join(parts)
+
+
+def key(expr):
+    """Canonical text of ``expr`` for comparing expressions."""
+    return render(expr, lambda item: item.text.lower() if isinstance(item, Token) and item.kind == "ident" else None)
+
+
+def columns(expr):
+    """Names of the ``entries`` columns ``expr`` reads."""
+    return {item.name for item in _walk(expr) if isinstance(item, Column)}
+
+
+def conjuncts(expr):
+    """Split ``expr`` on its top-level ANDs (the AND of a BETWEEN is kept)."""
+    parts = [[]]
+    between = False
+    for item in expr:
+        if _is_word(item, "between"):
+            between = True
+        elif _is_word(item, "and"):
+            if not between:
+                parts.append([])
+                continue
+            between = False
+        parts[-1].append(item)
+    if any(not part for part in parts):
+        raise Unsupported("Empty expression")
+    return parts
+
+
+def aggregate_calls(expr):
+    """Aggregate Call items in ``expr``, outermost first; nested aggregates are unsupported."""
+    calls = []
+    for item in _walk(expr):
+        if isinstance(item, Call) and item.is_aggregate:
+            for arg in item.args:
+                if any(isinstance(inner, Call) and inner.is_aggregate for inner in _walk(arg)):
+                    raise Unsupported("Nested aggregate")
+            calls.append(item)
+    return calls
+
+
+class Query:
+    """The clauses of ``SELECT ... FROM entries [WHERE] [GROUP BY] [HAVING] [ORDER BY] [LIMIT]``.
+
+    ``select`` holds ``(expr, alias)`` pairs, ``order_by`` holds
+    ``(expr, direction)`` pairs (direction is "" or the original ASC/DESC
+    and NULLS text), and ``group_by`` holds expressions with aliases and
+    ordinals already resolved. ``aggregates`` lists the distinct aggregate
+    calls in SELECT, HAVING and ORDER BY, keyed by their canonical text.
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.select = []
+        self.where = None
+        self.group_by = []
+        self.having = None
+        self.order_by = []
+        self.limit = None
+        self.offset = None
+        self.aggregates = {}
+
+    @property
+    def is_aggregate(self):
+        return bool(self.group_by or self.aggregates)
+
+    def name(self, index):
+        """Output column name SQLite gives select item ``index``."""
+        expr, alias = self.select[index]
+        if alias is not None:
+            return alias
+        if len(expr) == 1 and isinstance(expr[0], Column):
+            return expr[0].name
+        return self.sql[expr[0].start:expr[-1].end]
+
+
+_CLAUSES = ("select", "from", "where", "group", "having", "order", "limit")
+
+
+def parse(sql):
+    """Parse ``sql`` into a Query, or raise Unsupported."""
+    items, _ = _nest(tokenize(sql))
+    for item in _walk(items):
+        if _is_word(item, "select", "union", "intersect", "except", "join", "over", "window", "with", "filter",
+                    "natural", "values"):
+            if item is not items[0] or item.word != "select":
+                raise Unsupported(f"{item.text.upper()} is not supported")
+    if not items or not _is_word(items[0], "select"):
+        raise Unsupported("Not a SELECT")
+
+    clauses = {}
+    current = None
+    i = 0
+    while i < len(items):
+        item = items[i]
+        word = item.word if isinstance(item, Token) and item.kind == "ident" else None
+        if word in _CLAUSES:
+            if word in ("group", "order"):
+                if not (i + 1 < len(items) and _is_word(items[i + 1], "by")):
+                    raise Unsupported(f"Malformed {word.upper()} BY")
+                i += 1
+            if word in clauses:
+                raise Unsupported(f"Repeated {word.upper()}")
+            current = clauses[word] = []
+        elif current is None:
+            raise Unsupported("Not a SELECT")
+        else:
+            current.append(item)
+        i += 1
+
+    query = Query(sql)
+    qualifiers = _from_clause(clauses.get("from"))
+    select = clauses["select"]
+    if select and _is_word(select[0], "distinct", "all"):
+        if _is_word(select[0], "distinct"):
+            raise Unsupported("SELECT DISTINCT is not supported")
+        select = select[1:]
+    for part in _split(select, ","):
+        expr, alias = _alias(part)
+        if any(isinstance(item, Token) and item.text == "*" for item in expr) and len(expr) == 1:
+            raise Unsupported("SELECT * is not supported")
+        query.select.append((_resolve_columns(expr, qualifiers), alias))
+    if "where" in clauses:
+        query.where = _resolve_columns(clauses["where"], qualifiers)
+    if "having" in clauses:
+        query.having = _resolve_columns(clauses["having"], qualifiers)
+    for part in _split(clauses["group"], ",") if "group" in clauses else []:
+        query.group_by.append(_group_term(query, _resolve_columns(part, qualifiers)))
+    for part in _split(clauses["order"], ",") if "order" in clauses else []:
+        query.order_by.append(_order_term(_resolve_columns(part, qualifiers)))
+    if "limit" in clauses:
+        query.limit, query.offset = _limit(clauses["limit"])
+
+    for expr in [e for e, _ in query.select] + ([query.having] if query.having else []) + [e for e, _ in query.order_by]:
+        for call in aggregate_calls(expr):
+            query.aggregates.setdefault(key([call]), call)
+    if query.where is not None and aggregate_calls(query.where):
+        raise Unsupported("Aggregate in WHERE")
+    return query
+
+
+def _from_clause(items):
+    if not items or not _is_word(items[0], "entries"):
+        raise Unsupported("Only queries over entries are supported")
+    rest = items[1:]
+    if rest and _is_word(rest[0], "as"):
+        rest = rest[1:]
+    if len(rest) > 1 or (rest and rest[0].word is None):
+        raise Unsupported("Only a single table is supported")
+    return {"entries"} | ({rest[0].word} if rest else set())
+
+
+def _alias(part):
+    if len(part) >= 3 and _is_word(part[-2], "as") and isinstance(part[-1], Token) and part[-1].word is not None:
+        return part[:-2], part[-1].text if part[-1].kind == "ident" else _unquote(part[-1])
+    # An alias without AS: a name straight after a complete expression.
+    if len(part) >= 2 and isinstance(part[-1], Token) and part[-1].word not in (None, *_KEYWORDS, *COLUMNS):
+        previous = part[-2]
+        if not (isinstance(previous, Token) and (previous.kind == "op" or previous.word in _KEYWORDS - {"end"})):
+            return part[:-1], part[-1].text if part[-1].kind == "ident" else _unquote(part[-1])
+    return part, None
+
+
+def _unquote(token):
+    return token.text[1:-1].replace(token.text[0] * 2, token.text[0]) if token.text[0] != "[" else token.text[1:-1]
+
+
+def _group_term(query, expr):
+    if len(expr) == 1 and isinstance(expr[0], Token):
+        token = expr[0]
+        if token.kind == "num" and token.text.isdigit():
+            index = int(token.text) - 1
+            if not 0 <= index < len(query.select):
+                raise Unsupported("GROUP BY ordinal out of range")
+            return query.select[index][0]
+        if token.word is not None:
+            for select_expr, alias in query.select:
+                if alias is not None and alias.lower() == token.word:
+                    return select_expr
+    return expr
+
+
+def _order_term(expr):
+    direction = []
+    while expr and _is_word(expr[-1], "asc", "desc", "first", "last", "nulls"):
+        direction.insert(0, expr.pop().text.upper())
+    if not expr or any(_is_word(item, "collate") for item in expr):
+        raise Unsupported("Unsupported ORDER BY term")
+    return expr, " ".join(direction)
+
+
+def _limit(items):
+    numbers = [item for item in items if not (isinstance(item, Token) and (item.text == "," or _is_word(item, "offset")))]
+    if not all(isinstance(item, Token) and item.kind == "num" and item.text.isdigit() for item in numbers):
+        raise Unsupported("LIMIT must be an integer literal")
+    values = [int(item.text) for item in numbers]
+    if len(values) == 1:
+        return values[0], None
+    if len(values) == 2:
+        if any(isinstance(item, Token) and item.text == "," for item in items):
+            return values[1], values[0]
+        return values[0], values[1]
+    raise Unsupported("Malformed LIMIT")
+
+
+def project(db, query, rows):
+    """Finish ``query`` in SQLite ``db`` over one row per group.
+
+    Each row holds the group keys k0.. then the aggregate values a0.., in
+    ``query.group_by`` and ``query.aggregates`` order. Returns
+    ``(columns, rows)`` as the original query would.
+    """
+    names = [f"k{i}" for i in range(len(query.group_by))] + [f"a{i}" for i in range(len(query.aggregates))]
+    keys = {key(expr): f"k{i}" for i, expr in enumerate(query.group_by)}
+    keys.update({name: f"a{i}" for i, name in enumerate(query.aggregates)})
+    aliases = {(alias or "").lower() for _, alias in query.select} - {""}
+
+    def rewrite(expr):
+        if key(expr) in keys:
+            return keys[key(expr)]
+        return render(expr, substitute)
+
+    def substitute(item):
+        if isinstance(item, Group):
+            name = keys.get(key(item.expr))
+            return name and f"({name})"
+        if isinstance(item, (Call, Column)):
+            name = keys.get(key([item]))
+            if name is None and isinstance(item, Column):
+                raise Unsupported(f"Column {item.name} is neither grouped nor aggregated")
+            return name
+        return None
+
+    def order_term(expr):
+        item = expr[0]
+        if len(expr) == 1 and isinstance(item, Token) and (
+            item.kind == "num" or item.word in aliases
+        ):
+            return item.text
+        if len(expr) == 1 and isinstance(item, Column) and item.name in aliases:
+            return item.name
+        return rewrite(expr)
+
+    select = ", ".join(f"{rewrite(expr)} AS {quote(query.name(i))}" for i, (expr, _) in enumerate(query.select))
+    sql = f"SELECT {select} FROM temp.groups"
+    if query.having is not None:
+        sql += f" WHERE {rewrite(query.having)}"
+    # Groups come out of SQLite's GROUP BY in key order; keep that as the
+    # tie-break under any ORDER BY.
+    order = [f"{order_term(expr)} {direction}".rstrip() for expr, direction in query.order_by]
+    order += [f"k{i}" for i in range(len(query.group_by))]
+    if order:
+        sql += f" ORDER BY {', '.join(order)}"
+    if query.limit is not None:
+        sql += f" LIMIT {query.limit}" + (f" OFFSET {query.offset}" if query.offset is not None else "")
+
+    db.execute("DROP TABLE IF EXISTS temp.groups")
+    db.execute(f"CREATE TEMP TABLE groups ({', '.join(names)})")
+    try:
+        db.executemany(f"INSERT INTO temp.groups VALUES ({', '.join('?' * len(names))})", rows)
+        cursor = db.execute(sql)
+        return [d[0] for d in cursor.description], [list(row) for row in cursor]
+    finally:
+        db.execute("DROP TABLE temp.groups")
+
+
+def sort_key(value):
+    """Order values the way SQLite does: NULL, numbers, text, then blobs."""
+    if value is None:
+        return (-1, 0)
+    if isinstance(value, (int, float)):
+        return (0, value)
+    return (1, value) if isinstance(value, str) else (2, value)
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
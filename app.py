@@ -1,8 +1,129 @@
+import atexit
+import base64
+import io
+import json
 import os
-import sqlite3
+import time
 
 import anthropic
-from flask import Flask, g, request, jsonify, render_template_string
+import click
+from flask import (
+    Flask, Response, g, has_app_context, request, jsonify, render_template_string, stream_with_context,
+)
+from itsdangerous import BadData, URLSafeSerializer
+
+import aggregate
+import assets
+import columnar
+import compact
+import export
+import fastjson
+import rollups
+import replica
+import sandbox
+import search
+import shards
+from db import ConnectionManager
+from llm import LLMClient, SingleFlight
+from metrics import NULL_STAGE, Registry, Stage, server_timing
+from result_cache import DataVersion, ResultCache
+from sql_cache import SQLCache
+from writer import GroupCommitWriter, QueueFullError, WriteFailedError
+
+VIRTUAL_TABLE_JS = """
+    // Renders only the rows scrolled into view (plus a small overscan) between
+    // two spacer rows sized to stand in for everything else, so tables with
+    // tens of thousands of rows keep a few dozen <tr> elements in the DOM.
+    class VirtualTable {
+      constructor(scroller, tbody, emptyText) {
+        this.scroller = scroller;
+        this.tbody = tbody;
+        this.emptyText = emptyText;
+        this.rows = [];
+        this.columns = 1;
+        this.rowHeight = 37;
+        this.measured = false;
+        this.overscan = 10;
+        this.frame = 0;
+        scroller.addEventListener('scroll', () => this.schedule());
+        window.addEventListener('resize', () => this.schedule());
+      }
+
+      setRows(rows, columns) {
+        this.rows = rows;
+        if (columns) this.columns = columns;
+        this.scroller.scrollTop = 0;
+        this.render();
+      }
+
+      append(rows) {
+        for (const row of rows) this.rows.push(row);
+        this.schedule();
+      }
+
+      schedule() {
+        if (!this.frame) this.frame = requestAnimationFrame(() => { this.frame = 0; this.render(); });
+      }
+
+      spacer(height) {
+        const tr = document.createElement('tr');
+        tr.className = 'spacer';
+        const td = document.createElement('td');
+        td.colSpan = this.columns;
+        td.style.height = height + 'px';
+        tr.appendChild(td);
+        return tr;
+      }
+
+      render() {
+        if (!this.rows.length) {
+          const tr = document.createElement('tr');
+          tr.className = 'empty';
+          const td = document.createElement('td');
+          td.colSpan = this.columns;
+          td.textContent = this.emptyText;
+          tr.appendChild(td);
+          this.tbody.replaceChildren(tr);
+          return;
+        }
+        const top = this.scroller.scrollTop;
+        const height = this.scroller.clientHeight || window.innerHeight;
+        const start = Math.max(0, Math.floor(top / this.rowHeight) - this.overscan);
+        const end = Math.min(this.rows.length, Math.ceil((top + height) / this.rowHeight) + this.overscan);
+        const frag = document.createDocumentFragment();
+        frag.appendChild(this.spacer(start * this.rowHeight));
+        for (let i = start; i < end; i++) {
+          const tr = document.createElement('tr');
+          for (const val of this.rows[i]) {
+            const td = document.createElement('td');
+            td.textContent = (val !== null && val !== undefined && val !== '') ? val : '\\u2014';
+            tr.appendChild(td);
+          }
+          frag.appendChild(tr);
+        }
+        frag.appendChild(this.spacer((this.rows.length - end) * this.rowHeight));
+        this.tbody.replaceChildren(frag);
+        if (!this.measured) {
+          // Calibrate against a real row once, then re-window with it.
+          this.measured = true;
+          const actual = this.tbody.rows[1].getBoundingClientRect().height;
+          if (actual && Math.abs(actual - this.rowHeight) > 0.5) {
+            this.rowHeight = actual;
+            this.render();
+          }
+        }
+      }
+    }
+"""
+
+VIRTUAL_TABLE_CSS = """
+    .table-scroll { max-height: 70vh; overflow-y: auto; border: 1px solid #ddd; border-radius: 8px; background: #fff; }
+    .table-scroll table { border: none; border-radius: 0; }
+    .table-scroll th { position: sticky; top: 0; z-index: 1; }
+    .table-scroll td { white-space: nowrap; overflow: hidden; text-overflow: ellipsis; max-width: 24rem; }
+    .table-scroll tr.spacer td { padding: 0; border: none; }
+    .table-scroll tr.empty td { color: #999; font-style: italic; }
+"""
 
 PAGE = """<!DOCTYPE html>
 <html lang="en">
@@ -32,6 +153,7 @@ PAGE = """<!DOCTYPE html>
     th { background: #f0f0f0; font-weight: 600; white-space: nowrap; }
     tr:last-child td { border-bottom: none; }
     #empty-row td { color: #999; font-style: italic; }
+{{ virtual_table_css|safe }}
   </style>
 </head>
 <body>
@@ -73,46 +195,53 @@ PAGE = """<!DOCTYPE html>
   </form>
 
   <h2>All Entries</h2>
-  <table>
-    <thead>
-      <tr>
-        <th>Full Name</th>
-        <th>Date of Birth</th>
-        <th>Zip Code</th>
-        <th>Race</th>
-        <th>Ethnicity</th>
-      </tr>
-    </thead>
-    <tbody id="entries-body"></tbody>
-  </table>
+  <div class="table-scroll" id="entries-scroll">
+    <table>
+      <thead>
+        <tr>
+          <th>Full Name</th>
+          <th>Date of Birth</th>
+          <th>Zip Code</th>
+          <th>Race</th>
+          <th>Ethnicity</th>
+        </tr>
+      </thead>
+      <tbody id="entries-body"></tbody>
+    </table>
+  </div>
 
   <script>
-    function cell(text) {
-      const td = document.createElement('td');
-      td.textContent = text || '—';
-      return td;
+{{ virtual_table_js|safe }}
+    const entriesTable = new VirtualTable(
+      document.getElementById('entries-scroll'), document.getElementById('entries-body'), 'No entries yet.');
+    entriesTable.columns = 5;
+
+    const PAGE_SIZE = 500;
+    let lastId = 0;
+
+    let loading = Promise.resolve();
+
+    // Appends every entry newer than lastId. Calls are chained so a load
+    // never starts while another is still paging from the same lastId.
+    function loadEntries() {
+      loading = loading.then(appendNewEntries, appendNewEntries);
+      return loading;
     }
 
-    async function loadEntries() {
-      const res = await fetch('/data');
-      const body = await res.json();
-      const tbody = document.getElementById('entries-body');
-      tbody.innerHTML = '';
-      if (body.data.length === 0) {
-        tbody.innerHTML = '<tr id="empty-row"><td colspan="5">No entries yet.</td></tr>';
-        return;
-      }
-      for (const entry of body.data) {
-        let demo = {};
-        try { demo = JSON.parse(entry.value); } catch {}
-        const tr = document.createElement('tr');
-        tr.appendChild(cell(entry.name));
-        tr.appendChild(cell(demo.dob));
-        tr.appendChild(cell(demo.zip));
-        tr.appendChild(cell(demo.race));
-        tr.appendChild(cell(demo.ethnicity));
-        tbody.appendChild(tr);
-      }
+    async function appendNewEntries() {
+      let params = new URLSearchParams({ limit: PAGE_SIZE, since_id: lastId });
+      do {
+        const res = await fetch('/data?' + params);
+        const body = await res.json();
+        entriesTable.append(body.data.map(entry => {
+          let demo = {};
+          try { demo = JSON.parse(entry.value); } catch {}
+          return [entry.name, demo.dob, demo.zip, demo.race, demo.ethnicity];
+        }));
+        lastId = body.last_id;
+        params = body.next ? new URLSearchParams({ limit: PAGE_SIZE, after: body.next }) : null;
+      } while (params);
+      entriesTable.schedule();
     }
 
     document.getElementById('entry-form').addEventListener('submit', async (e) => {
@@ -158,7 +287,7 @@ REPORTS_PAGE = """<!DOCTYPE html>
   <meta charset="UTF-8">
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
   <title>Reports</title>
-  <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+  <script src="{{ chart_js_url }}" defer></script>
   <style>
     *, *::before, *::after { box-sizing: border-box; margin: 0; padding: 0; }
     body { font-family: system-ui, sans-serif; color: #1a1a1a; background: #f5f5f5; padding: 2rem; }
@@ -194,6 +323,8 @@ REPORTS_PAGE = """<!DOCTYPE html>
     th { background: #f0f0f0; font-weight: 600; white-space: nowrap; }
     tr:last-child td { border-bottom: none; }
     .no-results td { color: #999; font-style: italic; }
+    .chart-note { font-size: 0.8rem; color: #777; margin-top: 0.5rem; min-height: 1rem; }
+{{ virtual_table_css|safe }}
 
     .spinner { display: inline-block; width: 0.9rem; height: 0.9rem; border: 2px solid #ccc; border-top-color: #4f7dff; border-radius: 50%; animation: spin 0.6s linear infinite; vertical-align: middle; margin-right: 0.4rem; }
     @keyframes spin { to { transform: rotate(360deg); } }
@@ -230,11 +361,14 @@ REPORTS_PAGE = """<!DOCTYPE html>
       <div class="tab-panel" id="panel-bar"><canvas id="chart-bar"></canvas></div>
       <div class="tab-panel" id="panel-pie" style="display:none"><canvas id="chart-pie"></canvas></div>
       <div class="tab-panel" id="panel-line" style="display:none"><canvas id="chart-line"></canvas></div>
+      <div class="chart-note" id="chart-note"></div>
+    </div>
+    <div class="table-scroll" id="results-scroll">
+      <table>
+        <thead id="results-head"></thead>
+        <tbody id="results-body"></tbody>
+      </table>
     </div>
-    <table>
-      <thead id="results-head"></thead>
-      <tbody id="results-body"></tbody>
-    </table>
     <div class="sql-block">
       <h2>Generated SQL</h2>
       <pre id="sql-display"></pre>
@@ -242,19 +376,30 @@ REPORTS_PAGE = """<!DOCTYPE html>
   </div>
 
   <script>
+{{ virtual_table_js|safe }}
     const input   = document.getElementById('q-input');
     const btn     = document.getElementById('q-btn');
     const status  = document.getElementById('status');
     const section = document.getElementById('results-section');
     const chartInstances = { bar: null, pie: null, line: null };
+    const resultsTable = new VirtualTable(
+      document.getElementById('results-scroll'), document.getElementById('results-body'), 'No results.');
+
+    // Large results are capped or downsampled before charting.
+    const MAX_BAR_POINTS = 100;
+    const MAX_PIE_SLICES = 10;
+    const MAX_LINE_POINTS = 500;
+    let chartData = null;
+
+    function showTab(tab) {
+      document.querySelectorAll('.tab-btn').forEach(b => b.classList.toggle('active', b.dataset.tab === tab));
+      document.querySelectorAll('.tab-panel').forEach(p => { p.style.display = 'none'; });
+      document.getElementById('panel-' + tab).style.display = '';
+      renderChart(tab);
+    }
 
     document.querySelectorAll('.tab-btn').forEach(btn => {
-      btn.addEventListener('click', () => {
-        document.querySelectorAll('.tab-btn').forEach(b => b.classList.remove('active'));
-        document.querySelectorAll('.tab-panel').forEach(p => { p.style.display = 'none'; });
-        btn.classList.add('active');
-        document.getElementById('panel-' + btn.dataset.tab).style.display = '';
-      });
+      btn.addEventListener('click', () => showTab(btn.dataset.tab));
     });
 
     document.querySelectorAll('.chip').forEach(chip => {
@@ -272,24 +417,41 @@ REPORTS_PAGE = """<!DOCTYPE html>
       section.style.display = 'none';
 
       try {
-        const res  = await fetch('/reports/query', {
+        // Streamed: a header line, then batches of rows drawn as they arrive.
+        const res = await fetch('/reports/query', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ question }),
+          body: JSON.stringify({ question, stream: 'ndjson' }),
         });
-        const body = await res.json();
 
         if (!res.ok) {
+          const body = await res.json();
           status.textContent = body.error || 'Something went wrong.';
           if (body.sql) showSql(body.sql);
           return;
         }
 
-        status.textContent = '';
-        showSql(body.sql);
-        showCharts(body.columns, body.rows);
-        showTable(body.columns, body.rows);
-        section.style.display = '';
+        let columns = [];
+        let warnings = [];
+        // append() adds to the array handed to setRows(), so this fills up too.
+        const rows = [];
+        for await (const line of ndjsonLines(res)) {
+          if (line.columns) {
+            columns = line.columns;
+            warnings = line.warnings || [];
+            status.innerHTML = '<span class="spinner"></span>Loading rows\u2026';
+            showSql(line.sql);
+            showCharts(columns, []);
+            showTable(columns, rows);
+          } else if (line.rows) {
+            resultsTable.append(line.rows);
+            status.innerHTML = `<span class="spinner"></span>Loading rows\u2026 ${rows.length.toLocaleString()}`;
+          } else if (line.error) {
+            warnings.push(line.error + ' Showing the rows received before it stopped.');
+          }
+        }
+        status.textContent = warnings.join(' ');
+        showCharts(columns, rows);
       } catch (err) {
         status.textContent = 'Request failed: ' + err.message;
       } finally {
@@ -297,6 +459,23 @@ REPORTS_PAGE = """<!DOCTYPE html>
       }
     }
 
+    async function* ndjsonLines(res) {
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\\n');
+        buffered = lines.pop();
+        for (const line of lines) {
+          if (line) yield JSON.parse(line);
+        }
+      }
+      if (buffered) yield JSON.parse(buffered);
+    }
+
     function showSql(sql) {
       document.getElementById('sql-display').textContent = sql;
       section.style.display = '';
@@ -319,6 +498,7 @@ REPORTS_PAGE = """<!DOCTYPE html>
       for (const key of Object.keys(chartInstances)) {
         if (chartInstances[key]) { chartInstances[key].destroy(); chartInstances[key] = null; }
       }
+      chartData = null;
 
       if (!rows.length) { chartSection.style.display = 'none'; return; }
 
@@ -329,90 +509,123 @@ REPORTS_PAGE = """<!DOCTYPE html>
       if (!numericCols.length) { chartSection.style.display = 'none'; return; }
 
       chartSection.style.display = '';
-      const labels = rows.map(r => r[0] !== null ? String(r[0]) : '\u2014');
+      chartData = { columns, rows, numericCols };
 
       // Rebuild canvases to avoid Chart.js reuse issues
       for (const t of ['bar', 'pie', 'line']) {
         document.getElementById('panel-' + t).innerHTML = `<canvas id="chart-${t}"></canvas>`;
       }
 
-      // Bar chart
-      chartInstances.bar = new Chart(document.getElementById('chart-bar'), {
-        type: 'bar',
-        data: {
-          labels,
-          datasets: numericCols.map((ci, idx) => ({
-            label: columns[ci],
-            data: rows.map(r => parseFloat(r[ci]) ?? null),
-            backgroundColor: PALETTE[idx % PALETTE.length],
-            borderColor: PALETTE_BORDER[idx % PALETTE_BORDER.length],
-            borderWidth: 1,
-          })),
-        },
-        options: {
-          responsive: true,
-          plugins: { legend: { display: numericCols.length > 1 } },
-          scales: {
-            x: { grid: { color: 'rgba(0,0,0,0.05)' } },
-            y: { beginAtZero: true, grid: { color: 'rgba(0,0,0,0.05)' } },
-          },
-        },
-      });
+      // Only the bar chart is drawn now; the others wait until their tab opens.
+      showTab('bar');
+    }
 
-      // Pie chart (first numeric column only)
-      const pieData = rows.map(r => parseFloat(r[numericCols[0]]) || 0);
-      chartInstances.pie = new Chart(document.getElementById('chart-pie'), {
-        type: 'pie',
-        data: {
-          labels,
-          datasets: [{
-            data: pieData,
-            backgroundColor: PALETTE.slice(0, pieData.length),
-            borderColor: PALETTE_BORDER.slice(0, pieData.length),
-            borderWidth: 1,
-          }],
-        },
-        options: { responsive: true, plugins: { legend: { position: 'right' } } },
-      });
+    function label(r) {
+      return r[0] !== null ? String(r[0]) : '\u2014';
+    }
+
+    function renderChart(type) {
+      const note = document.getElementById('chart-note');
+      if (!chartData) { note.textContent = ''; return; }
+      const { columns, rows, numericCols } = chartData;
+      note.textContent = '';
 
-      // Line chart
-      chartInstances.line = new Chart(document.getElementById('chart-line'), {
-        type: 'line',
-        data: {
-          labels,
-          datasets: numericCols.map((ci, idx) => ({
-            label: columns[ci],
-            data: rows.map(r => parseFloat(r[ci]) ?? null),
-            backgroundColor: PALETTE[idx % PALETTE.length],
-            borderColor: PALETTE_BORDER[idx % PALETTE_BORDER.length],
-            borderWidth: 2,
-            fill: false,
-            tension: 0.3,
-            pointRadius: 4,
-          })),
-        },
-        options: {
-          responsive: true,
-          plugins: { legend: { display: numericCols.length > 1 } },
-          scales: {
-            x: { grid: { color: 'rgba(0,0,0,0.05)' } },
-            y: { beginAtZero: true, grid: { color: 'rgba(0,0,0,0.05)' } },
+      if (type === 'bar') {
+        const shown = rows.slice(0, MAX_BAR_POINTS);
+        if (shown.length < rows.length) {
+          note.textContent = `Showing the first ${shown.length} of ${rows.length} rows.`;
+        }
+        if (chartInstances.bar) return;
+        chartInstances.bar = new Chart(document.getElementById('chart-bar'), {
+          type: 'bar',
+          data: {
+            labels: shown.map(label),
+            datasets: numericCols.map((ci, idx) => ({
+              label: columns[ci],
+              data: shown.map(r => parseFloat(r[ci]) ?? null),
+              backgroundColor: PALETTE[idx % PALETTE.length],
+              borderColor: PALETTE_BORDER[idx % PALETTE_BORDER.length],
+              borderWidth: 1,
+            })),
           },
-        },
-      });
+          options: {
+            responsive: true,
+            animation: shown.length <= 50,
+            plugins: { legend: { display: numericCols.length > 1 } },
+            scales: {
+              x: { grid: { color: 'rgba(0,0,0,0.05)' } },
+              y: { beginAtZero: true, grid: { color: 'rgba(0,0,0,0.05)' } },
+            },
+          },
+        });
+      }
 
-      // Reset to bar tab
-      document.querySelectorAll('.tab-btn').forEach(b => b.classList.remove('active'));
-      document.querySelectorAll('.tab-panel').forEach(p => { p.style.display = 'none'; });
-      document.querySelector('.tab-btn[data-tab="bar"]').classList.add('active');
-      document.getElementById('panel-bar').style.display = '';
+      if (type === 'pie') {
+        // Pie chart (first numeric column only); the smallest slices are merged into "Other".
+        const ci = numericCols[0];
+        let slices = rows.map(r => [label(r), parseFloat(r[ci]) || 0]);
+        if (slices.length > MAX_PIE_SLICES) {
+          slices.sort((a, b) => b[1] - a[1]);
+          const rest = slices.slice(MAX_PIE_SLICES - 1);
+          slices = slices.slice(0, MAX_PIE_SLICES - 1);
+          slices.push(['Other', rest.reduce((sum, s) => sum + s[1], 0)]);
+          note.textContent = `${rest.length} smaller values are grouped as Other.`;
+        }
+        if (chartInstances.pie) return;
+        chartInstances.pie = new Chart(document.getElementById('chart-pie'), {
+          type: 'pie',
+          data: {
+            labels: slices.map(s => s[0]),
+            datasets: [{
+              data: slices.map(s => s[1]),
+              backgroundColor: PALETTE.slice(0, slices.length),
+              borderColor: PALETTE_BORDER.slice(0, slices.length),
+              borderWidth: 1,
+            }],
+          },
+          options: { responsive: true, plugins: { legend: { position: 'right' } } },
+        });
+      }
+
+      if (type === 'line') {
+        // Evenly spaced sample that always keeps the last point.
+        const step = Math.ceil(rows.length / MAX_LINE_POINTS);
+        const shown = step > 1 ? rows.filter((_, i) => i % step === 0 || i === rows.length - 1) : rows;
+        if (step > 1) {
+          note.textContent = `Showing ${shown.length} of ${rows.length} points (every ${step}th).`;
+        }
+        if (chartInstances.line) return;
+        chartInstances.line = new Chart(document.getElementById('chart-line'), {
+          type: 'line',
+          data: {
+            labels: shown.map(label),
+            datasets: numericCols.map((ci, idx) => ({
+              label: columns[ci],
+              data: shown.map(r => parseFloat(r[ci]) ?? null),
+              backgroundColor: PALETTE[idx % PALETTE.length],
+              borderColor: PALETTE_BORDER[idx % PALETTE_BORDER.length],
+              borderWidth: 2,
+              fill: false,
+              tension: 0.3,
+              pointRadius: shown.length > 100 ? 0 : 4,
+            })),
+          },
+          options: {
+            responsive: true,
+            animation: shown.length <= 100,
+            plugins: { legend: { display: numericCols.length > 1 } },
+            scales: {
+              x: { grid: { color: 'rgba(0,0,0,0.05)' } },
+              y: { beginAtZero: true, grid: { color: 'rgba(0,0,0,0.05)' } },
+            },
+          },
+        });
+      }
     }
 
     function showTable(columns, rows) {
       const head = document.getElementById('results-head');
-      const body = document.getElementById('results-body');
       head.innerHTML = '';
-      body.innerHTML = '';
 
       const hr = document.createElement('tr');
       columns.forEach(col => {
@@ -422,49 +635,292 @@ REPORTS_PAGE = """<!DOCTYPE html>
       });
       head.appendChild(hr);
 
-      if (rows.length === 0) {
-        body.innerHTML = `<tr class="no-results"><td colspan="${columns.length}">No results.</td></tr>`;
-        return;
-      }
-      rows.forEach(row => {
-        const tr = document.createElement('tr');
-        row.forEach(val => {
-          const td = document.createElement('td');
-          td.textContent = (val !== null && val !== undefined) ? val : '\u2014';
-          tr.appendChild(td);
-        });
-        body.appendChild(tr);
-      });
+      resultsTable.setRows(rows, columns.length);
     }
   </script>
 </body>
 </html>"""
 
 app = Flask(__name__)
+app.json = fastjson.JSONProvider(app)
+
+DATABASE = os.environ.get("DATABASE_PATH", "data.db")
+
+# SHARD_COUNT > 1 splits entries across that many files next to DATABASE,
+# partitioned by SHARD_KEY ("id" or "zip"); see shards.py. DATABASE itself
+# then stays empty: connections to it attach the shards.
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "0"))
+shard_set = shards.ShardSet(
+    shards.paths(DATABASE, SHARD_COUNT),
+    key=os.environ.get("SHARD_KEY", "id"),
+    zip_prefix=int(os.environ.get("SHARD_ZIP_PREFIX", "3")),
+    processes=int(os.environ.get("SHARD_PROCESSES", "0")) or None,
+) if SHARD_COUNT > 1 else None
+
+# GET /data returns at most this many rows per response unless a smaller
+# `limit` is requested; larger tables are walked with the `next` cursor.
+DATA_PAGE_SIZE = int(os.environ.get("DATA_PAGE_SIZE", "1000"))
+DATA_MAX_PAGE_SIZE = int(os.environ.get("DATA_MAX_PAGE_SIZE", "10000"))
+DATA_STREAM_BATCH = 500
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "5000"))
+
+# GET /data/search returns at most this many ranked matches.
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get("SEARCH_MAX_PAGE_SIZE", "100"))
+
+# POST /data/bulk commits once per chunk of this many valid records.
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "5000"))
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+# Per-stage request timing, reported in Server-Timing headers and on
+# /metrics. When disabled, timed blocks cost a single function call.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route.", ["method", "route", "status"]
+)
+LLM_SECONDS = metrics.histogram(
+    "llm_request_duration_seconds", "Time spent waiting on the model to generate SQL."
+)
+LLM_INPUT_TOKENS = metrics.counter(
+    "llm_input_tokens_total", "Prompt tokens sent to the model: uncached, written to or read from the prompt cache.",
+    ["kind"],
+)
+SQL_SECONDS = metrics.histogram(
+    "sql_execution_duration_seconds", "SQLite execution time by phase.", ["route", "phase"]
+)
+REPORT_ROWS = metrics.histogram(
+    "report_rows_returned", "Rows returned by report queries.",
+    buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000),
+)
+DB_WAIT_SECONDS = metrics.histogram(
+    "db_connection_wait_seconds", "Time to check out a database connection.", ["mode"]
+)
+REPORT_SOURCES = metrics.counter(
+    "report_queries_total", "Report queries by where the SQL came from.", ["source"]
+)
+REPORT_ENGINES = metrics.counter(
+    "report_engine_queries_total", "Report queries computed, by the engine that ran them.", ["engine"]
+)
+
+
+def stage(name, histogram=None, **labels):
+    if not METRICS_ENABLED:
+        return NULL_STAGE
+    sink = g.setdefault("timings", []) if has_app_context() else None
+    return Stage(name, sink, histogram, labels)
+
+
+def sql_stage(phase):
+    return stage(phase, SQL_SECONDS, route=request.url_rule.rule, phase=phase)
+
+
+@app.before_request
+def start_timer():
+    if METRICS_ENABLED:
+        g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_timings(response):
+    start = g.get("request_start")
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=str(response.status_code))
+        response.headers["Server-Timing"] = server_timing(g.get("timings", ()), elapsed)
+    return response
+
+
+def connection_manager(path, on_connect=None):
+    return ConnectionManager(
+        path,
+        journal_mode=os.environ.get("DB_JOURNAL_MODE", "WAL"),
+        synchronous=os.environ.get("DB_SYNCHRONOUS", "NORMAL"),
+        mmap_size=int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+        cache_size=int(os.environ.get("DB_CACHE_SIZE", str(-64 * 1024))),
+        busy_timeout=int(os.environ.get("DB_BUSY_TIMEOUT", "5000")),
+        pool_size=int(os.environ.get("DB_POOL_SIZE", "8")),
+        on_connect=on_connect,
+    )
+
 
-DATABASE = "data.db"
+connections = connection_manager(DATABASE, shard_set.attach if shard_set is not None else None)
+
+
+def live_entry_count():
+    # From the race rollup (one row per race) rather than a COUNT(*) scan.
+    with connections.connection(readonly=True) as db:
+        return db.execute("SELECT IFNULL(SUM(n), 0) FROM rollup_race").fetchone()[0]
+
+
+# With REPLICA_PATH set, report queries read a snapshot copy of the database
+# at that path (see replica.py), refreshed every REPLICA_INTERVAL seconds or
+# once REPLICA_WRITES entries have changed, instead of the live file.
+REPLICA_PATH = os.environ.get("REPLICA_PATH") or None
+if REPLICA_PATH is not None:
+    # In partitioned mode each shard gets its own snapshot file, and report
+    # fan-out reads those.
+    replica_shards = shards.ShardSet(
+        shards.paths(REPLICA_PATH, SHARD_COUNT), processes=shard_set.processes
+    ) if shard_set is not None else None
+    report_replica = replica.Replica(
+        [DATABASE] + (shard_set.paths if shard_set is not None else []),
+        [REPLICA_PATH] + (replica_shards.paths if replica_shards is not None else []),
+        live_entry_count,
+        interval=float(os.environ.get("REPLICA_INTERVAL", "60")),
+        writes=int(os.environ.get("REPLICA_WRITES", "10000")),
+        on_connect=replica_shards.attach if replica_shards is not None else None,
+        mmap_size=connections.mmap_size,
+        cache_size=connections.cache_size,
+        pool_size=connections.pool_size,
+    )
+    report_shards = replica_shards
+else:
+    report_replica = replica_shards = None
+    report_shards = shard_set
 
 
 def get_db():
     if "db" not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        with stage("db_wait", DB_WAIT_SECONDS, mode="rw"):
+            g.db = connections.acquire()
     return g.db
 
 
+def get_report_db():
+    if "report_db" not in g:
+        g.report_db = acquire_report_db()
+    return g.report_db
+
+
+def acquire_report_db():
+    with stage("db_wait", DB_WAIT_SECONDS, mode="ro"):
+        if report_replica is not None:
+            return report_replica.acquire()
+        return connections.acquire(readonly=True)
+
+
+def release_report_db(db):
+    if report_replica is not None:
+        report_replica.release(db)
+    else:
+        connections.release(db, readonly=True)
+
+
 @app.teardown_appcontext
 def close_db(exc):
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        connections.release(db)
+    report_db = g.pop("report_db", None)
+    if report_db is not None:
+        release_report_db(report_db)
+
+
+# Demographic fields of the JSON `value` exposed as virtual generated columns
+# so reports can group and filter on them through an index instead of parsing
+# every row's JSON.
+DEMOGRAPHIC_FIELDS = ("dob", "zip", "race", "ethnicity")
+
+ENTRY_INDEXES = {
+    "idx_entries_dob": "dob",
+    "idx_entries_zip": "zip",
+    "idx_entries_race_ethnicity": "race, ethnicity",
+    "idx_entries_ethnicity_dob": "ethnicity, dob",
+}
+
+
+def storage_connections():
+    """Write connections to each file that holds an ``entries`` table; the caller closes them."""
+    if shard_set is None:
+        return [connections.connect()]
+    return [connection_manager(path).connect() for path in shard_set.paths]
 
 
 def init_db():
-    db = sqlite3.connect(DATABASE)
-    db.execute(
-        "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, value TEXT NOT NULL)"
-    )
+    for shard in storage_connections():
+        shard.execute(
+            "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, value TEXT NOT NULL)"
+        )
+        migrate_db(shard)
+        shard.commit()
+        shard.close()
+    db = connections.connect()
+    if report_replica is not None:
+        if not report_replica.exists():
+            report_replica.refresh()
+        db.close()
+        db = report_replica.connect()
+    if columnar_engine is not None:
+        # Loaded before server.py forks, the snapshot is shared copy-on-write.
+        columnar_engine.refresh(db)
+    db.close()
+
+
+def migrate_db(db):
+    if compact.installed(db):
+        # entries is a view over the compact layout; see compact.py.
+        compact.install(db)
+        rollups.install(db, compact.TABLE)
+        search.install(db, compact.TABLE)
+        return
+    columns = {row[1] for row in db.execute("PRAGMA table_xinfo(entries)")}
+    for field in DEMOGRAPHIC_FIELDS:
+        if field not in columns:
+            # Only VIRTUAL columns can be added with ALTER TABLE; the indexes
+            # below materialize them. json_valid() keeps non-JSON values
+            # (which POST /data accepts) from failing the insert.
+            db.execute(
+                f"ALTER TABLE entries ADD COLUMN {field} TEXT GENERATED ALWAYS AS "
+                f"(CASE WHEN json_valid(value) THEN json_extract(value, '$.{field}') END) VIRTUAL"
+            )
+    for index, indexed in ENTRY_INDEXES.items():
+        db.execute(f"CREATE INDEX IF NOT EXISTS {index} ON entries ({indexed})")
+    rollups.install(db)
+    search.install(db)
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the demographic rollup tables from entries."""
+    for db in storage_connections():
+        rollups.rebuild(db)
+        db.commit()
+        db.close()
+
+
+@app.cli.command("rebuild-search")
+def rebuild_search_command():
+    """Reindex entry names for GET /data/search."""
+    for db in storage_connections():
+        search.install(db, compact.TABLE if compact.installed(db) else "entries")
+        search.rebuild(db)
+        db.commit()
+        db.close()
+
+
+@app.cli.command("compact-storage")
+@click.option("--batch-size", default=50000, show_default=True, help="Rows copied per transaction.")
+@click.option("--vacuum", is_flag=True, help="VACUUM afterwards to return freed pages to the filesystem.")
+def compact_storage_command(batch_size, vacuum):
+    """Convert entries to the compact storage layout.
+
+    Run it with the app stopped. It commits after every batch and picks up
+    where it left off if interrupted.
+    """
+    if shard_set is not None:
+        raise click.ClickException("The compact layout is not supported with SHARD_COUNT > 1.")
+    db = connections.connect()
+    migrate_db(db)
+    db.commit()
+    compact.convert(db, batch_size, progress=lambda done, total: click.echo(f"{done:,}/{total:,} rows"))
+    migrate_db(db)
     db.commit()
+    if vacuum:
+        db.execute("VACUUM")
     db.close()
 
 
@@ -473,13 +929,17 @@ SCHEMA_PROMPT = """You are a SQLite expert. Given a natural language question, r
 Schema:
   Table: entries
   Columns:
-    id      INTEGER  primary key
-    name    TEXT     person's full name (e.g. "Jane Smith")
-    value   TEXT     JSON string — access fields with json_extract():
-      json_extract(value, '$.dob')       → date of birth, YYYY-MM-DD string
-      json_extract(value, '$.zip')       → 5-digit zip code string
-      json_extract(value, '$.race')      → race category string
-      json_extract(value, '$.ethnicity') → ethnicity category string
+    id         INTEGER  primary key
+    name       TEXT     person's full name (e.g. "Jane Smith")
+    dob        TEXT     date of birth, YYYY-MM-DD string (indexed)
+    zip        TEXT     5-digit zip code string (indexed)
+    race       TEXT     race category string (indexed)
+    ethnicity  TEXT     ethnicity category string (indexed)
+    value      TEXT     raw JSON the columns above are derived from
+
+  Always use the dob, zip, race and ethnicity columns directly. Never call
+  json_extract() on value — the columns are indexed and json_extract() forces
+  a full scan.
 
   Race values: "White", "Black or African American", "Asian",
                "American Indian or Alaska Native",
@@ -489,8 +949,13 @@ Schema:
   Ethnicity values: "Hispanic or Latino", "Not Hispanic or Latino", "Prefer not to say"
 
   Age in years:
-    (strftime('%Y','now') - strftime('%Y', json_extract(value,'$.dob')))
-    - (strftime('%m-%d','now') < strftime('%m-%d', json_extract(value,'$.dob')))
+    (strftime('%Y','now') - strftime('%Y', dob))
+    - (strftime('%m-%d','now') < strftime('%m-%d', dob))
+
+  Birth year: substr(dob, 1, 4)
+
+  To skip blank values filter with `> ''` (e.g. WHERE dob > ''), not `!= ''`,
+  so SQLite can answer from the index.
 
 Rules:
   - SELECT only. No INSERT, UPDATE, DELETE, DROP, or any other statement type.
@@ -499,14 +964,113 @@ Rules:
   - If the question mentions charts, graphs, or visualizations, generate the SQL anyway — the application handles all rendering independently."""
 
 
+LLM_MODEL = "claude-haiku-4-5-20251001"
+
+sql_cache = SQLCache(
+    maxsize=int(os.environ.get("SQL_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("SQL_CACHE_TTL", str(24 * 3600))),
+    path=os.environ.get("SQL_CACHE_PATH") or None,
+)
+
+
+# Bumped by every write to `entries`; cached report results computed at an
+# older version are never served.
+data_version = DataVersion()
+
+# Budgets for running model-generated SQL; 0 disables a limit. The plan check
+# is "off", "warn" (report full scans alongside the results) or "reject".
+REPORT_TIMEOUT = float(os.environ.get("REPORT_TIMEOUT", "5"))
+REPORT_MAX_STEPS = int(os.environ.get("REPORT_MAX_STEPS", "100000000"))
+REPORT_MAX_ROWS = int(os.environ.get("REPORT_MAX_ROWS", "10000"))
+REPORT_PLAN_CHECK = os.environ.get("REPORT_PLAN_CHECK", "warn")
+REPORT_SCAN_ROWS = int(os.environ.get("REPORT_SCAN_ROWS", "100000"))
+
+# Instead of the whole result, POST /reports/query can return one page of it
+# with a cursor to the next, or stream it as NDJSON. Cursors are signed, as
+# they carry the SQL to run; without REPORT_CURSOR_SECRET a key is generated
+# at startup and cursors from before a restart are rejected.
+REPORT_MAX_PAGE_SIZE = int(os.environ.get("REPORT_MAX_PAGE_SIZE", "10000"))
+# Each page re-reads every row before it, so reading a result page by page
+# costs quadratic time; deeper pages are refused rather than left to time out.
+REPORT_MAX_OFFSET = int(os.environ.get("REPORT_MAX_OFFSET", "100000"))
+REPORT_STREAM_MAX_ROWS = int(os.environ.get("REPORT_STREAM_MAX_ROWS", "1000000"))
+report_cursors = URLSafeSerializer(os.environ.get("REPORT_CURSOR_SECRET") or os.urandom(32), salt="report-cursor")
+
+result_cache = ResultCache(max_bytes=int(os.environ.get("RESULT_CACHE_BYTES", str(64 * 1024 * 1024))))
+
+# "columnar" answers the aggregate queries it can decompose from an
+# in-memory NumPy snapshot of entries (needs numpy); anything else, or any
+# query it cannot handle, runs in SQLite.
+REPORT_ENGINE = os.environ.get("REPORT_ENGINE", "sqlite")
+columnar_engine = columnar.ColumnarEngine() if REPORT_ENGINE == "columnar" and columnar.available() else None
+
+
+llm = LLMClient(
+    max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "8")),
+    base_url=os.environ.get("ANTHROPIC_BASE_URL") or None,
+    timeout=float(os.environ.get("LLM_TIMEOUT", "30")),
+)
+
+# Identical questions asked while a model call for them is in flight wait
+# for that call instead of issuing their own.
+sql_inflight = SingleFlight()
+
+
+@metrics.collector
+def cache_metrics():
+    sql_stats = sql_cache.stats()
+    result_stats = result_cache.stats()
+    return [
+        ("sql_cache_hits_total", "counter", "Questions answered from the SQL cache.", sql_stats["hits"]),
+        ("sql_cache_misses_total", "counter", "Questions sent to the model.", sql_stats["misses"]),
+        ("sql_cache_coalesced_total", "counter", "Questions that waited on an identical in-flight call.", sql_inflight.shared),
+        ("result_cache_hits_total", "counter", "Report results served from the result cache.", result_stats["hits"]),
+        ("result_cache_misses_total", "counter", "Report results computed in SQLite.", result_stats["misses"]),
+        ("result_cache_bytes", "gauge", "Estimated memory held by cached results.", result_stats["bytes"]),
+    ]
+
+
+@metrics.collector
+def columnar_metrics():
+    if columnar_engine is None:
+        return []
+    stats = columnar_engine.stats()
+    return [
+        ("columnar_snapshot_rows", "gauge", "Entries held in the columnar snapshot.", stats["rows"]),
+        ("columnar_snapshot_reloads_total", "counter", "Full reloads of the snapshot after entries were deleted.", stats["reloads"]),
+    ]
+
+
+@metrics.collector
+def replica_metrics():
+    if report_replica is None:
+        return []
+    stats = report_replica.stats()
+    return [
+        ("report_snapshot_age_seconds", "gauge", "Age of the snapshot report queries read.", stats["age_seconds"] or 0),
+        ("report_snapshot_refreshes_total", "counter", "Report snapshots taken.", stats["refreshes"]),
+    ]
+
+
 def generate_sql(question):
-    client = anthropic.Anthropic()
-    msg = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=512,
-        system=SCHEMA_PROMPT,
-        messages=[{"role": "user", "content": question}],
-    )
+    with stage("llm", LLM_SECONDS):
+        msg = llm.create_message(
+            model=LLM_MODEL,
+            max_tokens=512,
+            # The schema prompt is identical on every call, so it is marked
+            # cacheable, but the API only caches prefixes of at least the
+            # model's minimum length (4096 tokens for Haiku 4.5). At about
+            # 450 tokens this one is not cached yet; llm_input_tokens_total
+            # shows what actually is.
+            system=[{"type": "text", "text": SCHEMA_PROMPT, "cache_control": {"type": "ephemeral"}}],
+            messages=[{"role": "user", "content": question}],
+        )
+    # Token accounting is best effort; a reply without usage is still a reply.
+    usage = getattr(msg, "usage", None)
+    if usage is not None:
+        LLM_INPUT_TOKENS.inc(getattr(usage, "input_tokens", None) or 0, kind="uncached")
+        LLM_INPUT_TOKENS.inc(getattr(usage, "cache_creation_input_tokens", None) or 0, kind="cache_write")
+        LLM_INPUT_TOKENS.inc(getattr(usage, "cache_read_input_tokens", None) or 0, kind="cache_read")
     sql = msg.content[0].text.strip()
     # Strip markdown fences if the model included them despite instructions
     if sql.startswith("```"):
@@ -514,42 +1078,332 @@ def generate_sql(question):
     return sql
 
 
+def is_select(sql):
+    return sql.upper().lstrip().startswith("SELECT")
+
+
+def get_sql(question):
+    key = sql_cache.key(question, LLM_MODEL, SCHEMA_PROMPT)
+    sql = sql_cache.get(key)
+    if sql is not None:
+        return sql, True
+    return sql_inflight.do(key, lambda: generate_and_cache_sql(question, key)), False
+
+
+def generate_and_cache_sql(question, key):
+    sql = generate_sql(question)
+    if is_select(sql):
+        sql_cache.put(key, sql)
+    return sql
+
+
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vendor")
+PAGE_MAX_AGE = int(os.environ.get("PAGE_MAX_AGE", "86400"))
+
+
+def load_assets():
+    # Vendored scripts are served under content-hashed names so they can be
+    # cached forever; the pages are rendered once with those URLs baked in.
+    static, urls = {}, {}
+    for name, mimetype in (("chart.umd.min.js", "text/javascript"),):
+        with open(os.path.join(VENDOR_DIR, name), "rb") as f:
+            asset = assets.Asset(f.read(), mimetype, assets.IMMUTABLE)
+        versioned = assets.versioned_name(name, asset)
+        static[versioned] = asset
+        urls[name] = "/assets/" + versioned
+
+    context = {
+        "virtual_table_js": VIRTUAL_TABLE_JS,
+        "virtual_table_css": VIRTUAL_TABLE_CSS,
+        "chart_js_url": urls["chart.umd.min.js"],
+    }
+    cache_control = f"public, max-age={PAGE_MAX_AGE}"
+    with app.app_context():
+        pages = {
+            "index": assets.Asset(render_template_string(PAGE, **context), "text/html", cache_control),
+            "reports": assets.Asset(render_template_string(REPORTS_PAGE, **context), "text/html", cache_control),
+        }
+    return pages, static
+
+
+PAGES, STATIC_ASSETS = load_assets()
+
+
 @app.route("/", methods=["GET"])
 def index():
-    return render_template_string(PAGE)
+    return PAGES["index"].response(request)
 
 
 @app.route("/reports", methods=["GET"])
 def reports():
-    return render_template_string(REPORTS_PAGE)
+    return PAGES["reports"].response(request)
+
+
+@app.route("/assets/<name>", methods=["GET"])
+def static_asset(name):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    return asset.response(request)
 
 
 @app.route("/reports/query", methods=["POST"])
 def reports_query():
     body = request.get_json(silent=True)
-    if not body or not body.get("question", "").strip():
-        return jsonify({"error": "A non-empty 'question' field is required"}), 400
+    if not isinstance(body, dict):
+        body = {}
+
+    stream = body.get("stream")
+    if stream is not None and stream != "ndjson":
+        return jsonify({"error": "'stream' must be 'ndjson'"}), 400
+    page_size = body.get("page_size")
+    if page_size is not None and (type(page_size) is not int or not 1 <= page_size <= REPORT_MAX_PAGE_SIZE):
+        return jsonify({"error": f"'page_size' must be an integer between 1 and {REPORT_MAX_PAGE_SIZE}"}), 400
+    if stream and (page_size is not None or body.get("cursor") is not None):
+        return jsonify({"error": "Use either 'stream' or 'page_size'/'cursor', not both"}), 400
+
+    version = report_version()
+    warnings = []
+    offset = 0
+    if body.get("cursor") is not None:
+        try:
+            token = report_cursors.loads(body["cursor"])
+            sql, source, offset, page_size = token["sql"], token["source"], token["offset"], token["page_size"]
+        except (BadData, KeyError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        cached = source == "cache"
+        if REPORT_MAX_OFFSET and offset > REPORT_MAX_OFFSET:
+            return jsonify({
+                "error": f"Pages start at most {REPORT_MAX_OFFSET} rows in; stream the query to read further.",
+                "limit": "offset", "sql": sql,
+            }), 422
+        if token.get("version") != version:
+            warnings.append("The data changed since the first page; rows may have moved between pages.")
+    else:
+        question = body.get("question")
+        if not isinstance(question, str) or not question.strip():
+            return jsonify({"error": "A non-empty 'question' field is required"}), 400
+        question = question.strip()
+
+        sql = rollups.match(question)
+        if sql is not None:
+            cached, source = False, "rollup"
+        else:
+            try:
+                sql, cached = get_sql(question)
+            except anthropic.AuthenticationError:
+                return jsonify({"error": "Anthropic API key is missing or invalid. Set the ANTHROPIC_API_KEY environment variable."}), 502
+            except Exception as e:
+                return jsonify({"error": f"Failed to generate SQL: {e}"}), 502
+            source = "cache" if cached else "model"
+        REPORT_SOURCES.inc(source=source)
+
+    if not is_select(sql):
+        return jsonify({"error": "Only SELECT queries are permitted.", "sql": sql}), 400
+
+    use_cache = body.get("cache", True) is not False and "no-cache" not in request.headers.get("Cache-Control", "")
+    hit = result_cache.get(sql, version) if use_cache else None
+    engine = None
+    query = None
+    page = None
+    if hit is not None:
+        columns, rows = hit
+    else:
+        db = get_report_db()
+        try:
+            # Streams and pages are not bound by REPORT_MAX_ROWS, so neither
+            # are the whole results they are cut from.
+            max_rows = REPORT_STREAM_MAX_ROWS if stream or page_size is not None else REPORT_MAX_ROWS
+            engine, result = report_engines(db, sql, warnings, max_rows)
+            if result is not None:
+                columns, rows = result
+                # Only results a plain request could return are cached.
+                if use_cache and not (REPORT_MAX_ROWS and len(rows) > REPORT_MAX_ROWS):
+                    result_cache.put(sql, version, columns, rows)
+            elif stream:
+                # The rows are read after this request has returned, so the
+                # query gets a connection of its own.
+                engine, query = "sqlite", report_stream_query(sql)
+                columns = query.columns
+            elif page_size is not None:
+                engine = "sqlite"
+                columns, page, has_more = sandbox.page(
+                    db, sql, offset, page_size, REPORT_TIMEOUT, REPORT_MAX_STEPS, timer=sql_stage
+                )
+                # A first page holding every row is the whole result.
+                whole = not offset and not has_more
+                if use_cache and whole and not (REPORT_MAX_ROWS and len(page) > REPORT_MAX_ROWS):
+                    result_cache.put(sql, version, columns, page)
+            else:
+                engine = "sqlite"
+                columns, rows = sandbox.execute(
+                    db, sql, REPORT_MAX_ROWS, REPORT_TIMEOUT, REPORT_MAX_STEPS, timer=sql_stage
+                )
+                if use_cache:
+                    result_cache.put(sql, version, columns, rows)
+        except sandbox.QueryLimitError as e:
+            return jsonify({"error": str(e), "limit": e.limit, "sql": sql}), 422
+        except Exception as e:
+            return jsonify({"error": f"Query failed: {e}", "sql": sql}), 400
+        REPORT_ENGINES.inc(engine=engine)
+
+    response = {
+        "columns": columns, "sql": sql, "cached": cached, "source": source,
+        "result_cached": hit is not None, "engine": engine,
+    }
+    if warnings:
+        response["warnings"] = warnings
+    if report_replica is not None:
+        response["snapshot"] = report_replica.info(query.db if query is not None else get_report_db())
+
+    if stream:
+        if query is not None:
+            lines = report_lines(response, query.batches(), (sql, version) if use_cache else None)
+            stream_response = Response(lines, mimetype="application/x-ndjson")
+            stream_response.call_on_close(lambda: release_stream_query(query))
+            return stream_response
+        batches = (rows[i:i + sandbox.FETCH_BATCH] for i in range(0, len(rows), sandbox.FETCH_BATCH))
+        return Response(report_lines(response, batches), mimetype="application/x-ndjson")
+
+    if page_size is not None:
+        if page is None:
+            # A cached or engine result is whole; cut the page out of it.
+            page, has_more = rows[offset:offset + page_size], len(rows) > offset + page_size
+        rows = page
+        response["offset"] = offset
+        if has_more and REPORT_MAX_OFFSET and offset + len(rows) > REPORT_MAX_OFFSET:
+            has_more = False
+            response.setdefault("warnings", []).append(
+                f"The result continues past row {offset + len(rows)}, deeper than pages go "
+                f"({REPORT_MAX_OFFSET} rows); stream the query to read all of it."
+            )
+        response["next"] = report_cursors.dumps({
+            "sql": sql, "source": source, "offset": offset + len(rows), "page_size": page_size, "version": version,
+        }) if has_more else None
+    elif REPORT_MAX_ROWS and len(rows) > REPORT_MAX_ROWS:
+        # The engines return whole results; only SQLite stops at the limit.
+        return jsonify({"error": f"Query returned more than {REPORT_MAX_ROWS} rows.", "limit": "rows", "sql": sql}), 422
+    REPORT_ROWS.observe(len(rows))
+    response["rows"] = rows
+    with stage("encode"):
+        return jsonify(response)
+
+
+def report_version():
+    """What cached results and cursors are checked against."""
+    # A snapshot's results only change when it is replaced, not on every write.
+    if report_replica is not None:
+        generation = report_replica.generation()
+        # A list, like the version read back from a cursor.
+        return list(generation) if generation is not None else None
+    return data_version.value
+
+
+def report_engines(db, sql, warnings, max_rows):
+    """``(engine, (columns, rows))`` from the columnar or sharded engine, or ``(None, None)``.
+
+    Runs the plan check unless the columnar engine answers, adding its
+    findings to ``warnings`` or raising QueryLimitError. The shards stop
+    once more than ``max_rows`` rows come back.
+    """
+    result = run_columnar(db, sql) if columnar_engine is not None else None
+    if result is not None:
+        return "columnar", result
+    if REPORT_PLAN_CHECK in ("warn", "reject"):
+        with sql_stage("plan"):
+            scans = sandbox.full_scans(db, sql, REPORT_SCAN_ROWS)
+        for table, approx in scans:
+            message = f"Query scans all of {table} (~{approx} rows)."
+            if REPORT_PLAN_CHECK == "reject":
+                raise sandbox.QueryLimitError("scan", message)
+            warnings.append(message)
+    if report_shards is not None:
+        result = run_sharded(sql, max_rows)
+        if result is not None:
+            return "shards", result
+    return None, None
+
+
+def report_stream_query(sql):
+    """A sandbox.Query for ``sql`` on its own connection; see release_stream_query."""
+    db = acquire_report_db()
+    try:
+        return sandbox.Query(db, sql, REPORT_TIMEOUT, REPORT_MAX_STEPS, timer=sql_stage)
+    except BaseException:
+        release_report_db(db)
+        raise
+
+
+def release_stream_query(query):
+    # Runs when the response is closed, whether or not the client read it all.
+    query.close()
+    release_report_db(query.db)
+
 
-    question = body["question"].strip()
+def report_lines(header, batches, cache_as=None):
+    """A streamed report as NDJSON: ``header``, ``{"rows": [...]}`` per batch, then ``{"done": true, "count": n}``.
 
+    A failure once the header has gone out can only be reported in the
+    body, on a final ``{"error": ...}`` line. With ``cache_as=(sql,
+    version)``, a result of at most REPORT_MAX_ROWS rows is also cached.
+    """
+    yield fastjson.dumps(header) + "\n"
+    count = 0
+    kept = [] if cache_as is not None else None
     try:
-        sql = generate_sql(question)
-    except anthropic.AuthenticationError:
-        return jsonify({"error": "Anthropic API key is missing or invalid. Set the ANTHROPIC_API_KEY environment variable."}), 502
+        for batch in batches:
+            if REPORT_STREAM_MAX_ROWS and count + len(batch) > REPORT_STREAM_MAX_ROWS:
+                raise sandbox.QueryLimitError("rows", f"Query returned more than {REPORT_STREAM_MAX_ROWS} rows.")
+            count += len(batch)
+            if kept is not None:
+                kept.extend(batch)
+                if REPORT_MAX_ROWS and len(kept) > REPORT_MAX_ROWS:
+                    kept = None
+            yield fastjson.dumps({"rows": batch}) + "\n"
+    except sandbox.QueryLimitError as e:
+        yield fastjson.dumps({"error": str(e), "limit": e.limit}) + "\n"
+        return
     except Exception as e:
-        return jsonify({"error": f"Failed to generate SQL: {e}"}), 502
+        yield fastjson.dumps({"error": f"Query failed: {e}"}) + "\n"
+        return
+    finally:
+        REPORT_ROWS.observe(count)
+    if kept is not None:
+        result_cache.put(*cache_as, header["columns"], kept)
+    yield fastjson.dumps({"done": True, "count": count}) + "\n"
 
-    if not sql.upper().lstrip().startswith("SELECT"):
-        return jsonify({"error": "Only SELECT queries are permitted.", "sql": sql}), 400
 
+def run_columnar(db, sql):
+    """``(columns, rows)`` from the columnar engine, or None if it can't answer ``sql``."""
     try:
-        cursor = get_db().execute(sql)
-        columns = [d[0] for d in cursor.description]
-        rows = [list(row) for row in cursor.fetchall()]
-    except Exception as e:
-        return jsonify({"error": f"Query failed: {e}", "sql": sql}), 400
+        with sql_stage("columnar"):
+            return columnar_engine.execute(db, sql)
+    except aggregate.Unsupported:
+        return None
+
+
+def run_sharded(sql, max_rows):
+    """``(columns, rows)`` merged from the shards in parallel, or None if ``sql`` doesn't split."""
+    try:
+        with sql_stage("shards"):
+            return report_shards.execute(sql, max_rows, REPORT_TIMEOUT, REPORT_MAX_STEPS)
+    except aggregate.Unsupported:
+        return None
+
 
-    return jsonify({"columns": columns, "rows": rows, "sql": sql})
+@app.route("/reports/cache", methods=["GET"])
+def reports_cache():
+    return jsonify({
+        "sql": dict(sql_cache.stats(), coalesced=sql_inflight.shared),
+        "results": result_cache.stats(),
+        "columnar": columnar_engine.stats() if columnar_engine is not None else None,
+        "replica": report_replica.stats() if report_replica is not None else None,
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/health", methods=["GET"])
@@ -557,38 +1411,337 @@ def health():
     return jsonify({"status": "ok"})
 
 
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        prefix, _, last_id = raw.partition(":")
+        if prefix != "id":
+            raise ValueError(token)
+        return int(last_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {token!r}")
+
+
+def stream_entries(after_id, limit, fmt):
+    # Checks out its own connection: the response body is produced after the
+    # request's app context (and g.db) has been torn down.
+    with connections.connection(readonly=True) as db:
+        sql = "SELECT name, value FROM entries WHERE id > ? ORDER BY id"
+        params = [after_id]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        cursor = db.execute(sql, params)
+        try:
+            count = 0
+            if fmt == "json":
+                yield '{"data": ['
+            while True:
+                batch = cursor.fetchmany(DATA_STREAM_BATCH)
+                if not batch:
+                    break
+                for name, value in batch:
+                    line = json.dumps({"name": name, "value": value})
+                    if fmt == "ndjson":
+                        yield line + "\n"
+                    else:
+                        yield ("," if count else "") + line
+                    count += 1
+            if fmt == "json":
+                yield f'], "count": {count}}}'
+        finally:
+            # Ends the read before the connection goes back to the pool,
+            # even if the client disconnected mid-stream.
+            cursor.close()
+
+
+def entries_etag(db):
+    # The row count comes from the race rollup (one row per race) rather than
+    # COUNT(*), which would scan the table on every conditional request.
+    max_id, count = db.execute(
+        "SELECT (SELECT id FROM entries ORDER BY id DESC LIMIT 1), (SELECT IFNULL(SUM(n), 0) FROM rollup_race)"
+    ).fetchone()
+    return f"entries-{max_id or 0}-{count}"
+
+
 @app.route("/data", methods=["GET"])
 def get_data():
+    if "after" in request.args and "since_id" in request.args:
+        return jsonify({"error": "Use either 'after' or 'since_id', not both"}), 400
+    try:
+        after_id = decode_cursor(request.args["after"]) if "after" in request.args else 0
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    since_id = request.args.get("since_id")
+    if since_id is not None:
+        if not since_id.isdigit():
+            return jsonify({"error": "'since_id' must be a non-negative integer"}), 400
+        after_id = int(since_id)
+
+    limit = request.args.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= DATA_MAX_PAGE_SIZE:
+            return jsonify({"error": f"'limit' must be an integer between 1 and {DATA_MAX_PAGE_SIZE}"}), 400
+        limit = int(limit)
+
+    stream = request.args.get("stream")
+    if stream is not None:
+        if stream not in ("ndjson", "json"):
+            return jsonify({"error": "'stream' must be 'ndjson' or 'json'"}), 400
+        mimetype = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return Response(stream_with_context(stream_entries(after_id, limit, stream)), mimetype=mimetype)
+
     db = get_db()
-    rows = db.execute("SELECT name, value FROM entries").fetchall()
-    data = [{"name": row["name"], "value": row["value"]} for row in rows]
-    return jsonify({"data": data, "count": len(data)})
+    etag = entries_etag(db)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        page_size = limit or DATA_PAGE_SIZE
+        with sql_stage("sql"):
+            rows = db.execute(
+                "SELECT id, name, value FROM entries WHERE id > ? ORDER BY id LIMIT ?", (after_id, page_size + 1)
+            ).fetchall()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        data = [{"name": row["name"], "value": row["value"]} for row in rows]
+        body = {"data": data, "count": len(data)}
+        if has_more or limit is not None or after_id or since_id is not None:
+            body["next"] = encode_cursor(rows[-1]["id"]) if has_more else None
+            body["last_id"] = rows[-1]["id"] if rows else after_id
+        response = jsonify(body)
+    response.set_etag(etag)
+    # Let browsers keep the body but revalidate it on every use.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+# POST /data either inserts and commits on the request thread ("direct") or
+# hands the record to one writer thread that commits in groups ("group").
+# With group writes, WRITE_DURABILITY picks whether the response waits for
+# the commit (201) or only for the record to be queued (202), and
+# WRITE_COMMIT_TIMEOUT how long it waits before giving up with 503.
+WRITE_MODE = os.environ.get("WRITE_MODE", "direct")
+WRITE_DURABILITY = os.environ.get("WRITE_DURABILITY", "commit")
+WRITE_COMMIT_TIMEOUT = float(os.environ.get("WRITE_COMMIT_TIMEOUT", "30")) or None
+
+WRITE_BATCH_SIZE = metrics.histogram(
+    "write_batch_size", "Records per group commit.", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+
+def committed(count):
+    data_version.bump()
+    WRITE_BATCH_SIZE.observe(count)
+
+
+def insert_sql(shard):
+    return shard_set.insert_sql(shard) if shard_set is not None else "INSERT INTO entries (name, value) VALUES (?, ?)"
+
+
+def shard_for(value):
+    return shard_set.shard_for(value) if shard_set is not None else 0
+
+
+# One writer per shard, so partitioned writes commit to their files in parallel.
+writers = [
+    GroupCommitWriter(
+        connections.connect,
+        insert_sql(shard),
+        max_batch=int(os.environ.get("WRITE_BATCH_MAX", "256")),
+        max_delay=float(os.environ.get("WRITE_BATCH_DELAY_MS", "5")) / 1000,
+        max_queue=int(os.environ.get("WRITE_QUEUE_SIZE", "10000")),
+        on_commit=committed,
+    )
+    for shard in range(shard_set.count if shard_set is not None else 1)
+]
 
 
-@app.route("/data", methods=["POST"])
-def store_data():
-    body = request.get_json(silent=True)
+def close_writers():
+    # Queued writes acknowledged with 202 are committed before the process exits.
+    for writer in writers:
+        writer.close()
+    if shard_set is not None:
+        shard_set.close()
+    if replica_shards is not None:
+        replica_shards.close()
+
+
+atexit.register(close_writers)
 
-    if body is None:
-        return jsonify({"error": "Request body must be valid JSON"}), 400
+
+@metrics.collector
+def writer_metrics():
+    return [
+        ("write_queue_depth", "gauge", "Records waiting for the group-commit writer.",
+         sum(writer.depth() for writer in writers)),
+        ("write_group_commits_total", "counter", "Batches committed by the group-commit writer.",
+         sum(writer.batches for writer in writers)),
+    ]
+
+
+@app.route("/data/search", methods=["GET"])
+def search_data():
+    q = request.args.get("q", "")
+    if search.match_expression(q) is None:
+        return jsonify({"error": "'q' must contain at least one letter or digit"}), 400
+
+    limit = request.args.get("limit", str(SEARCH_PAGE_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= SEARCH_MAX_PAGE_SIZE:
+        return jsonify({"error": f"'limit' must be an integer between 1 and {SEARCH_MAX_PAGE_SIZE}"}), 400
+
+    schemas = shard_set.schemas if shard_set is not None else ["main"]
+    with sql_stage("sql"):
+        rows, match = search.search(get_db(), q, int(limit), schemas=schemas)
+    results = [{"id": row["id"], "name": row["name"], "value": row["value"]} for row in rows]
+    return jsonify({"results": results, "count": len(results), "match": match})
+
+
+def validate_entry(body):
+    if not isinstance(body, dict):
+        raise ValueError("Each record must be a JSON object")
 
     name = body.get("name")
     value = body.get("value")
 
     if name is None or value is None:
-        return jsonify({"error": "Both 'name' and 'value' fields are required"}), 400
+        raise ValueError("Both 'name' and 'value' fields are required")
 
     if not isinstance(name, str) or not name.strip():
-        return jsonify({"error": "'name' must be a non-empty string"}), 400
+        raise ValueError("'name' must be a non-empty string")
 
-    name = name.strip()
-    db = get_db()
-    db.execute("INSERT INTO entries (name, value) VALUES (?, ?)", (name, str(value)))
-    db.commit()
+    return name.strip(), value
+
+
+def stream_export(fmt, batch_size):
+    with connections.connection(readonly=True) as db:
+        yield from export.stream(db, fmt, batch_size)
+
+
+@app.route("/data/export", methods=["GET"])
+def export_data():
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"'format' must be one of {', '.join(export.FORMATS)}"}), 400
+    if not export.available(fmt):
+        return jsonify({"error": f"{fmt} export requires pyarrow, which is not installed"}), 501
+
+    batch_size = request.args.get("batch_size", str(EXPORT_BATCH_SIZE))
+    if not batch_size.isdigit() or not 1 <= int(batch_size) <= DATA_MAX_PAGE_SIZE:
+        return jsonify({"error": f"'batch_size' must be an integer between 1 and {DATA_MAX_PAGE_SIZE}"}), 400
+
+    mimetype, extension, _ = export.FORMATS[fmt]
+    return Response(
+        stream_with_context(stream_export(fmt, int(batch_size))),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=entries.{extension}"},
+    )
+
+
+@app.route("/data", methods=["POST"])
+def store_data():
+    body = request.get_json(silent=True)
+
+    if body is None:
+        return jsonify({"error": "Request body must be valid JSON"}), 400
+
+    try:
+        with stage("validate"):
+            name, value = validate_entry(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    value_text = str(value)
+    shard = shard_for(value_text)
+    if WRITE_MODE == "group":
+        wait = WRITE_DURABILITY == "commit"
+        try:
+            with sql_stage("write_queue"):
+                writers[shard].submit((name, value_text), wait=wait, timeout=WRITE_COMMIT_TIMEOUT)
+        except (QueueFullError, WriteFailedError) as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+        if not wait:
+            return jsonify({"message": "Data accepted", "data": {"name": name, "value": value}}), 202
+    else:
+        db = get_db()
+        with sql_stage("insert"):
+            db.execute(insert_sql(shard), (name, value_text))
+        with sql_stage("commit"):
+            db.commit()
+        data_version.bump()
 
     return jsonify({"message": "Data stored successfully", "data": {"name": name, "value": value}}), 201
 
 
+def iter_ndjson(stream):
+    # Reads the body line by line so the payload is never held in memory.
+    for line in io.BufferedReader(stream):
+        line = line.strip()
+        if line:
+            yield line
+
+
+def iter_ndjson_records(stream):
+    for index, line in enumerate(iter_ndjson(stream)):
+        try:
+            yield index, json.loads(line), None
+        except ValueError:
+            yield index, None, "Line is not valid JSON"
+
+
+@app.route("/data/bulk", methods=["POST"])
+def store_data_bulk():
+    if request.mimetype in NDJSON_MIMETYPES:
+        records = iter_ndjson_records(request.stream)
+    else:
+        body = request.get_json(silent=True)
+        if not isinstance(body, list):
+            return jsonify({"error": "Request body must be a JSON array or NDJSON"}), 400
+        records = ((index, record, None) for index, record in enumerate(body))
+
+    db = get_db()
+    inserted = 0
+    errors = []
+    # Records waiting to be written, per shard.
+    chunks = [[] for _ in writers]
+    pending = 0
+
+    def flush():
+        nonlocal pending
+        for shard, chunk in enumerate(chunks):
+            if chunk:
+                db.executemany(insert_sql(shard), chunk)
+                chunk.clear()
+        db.commit()
+        data_version.bump()
+        pending = 0
+
+    for index, record, error in records:
+        if error is None:
+            try:
+                name, value = validate_entry(record)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            errors.append({"index": index, "error": error})
+            continue
+        value = str(value)
+        chunks[shard_for(value)].append((name, value))
+        inserted += 1
+        pending += 1
+        if pending >= BULK_CHUNK_SIZE:
+            flush()
+    if pending:
+        flush()
+
+    status = 201 if inserted else 400 if errors else 200
+    return jsonify({"inserted": inserted, "errors": errors}), status
+
+
 if __name__ == "__main__":
     init_db()
     app.run(debug=True)
@@ -0,0 +1,64 @@
+"""Responses built once at startup and served pre-compressed with strong ETags.
+
+Each encoding of a body is a different byte sequence, so each gets its own
+ETag: the identity digest, suffixed with the encoding for compressed ones.
+"""
+
+import gzip
+import hashlib
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available.
+    brotli = None
+
+# Versioned assets never change under the same URL.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class Asset:
+    """A fixed response body with its gzip (and, if available, brotli) encodings."""
+
+    def __init__(self, body, mimetype, cache_control):
+        if isinstance(body, str):
+            body = body.encode()
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.etag = self.digest[:32]
+        self.encodings = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(body, quality=11)
+        self.etags = {
+            encoding: self.etag if encoding == "identity" else f"{self.etag}-{encoding}" for encoding in self.encodings
+        }
+
+    def negotiate(self, accept_encodings):
+        best = "identity"
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and accept_encodings[encoding]:
+                if len(self.encodings[encoding]) < len(self.encodings[best]):
+                    best = encoding
+        return best
+
+    def response(self, request):
+        encoding = self.negotiate(request.accept_encodings)
+        etag = self.etags[encoding]
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.encodings[encoding], mimetype=self.mimetype)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = self.cache_control
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def versioned_name(name, asset):
+    """``chart.umd.min.js`` -> ``chart.umd.min.<hash>.js``, for immutable URLs."""
+    stem, dot, ext = name.rpartition(".")
+    return f"{stem}.{asset.digest[:12]}{dot}{ext}"
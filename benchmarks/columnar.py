@@ -0,0 +1,88 @@
+"""Report query timings in SQLite versus the columnar engine.
+
+Builds a database with the app's default schema, loads the columnar
+snapshot, then times each report question both ways and checks the two
+return the same result. Questions the columnar engine cannot decompose are
+listed as falling back.
+
+    python -m benchmarks.columnar --rows 1000000
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import aggregate
+import columnar
+from benchmarks.datagen import create_app_db, parse_size
+from benchmarks.generated_columns import AGE, PLAIN_COLUMNS, QUESTIONS, time_query
+
+EXTRA_QUESTIONS = {
+    "Age range by race": (
+        'SELECT {race} AS "Race", MIN(' + AGE + ') AS "Youngest", MAX(' + AGE + ') AS "Oldest" '
+        "FROM entries WHERE {dob} > '' GROUP BY {race}"
+    ),
+    "Minors vs adults": (
+        "SELECT CASE WHEN " + AGE + " < 18 THEN 'Minor' ELSE 'Adult' END AS \"Group\", COUNT(*) AS \"Count\" "
+        "FROM entries WHERE {dob} > '' GROUP BY \"Group\""
+    ),
+}
+
+
+def time_columnar(engine, db, sql, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = engine.execute(db, sql)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=parse_size, default="1m", help="10k, 100k, 1m or a row count")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if not columnar.available():
+        parser.error("the columnar engine needs numpy")
+
+    questions = {q: sql.format(**PLAIN_COLUMNS) for q, sql in {**QUESTIONS, **EXTRA_QUESTIONS}.items()}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.db")
+        print(f"Generating {args.rows:,} rows...")
+        create_app_db(path, args.rows)
+        db = sqlite3.connect(path)
+        db.execute("ANALYZE")
+
+        engine = columnar.ColumnarEngine()
+        start = time.perf_counter()
+        engine.refresh(db)
+        load_seconds = time.perf_counter() - start
+
+        results = {}
+        for question, sql in questions.items():
+            sqlite_seconds = time_query(db, sql, args.repeat)
+            try:
+                columnar_seconds, result = time_columnar(engine, db, sql, args.repeat)
+            except aggregate.Unsupported as e:
+                results[question] = (sqlite_seconds, None, str(e))
+                continue
+            cursor = db.execute(sql)
+            expected = [d[0] for d in cursor.description], [list(row) for row in cursor]
+            results[question] = (sqlite_seconds, columnar_seconds, "same" if result == expected else "DIFFERENT")
+        db.close()
+
+    print(f"\nSnapshot load: {load_seconds:.2f}s for {engine.snapshot.size:,} rows\n")
+    print(f"{'Question':<34} {'sqlite ms':>10} {'columnar ms':>12} {'speedup':>8}  result")
+    for question, (before, after, note) in results.items():
+        if after is None:
+            print(f"{question:<34} {before * 1000:>10.1f} {'-':>12} {'-':>8}  falls back: {note}")
+        else:
+            print(f"{question:<34} {before * 1000:>10.1f} {after * 1000:>12.1f} {before / after:>7.1f}x  {note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""On-disk size and scan timings of the default and compact storage layouts.
+
+Builds a database with the app's default schema, measures it, converts a
+copy with compact.convert() and measures that. Both files are VACUUMed
+first so sizes compare like for like. Report questions use the same SQL
+against the ``entries`` columns on both layouts.
+
+    python -m benchmarks.compact_storage --rows 1000000
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import compact
+from app import migrate_db
+from benchmarks.datagen import create_app_db, parse_size
+from benchmarks.generated_columns import PLAIN_COLUMNS, QUESTIONS, time_query
+
+SCANS = {
+    "GET /data scan (id, name, value)": "SELECT id, name, value FROM entries",
+    "Export scan (typed columns)": "SELECT id, name, dob, zip, race, ethnicity FROM entries",
+}
+
+
+def sizes(path):
+    db = sqlite3.connect(path)
+    try:
+        rows = db.execute(
+            "SELECT SUM(pgsize) FILTER (WHERE name IN ('entries', ?)), SUM(pgsize) FROM dbstat", (compact.TABLE,)
+        ).fetchone()
+    finally:
+        db.close()
+    return rows[0], rows[1], os.path.getsize(path)
+
+
+def measure(path, repeat):
+    db = sqlite3.connect(path)
+    try:
+        db.execute("ANALYZE")
+        queries = dict(SCANS)
+        queries.update({q: sql.format(**PLAIN_COLUMNS) for q, sql in QUESTIONS.items()})
+        return {name: time_query(db, sql, repeat) for name, sql in queries.items()}
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=parse_size, default="1m", help="10k, 100k, 1m or a row count")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        default_path = os.path.join(tmp, "default.db")
+        compact_path = os.path.join(tmp, "compact.db")
+        print(f"Generating {args.rows:,} rows...")
+        create_app_db(default_path, args.rows)
+        db = sqlite3.connect(default_path)
+        db.execute("VACUUM")
+        db.close()
+        shutil.copy(default_path, compact_path)
+
+        db = sqlite3.connect(compact_path)
+        start = time.perf_counter()
+        compact.convert(db)
+        migrate_db(db)
+        db.commit()
+        convert_seconds = time.perf_counter() - start
+        db.execute("VACUUM")
+        db.close()
+
+        before_sizes, after_sizes = sizes(default_path), sizes(compact_path)
+        before, after = measure(default_path, args.repeat), measure(compact_path, args.repeat)
+
+    print(f"\ncompact.convert(): {convert_seconds:.2f}s\n")
+    print(f"{'Size (MiB)':<34} {'default':>10} {'compact':>10} {'ratio':>8}")
+    for label, b, a in zip(("Entry table", "Database (dbstat)", "File"), before_sizes, after_sizes):
+        print(f"{label:<34} {b / 2**20:>10.1f} {a / 2**20:>10.1f} {b / a:>7.1f}x")
+    print(f"\n{'Query':<34} {'default ms':>10} {'compact ms':>10} {'speedup':>8}")
+    for name in before:
+        print(f"{name:<34} {before[name] * 1000:>10.1f} {after[name] * 1000:>10.1f} {before[name] / after[name]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Mixed read/write throughput: per-request connections vs. the pooled WAL manager.
+
+"before" opens a fresh connection for every operation on a rollback-journal
+database, as get_db() originally did. "after" uses db.ConnectionManager with
+the app's default pragmas and a read-only pool for the readers.
+
+    python -m benchmarks.concurrency --rows 100000 --readers 8 --writers 2
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from app import migrate_db
+from benchmarks.datagen import create_legacy_db, generate_entries
+from db import ConnectionManager
+
+READ_SQL = 'SELECT race AS "Race", COUNT(*) AS "Count" FROM entries GROUP BY race'
+POINT_SQL = "SELECT name, value FROM entries WHERE id > ? ORDER BY id LIMIT 50"
+WRITE_SQL = "INSERT INTO entries (name, value) VALUES (?, ?)"
+
+
+class Before:
+    def __init__(self, path):
+        self.path = path
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode = DELETE")
+        db.close()
+
+    def read(self, sql, params=()):
+        db = sqlite3.connect(self.path)
+        try:
+            db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def write(self, row):
+        db = sqlite3.connect(self.path)
+        try:
+            db.execute(WRITE_SQL, row)
+            db.commit()
+        finally:
+            db.close()
+
+
+class After:
+    def __init__(self, path):
+        self.manager = ConnectionManager(path, pool_size=32)
+        self.manager.connect().close()
+
+    def read(self, sql, params=()):
+        with self.manager.connection(readonly=True) as db:
+            db.execute(sql, params).fetchall()
+
+    def write(self, row):
+        with self.manager.connection() as db:
+            db.execute(WRITE_SQL, row)
+            db.commit()
+
+
+def run(target, readers, writers, duration, rows):
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def reader(n):
+        i = n
+        while time.perf_counter() < deadline:
+            try:
+                # Mostly cheap page reads with the occasional report scan.
+                if i % 20 == 0:
+                    target.read(READ_SQL)
+                else:
+                    target.read(POINT_SQL, ((i * 7919) % rows,))
+                key = "reads"
+            except sqlite3.OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+            i += 1
+
+    def writer(n):
+        for row in generate_entries(10**9, seed=n + 1):
+            if time.perf_counter() >= deadline:
+                break
+            try:
+                target.write(row)
+                key = "writes"
+            except sqlite3.OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {k: v / duration for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_path = os.path.join(tmp, "seed.db")
+        db = create_legacy_db(seed_path, args.rows)
+        migrate_db(db)
+        db.commit()
+        db.close()
+
+        results = {}
+        for label, cls in (("before", Before), ("after", After)):
+            path = os.path.join(tmp, f"{label}.db")
+            shutil.copy(seed_path, path)
+            results[label] = run(cls(path), args.readers, args.writers, args.duration, args.rows)
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.duration:g}s, {args.rows:,} rows\n")
+    print(f"{'':8} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for label, r in results.items():
+        print(f"{label:8} {r['reads']:>10.0f} {r['writes']:>10.0f} {r['errors']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Synthetic demographic entries shaped like the ones the data entry page posts."""
+
+import json
+import random
+import sqlite3
+from datetime import date, timedelta
+
+RACES = [
+    ("White", 58),
+    ("Black or African American", 13),
+    ("Asian", 6),
+    ("American Indian or Alaska Native", 1),
+    ("Native Hawaiian or Other Pacific Islander", 1),
+    ("Two or more races", 10),
+    ("Prefer not to say", 3),
+    ("", 8),
+]
+ETHNICITIES = [
+    ("Not Hispanic or Latino", 75),
+    ("Hispanic or Latino", 19),
+    ("Prefer not to say", 3),
+    ("", 3),
+]
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Carlos", "Maria", "Wei", "Mei", "Aarav", "Priya", "Kwame",
+    "Amara", "Hiroshi", "Yuki", "Liam", "Olivia", "Noah", "Emma", "Ava", "Sofia",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Nguyen", "Kim", "Chen",
+    "Patel", "Okafor", "Tanaka", "Silva", "Cohen", "Murphy",
+]
+
+EPOCH = date(1930, 1, 1)
+DOB_SPAN_DAYS = (date(2012, 12, 31) - EPOCH).days
+
+
+def _weighted(pairs):
+    values, weights = zip(*pairs)
+    return list(values), list(weights)
+
+
+def generate_entries(count, seed=0, zip_pool=3000):
+    """Yield ``(name, value)`` tuples, ``value`` being the page's JSON encoding."""
+    rng = random.Random(seed)
+    races, race_weights = _weighted(RACES)
+    ethnicities, ethnicity_weights = _weighted(ETHNICITIES)
+    zips = [f"{rng.randrange(501, 99950):05d}" for _ in range(zip_pool)]
+    for _ in range(count):
+        dob = (EPOCH + timedelta(days=rng.randrange(DOB_SPAN_DAYS))).isoformat()
+        value = json.dumps(
+            {
+                "dob": dob,
+                # Skew towards a smaller set of zips so top-N is meaningful.
+                "zip": zips[min(int(rng.paretovariate(1.2)) - 1, zip_pool - 1)],
+                "race": rng.choices(races, race_weights)[0],
+                "ethnicity": rng.choices(ethnicities, ethnicity_weights)[0],
+            },
+            separators=(",", ":"),
+        )
+        yield f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", value
+
+
+def fill(db, count, seed=0, batch=10000):
+    """Append ``count`` generated entries to an open connection's ``entries`` table."""
+    rows = generate_entries(count, seed)
+    while True:
+        chunk = [row for _, row in zip(range(batch), rows)]
+        if not chunk:
+            break
+        db.executemany("INSERT INTO entries (name, value) VALUES (?, ?)", chunk)
+    db.commit()
+
+
+def create_legacy_db(path, count, seed=0):
+    """Build a database with the original, pre-migration ``entries`` schema."""
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, value TEXT NOT NULL)"
+    )
+    fill(db, count, seed)
+    return db
+
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def parse_size(text):
+    """Accept a preset name (10k, 100k, 1m) or a plain row count."""
+    return SIZES.get(text.lower()) or int(text.replace("_", "").replace(",", ""))
+
+
+def create_app_db(path, count, seed=0):
+    """Build a database with the app's current schema holding ``count`` entries."""
+    from app import migrate_db
+
+    db = create_legacy_db(path, 0)
+    migrate_db(db)
+    db.commit()
+    fill(db, count, seed)
+    db.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="database file to create or append to")
+    parser.add_argument("--rows", type=parse_size, default="100k", help="10k, 100k, 1m or a row count")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    create_app_db(args.path, args.rows, args.seed)
+    print(f"Wrote {args.rows:,} entries to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
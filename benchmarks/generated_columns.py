@@ -0,0 +1,96 @@
+"""Before/after timings for the REPORTS_PAGE example questions.
+
+"Before" is the original schema with SQL written against json_extract();
+"after" is the same database migrated by app.migrate_db() with SQL written
+against the indexed generated columns.
+
+    python -m benchmarks.generated_columns --rows 1000000
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app import migrate_db
+from benchmarks.datagen import create_legacy_db
+
+AGE = (
+    "(strftime('%Y','now') - strftime('%Y', {dob}))"
+    " - (strftime('%m-%d','now') < strftime('%m-%d', {dob}))"
+)
+
+# The six example chips, phrased the way the model answers them.
+QUESTIONS = {
+    "How many people by race?": (
+        'SELECT {race} AS "Race", COUNT(*) AS "Count" FROM entries GROUP BY {race} ORDER BY "Count" DESC'
+    ),
+    "Average age by ethnicity": (
+        'SELECT {ethnicity} AS "Ethnicity", ROUND(AVG(' + AGE + '), 1) AS "Avg Age" '
+        "FROM entries WHERE {dob} > '' GROUP BY {ethnicity}"
+    ),
+    "Top 10 most common zip codes": (
+        'SELECT {zip} AS "Zip Code", COUNT(*) AS "Count" FROM entries '
+        "WHERE {zip} > '' GROUP BY {zip} ORDER BY \"Count\" DESC LIMIT 10"
+    ),
+    "Count by race and ethnicity": (
+        'SELECT {race} AS "Race", {ethnicity} AS "Ethnicity", COUNT(*) AS "Count" '
+        "FROM entries GROUP BY {race}, {ethnicity}"
+    ),
+    "How many people born each year?": (
+        'SELECT {year} AS "Year", COUNT(*) AS "Count" FROM entries '
+        "WHERE {dob} > '' GROUP BY \"Year\" ORDER BY \"Year\""
+    ),
+    "Youngest and oldest person": (
+        'SELECT name AS "Name", {dob} AS "Date of Birth" FROM entries '
+        "WHERE {dob} = (SELECT MAX({dob}) FROM entries WHERE {dob} > '') "
+        "OR {dob} = (SELECT MIN({dob}) FROM entries WHERE {dob} > '')"
+    ),
+}
+
+JSON_COLUMNS = {f: f"json_extract(value, '$.{f}')" for f in ("dob", "zip", "race", "ethnicity")}
+JSON_COLUMNS["year"] = "strftime('%Y', json_extract(value, '$.dob'))"
+PLAIN_COLUMNS = {f: f for f in JSON_COLUMNS}
+PLAIN_COLUMNS["year"] = "substr(dob, 1, 4)"
+
+
+def time_query(db, sql, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.execute(sql).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        print(f"Generating {args.rows:,} rows...")
+        db = create_legacy_db(path, args.rows)
+
+        before = {q: time_query(db, sql.format(**JSON_COLUMNS), args.repeat) for q, sql in QUESTIONS.items()}
+
+        start = time.perf_counter()
+        migrate_db(db)
+        db.commit()
+        migrate_seconds = time.perf_counter() - start
+        db.execute("ANALYZE")
+
+        after = {q: time_query(db, sql.format(**PLAIN_COLUMNS), args.repeat) for q, sql in QUESTIONS.items()}
+        db.close()
+
+    print(f"\nmigrate_db(): {migrate_seconds:.2f}s\n")
+    print(f"{'Question':<34} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for q in QUESTIONS:
+        print(f"{q:<34} {before[q] * 1000:>10.1f} {after[q] * 1000:>10.1f} {before[q] / after[q]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Concurrent load driver reporting throughput and latency percentiles per endpoint.
+
+By default each ``--rows`` size gets a freshly generated database served by
+``benchmarks.serve`` in a subprocess, with the model stubbed. ``--url``
+targets an already running server instead.
+
+Throughput and latency count successful responses only. Failures are
+reported per status (and per question for reports), and the run exits with
+status 1 if any endpoint fails more than ``--max-error-rate`` of its
+requests, so a broken endpoint cannot pass as a fast one.
+
+    python -m benchmarks.load --rows 10k 100k --concurrency 16 --out run.json
+    python -m benchmarks.load --rows 100k --out new.json --compare run.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from benchmarks.datagen import create_app_db, generate_entries, parse_size
+
+QUESTIONS = [
+    "How many people by race?",
+    "Average age by ethnicity",
+    "Top 10 most common zip codes",
+    "Count by race and ethnicity",
+    "How many people born each year?",
+    "Youngest and oldest person",
+]
+
+
+class Client:
+    """Per-thread request state: a seeded RNG and an endless supply of entries."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self._entries = generate_entries(10**12, seed=seed)
+
+    def entry(self):
+        name, value = next(self._entries)
+        return {"name": name, "value": value}
+
+
+# name -> callable(client) returning (method, path, json body or None)
+ENDPOINTS = {
+    "GET /": lambda c: ("GET", "/", None),
+    "GET /reports": lambda c: ("GET", "/reports", None),
+    "GET /data": lambda c: ("GET", "/data", None),
+    "POST /data": lambda c: ("POST", "/data", c.entry()),
+    "POST /reports/query": lambda c: (
+        "POST", "/reports/query", {"question": c.rng.choice(QUESTIONS), "cache": False}
+    ),
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def drive(base_url, name, concurrency, duration, seed=0):
+    """Hit one endpoint from ``concurrency`` keep-alive clients for ``duration`` seconds."""
+    url = urlsplit(base_url)
+    make_request = ENDPOINTS[name]
+    latencies = []
+    statuses = {}
+    failures = {}
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(n):
+        nonlocal errors
+        client = Client(seed * 1000 + n)
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+        local, local_status, local_failures, local_errors = [], {}, {}, 0
+        while time.perf_counter() < deadline:
+            method, path, body = make_request(client)
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            data = json.dumps(body).encode() if body is not None else None
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                local_errors += 1
+                failure = type(e).__name__
+                local_failures[failure] = local_failures.get(failure, 0) + 1
+                conn.close()
+                continue
+            local_status[response.status] = local_status.get(response.status, 0) + 1
+            if response.status < 400:
+                local.append(time.perf_counter() - start)
+            else:
+                local_errors += 1
+                failure = f"{response.status} {body['question']}" if body and "question" in body else str(response.status)
+                local_failures[failure] = local_failures.get(failure, 0) + 1
+            if response.will_close:
+                conn.close()
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+            for code, count in local_status.items():
+                statuses[code] = statuses.get(code, 0) + count
+            for failure, count in local_failures.items():
+                failures[failure] = failures.get(failure, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "error_rate": errors / (len(latencies) + errors) if latencies or errors else 0.0,
+        "throughput_rps": len(latencies) / elapsed,
+        "latency_ms": {
+            "mean": sum(ms) / len(ms) if ms else None,
+            "p50": percentile(ms, 50),
+            "p95": percentile(ms, 95),
+            "p99": percentile(ms, 99),
+            "max": ms[-1] if ms else None,
+        },
+        "status": {str(code): count for code, count in sorted(statuses.items())},
+        "failures": dict(sorted(failures.items())),
+    }
+
+
+def start_server(db_path, llm_delay, env=None):
+    """Start ``benchmarks.serve``; ``env`` adds app settings to the inherited environment."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve", "--db", db_path, "--llm-delay", str(llm_delay)],
+        stdout=subprocess.PIPE,
+        text=True,
+        env={**os.environ, **(env or {})},
+    )
+    line = proc.stdout.readline()
+    if not line.startswith("READY "):
+        proc.kill()
+        raise RuntimeError(f"benchmark server failed to start: {line!r}")
+    return proc, f"http://127.0.0.1:{int(line.split()[1])}"
+
+
+def run_endpoints(base_url, endpoints, args):
+    results = {}
+    for name in endpoints:
+        results[name] = drive(base_url, name, args.concurrency, args.duration, args.seed)
+        print_result(name, results[name])
+    return results
+
+
+def print_result(name, r):
+    lat = r["latency_ms"]
+    fmt = lambda v: f"{v:9.1f}" if v is not None else f"{'-':>9}"
+    print(
+        f"  {name:<22} {r['throughput_rps']:9.1f} rps  p50 {fmt(lat['p50'])}  p95 {fmt(lat['p95'])}"
+        f"  p99 {fmt(lat['p99'])} ms  errors {r['errors']}"
+    )
+    for failure, count in r["failures"].items():
+        print(f"    {count:>7} x {failure}")
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "llm_delay": args.llm_delay,
+    }
+
+
+def compare(baseline, current):
+    """Print per-endpoint changes in throughput and p50/p99 between two result files."""
+    base_runs = {run["label"]: run for run in baseline["runs"]}
+    for run in current["runs"]:
+        base = base_runs.get(run["label"])
+        if base is None:
+            continue
+        print(f"\n{run['label']} vs baseline {baseline['meta'].get('commit') or ''}")
+        for name, r in run["endpoints"].items():
+            b = base["endpoints"].get(name)
+            if b is None:
+                continue
+            change = lambda new, old: f"{(new - old) / old * 100:+6.1f}%" if old else "    n/a"
+            print(
+                f"  {name:<22} rps {change(r['throughput_rps'], b['throughput_rps'])}"
+                f"  p50 {change(r['latency_ms']['p50'] or 0, b['latency_ms']['p50'] or 0)}"
+                f"  p99 {change(r['latency_ms']['p99'] or 0, b['latency_ms']['p99'] or 0)}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", nargs="+", type=parse_size, default=[10_000], help="10k, 100k, 1m or row counts")
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="simulated model latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument(
+        "--max-error-rate", type=float, default=0.0, help="fail the run if an endpoint's error rate exceeds this"
+    )
+    args = parser.parse_args()
+
+    report = {"meta": metadata(args), "runs": []}
+    if args.url:
+        print(f"{args.url}")
+        report["runs"].append({"label": args.url, "endpoints": run_endpoints(args.url, args.endpoints, args)})
+    else:
+        for rows in args.rows:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "bench.db")
+                print(f"{rows:,} rows")
+                create_app_db(path, rows, args.seed)
+                proc, base_url = start_server(path, args.llm_delay)
+                try:
+                    endpoints = run_endpoints(base_url, args.endpoints, args)
+                finally:
+                    proc.terminate()
+                    proc.wait()
+            report["runs"].append({"label": f"{rows} rows", "rows": rows, "endpoints": endpoints})
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+    failed = [
+        f"{run['label']}: {name} ({r['error_rate']:.1%} errors)"
+        for run in report["runs"] for name, r in run["endpoints"].items() if r["error_rate"] > args.max_error_rate
+    ]
+    if failed:
+        print(f"\nEndpoints over the {args.max_error_rate:.1%} error rate; their timings cover successes only:")
+        for line in failed:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Answers ``POST /v1/messages`` with canned SQL so the app can run and be
+load-tested offline. Point the app at it with ANTHROPIC_BASE_URL:
+
+    python -m benchmarks.messages_stub --port 8123 --delay 0.4
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8123 ANTHROPIC_API_KEY=stub python app.py
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sql_cache import normalize_question
+
+ANSWERS = {
+    "how many people by race": 'SELECT race AS "Race", COUNT(*) AS "Count" FROM entries GROUP BY race ORDER BY "Count" DESC',
+    "average age by ethnicity": (
+        'SELECT ethnicity AS "Ethnicity", ROUND(AVG((strftime(\'%Y\',\'now\') - strftime(\'%Y\', dob)) '
+        "- (strftime('%m-%d','now') < strftime('%m-%d', dob))), 1) AS \"Avg Age\" "
+        "FROM entries WHERE dob > '' GROUP BY ethnicity"
+    ),
+    "top 10 most common zip codes": (
+        'SELECT zip AS "Zip Code", COUNT(*) AS "Count" FROM entries WHERE zip > \'\' '
+        'GROUP BY zip ORDER BY "Count" DESC LIMIT 10'
+    ),
+    "count by race and ethnicity": (
+        'SELECT race AS "Race", ethnicity AS "Ethnicity", COUNT(*) AS "Count" FROM entries GROUP BY race, ethnicity'
+    ),
+    "how many people born each year": (
+        'SELECT substr(dob, 1, 4) AS "Year", COUNT(*) AS "Count" FROM entries WHERE dob > \'\' '
+        'GROUP BY "Year" ORDER BY "Year"'
+    ),
+    "youngest and oldest person": (
+        'SELECT name AS "Name", dob AS "Date of Birth" FROM entries '
+        "WHERE dob = (SELECT MAX(dob) FROM entries WHERE dob > '') "
+        "OR dob = (SELECT MIN(dob) FROM entries WHERE dob > '')"
+    ),
+}
+DEFAULT_ANSWER = 'SELECT COUNT(*) AS "Count" FROM entries'
+
+
+def answer(question):
+    return ANSWERS.get(normalize_question(question), DEFAULT_ANSWER)
+
+
+def message(model, text):
+    return {
+        "id": f"msg_stub_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        # The app's schema prompt is below the minimum cacheable length, so
+        # the real API reports no cache activity for it either.
+        "usage": {"input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+    }
+
+
+class MessagesStub(ThreadingHTTPServer):
+    """Threaded HTTP server recording every request body it receives."""
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), delay=0.0, responder=answer):
+        super().__init__(address, _Handler)
+        self.delay = delay
+        self.responder = responder
+        self.requests = []
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.server._lock:
+            self.server.requests.append(body)
+        if self.path.split("?")[0] != "/v1/messages":
+            return self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        question = body["messages"][-1]["content"]
+        if isinstance(question, list):
+            question = " ".join(block.get("text", "") for block in question)
+        self._send(200, message(body.get("model", "stub"), self.server.responder(question)))
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+    server = MessagesStub((args.host, args.port), delay=args.delay)
+    print(f"Messages API stub on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
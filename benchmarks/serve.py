@@ -0,0 +1,40 @@
+"""Serve the app on a given database with the model stubbed out, for load tests.
+
+Prints ``READY <port>`` once listening.
+
+    python -m benchmarks.serve --db /tmp/bench.db --llm-delay 0.3
+"""
+
+import argparse
+import logging
+import os
+import signal
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="simulated model latency in seconds")
+    args = parser.parse_args()
+
+    # app reads its settings at import time.
+    os.environ["DATABASE_PATH"] = args.db
+    import app
+    from benchmarks import stub
+    from werkzeug.serving import make_server
+
+    app.init_db()
+    stub.install(app, args.llm_delay)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server(args.host, args.port, app.app, threaded=True)
+    # Exit normally on terminate() so atexit handlers flush queued writes.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"READY {server.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
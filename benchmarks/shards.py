@@ -0,0 +1,113 @@
+"""Report query timings on one database file versus partitioned shards.
+
+Builds a database with the app's default schema, splits a copy of its
+entries across ``--shards`` files the way SHARD_KEY=id does, then times each
+report question on the single file and fanned out over the shards in a
+process pool, checking both return the same result. Questions the fan-out
+cannot merge are listed as falling back. The speedup is bounded by the
+number of CPU cores.
+
+    python -m benchmarks.shards --rows 1m --shards 4
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import aggregate
+import shards
+from benchmarks.columnar import EXTRA_QUESTIONS
+from benchmarks.datagen import create_app_db, parse_size
+from benchmarks.generated_columns import PLAIN_COLUMNS, QUESTIONS, time_query
+
+
+def split(path, paths):
+    """Copy the entries of ``path`` into ``paths``, entry ``id`` going to shard ``(id - 1) % n``."""
+    for i, shard_path in enumerate(paths):
+        create_app_db(shard_path, 0)
+        db = sqlite3.connect(shard_path)
+        db.execute("ATTACH ? AS source", (path,))
+        db.execute(
+            "INSERT INTO entries (id, name, value) SELECT id, name, value FROM source.entries "
+            f"WHERE (id - 1) % {len(paths)} = {i}"
+        )
+        db.commit()
+        db.execute("ANALYZE")
+        db.close()
+
+
+def time_shards(shard_set, sql, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = shard_set.execute(sql, 0, 0, 0)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def same(result, expected):
+    # Merged averages add the shards' partial sums in a different order.
+    if result[0] != expected[0] or len(result[1]) != len(expected[1]):
+        return False
+    for row, expected_row in zip(result[1], expected[1]):
+        for value, expected_value in zip(row, expected_row):
+            if isinstance(value, float) and isinstance(expected_value, float):
+                if not math.isclose(value, expected_value, rel_tol=1e-9):
+                    return False
+            elif value != expected_value:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=parse_size, default="1m", help="10k, 100k, 1m or a row count")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=None, help="pool size (default: shards, up to CPU count)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    questions = {q: sql.format(**PLAIN_COLUMNS) for q, sql in {**QUESTIONS, **EXTRA_QUESTIONS}.items()}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.db")
+        print(f"Generating {args.rows:,} rows...")
+        create_app_db(path, args.rows)
+        db = sqlite3.connect(path)
+        db.execute("ANALYZE")
+        paths = shards.paths(path, args.shards)
+        print(f"Splitting into {args.shards} shards...")
+        split(path, paths)
+
+        shard_set = shards.ShardSet(paths, processes=args.processes)
+        # Start the pool's processes before timing anything.
+        shard_set.execute("SELECT COUNT(*) FROM entries", 0, 0, 0)
+
+        results = {}
+        for question, sql in questions.items():
+            single_seconds = time_query(db, sql, args.repeat)
+            try:
+                shard_seconds, result = time_shards(shard_set, sql, args.repeat)
+            except aggregate.Unsupported as e:
+                results[question] = (single_seconds, None, str(e))
+                continue
+            cursor = db.execute(sql)
+            expected = [d[0] for d in cursor.description], [list(row) for row in cursor]
+            results[question] = (single_seconds, shard_seconds, "same" if same(result, expected) else "DIFFERENT")
+        shard_set.close()
+        db.close()
+
+    print(f"\n{args.shards} shards, {shard_set.processes} processes, {os.cpu_count()} CPUs\n")
+    print(f"{'Question':<34} {'1 file ms':>10} {'shards ms':>10} {'speedup':>8}  result")
+    for question, (before, after, note) in results.items():
+        if after is None:
+            print(f"{question:<34} {before * 1000:>10.1f} {'-':>10} {'-':>8}  falls back: {note}")
+        else:
+            print(f"{question:<34} {before * 1000:>10.1f} {after * 1000:>10.1f} {before / after:>7.1f}x  {note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""In-process stand-in for ``anthropic.Anthropic`` so reports run without network access."""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from benchmarks.messages_stub import answer
+
+
+class StubAnthropic:
+    """Implements the ``messages.create`` call generate_sql() makes.
+
+    ``delay`` simulates model latency; ``calls`` counts requests that would
+    have gone to the API.
+    """
+
+    def __init__(self, delay=0.0, responder=answer):
+        self.delay = delay
+        self.responder = responder
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, *, model, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        text = self.responder(messages[-1]["content"])
+        # Like messages_stub: the fields the app reads, nothing cached.
+        usage = SimpleNamespace(
+            input_tokens=0, output_tokens=0, cache_creation_input_tokens=0, cache_read_input_tokens=0
+        )
+        return SimpleNamespace(model=model, content=[SimpleNamespace(type="text", text=text)], usage=usage)
+
+
+def install(app_module, delay=0.0):
+    """Route ``app_module``'s model calls to a new StubAnthropic and return it."""
+    stub = StubAnthropic(delay)
+    app_module.llm.set_client(stub)
+    return stub
@@ -0,0 +1,60 @@
+"""POST /data throughput: direct commits versus the group-commit writer.
+
+Each configuration gets a fresh database served by ``benchmarks.serve`` and
+is driven by ``--concurrency`` keep-alive clients posting entries. After the
+server exits the stored rows are counted, so records acknowledged on enqueue
+but never committed would show up as lost.
+
+    python -m benchmarks.writes --concurrency 16 --duration 10 --synchronous NORMAL FULL
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+
+from benchmarks.datagen import create_app_db
+from benchmarks.load import drive, start_server
+
+MODES = {
+    "direct": {"WRITE_MODE": "direct"},
+    "group, ack on commit": {"WRITE_MODE": "group", "WRITE_DURABILITY": "commit"},
+    "group, ack on enqueue": {"WRITE_MODE": "group", "WRITE_DURABILITY": "enqueue"},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rows", type=int, default=10_000, help="entries in the database before the run")
+    parser.add_argument("--synchronous", nargs="+", default=["NORMAL", "FULL"], help="DB_SYNCHRONOUS values to try")
+    parser.add_argument("--batch-delay-ms", default="5", help="WRITE_BATCH_DELAY_MS for the group modes")
+    args = parser.parse_args()
+
+    print(f"{'synchronous':<12} {'mode':<22} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'acked':>7} {'stored':>7}")
+    for synchronous in args.synchronous:
+        for mode, env in MODES.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "bench.db")
+                create_app_db(path, args.rows)
+                env = dict(env, DB_SYNCHRONOUS=synchronous, WRITE_BATCH_DELAY_MS=args.batch_delay_ms)
+                proc, base_url = start_server(path, 0.0, env)
+                try:
+                    r = drive(base_url, "POST /data", args.concurrency, args.duration)
+                finally:
+                    proc.terminate()
+                    proc.wait()
+                db = sqlite3.connect(path)
+                stored = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - args.rows
+                db.close()
+            acked = sum(n for code, n in r["status"].items() if code in ("201", "202"))
+            lat = r["latency_ms"]
+            print(
+                f"{synchronous:<12} {mode:<22} {r['throughput_rps']:9.1f} {lat['p50']:8.2f} {lat['p99']:8.2f}"
+                f" {acked:7d} {stored:7d}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""In-memory columnar snapshot of ``entries`` with a vectorized aggregate executor.
+
+The snapshot holds one NumPy array per demographic column: dob as
+``datetime64[D]`` and zip, race and ethnicity as integer codes into
+append-only dictionaries. ``refresh()`` appends the entries with ids above
+the last one loaded, and reloads from scratch if entries were deleted.
+
+``execute()`` answers the aggregate queries aggregate.py can decompose.
+Scalar expressions of one column are evaluated by SQLite once per distinct
+value (a few thousand zips or dates rather than every row) and mapped back
+onto the rows by code. Filtering, grouping and the aggregates themselves
+are NumPy operations. The select list, HAVING, ORDER BY and LIMIT then run
+in SQLite over the per-group results, so output names, types and ordering
+rules are SQLite's own.
+"""
+
+import datetime
+import json
+import re
+import sqlite3
+import threading
+
+import aggregate
+
+try:
+    import numpy as np
+except ImportError:  # The columnar engine is optional.
+    np = None
+
+CATEGORIES = ("zip", "race", "ethnicity")
+COLUMNS = ("dob",) + CATEGORIES
+
+# The row count kept by the rollup triggers (rollups.py) is a cheap way to
+# notice deleted entries.
+STATE_SQL = "SELECT (SELECT id FROM entries ORDER BY id DESC LIMIT 1), (SELECT SUM(n) FROM rollup_race)"
+LOAD_SQL = f"SELECT id, {', '.join(COLUMNS)} FROM entries WHERE id > ? AND id <= ? ORDER BY id"
+
+# Group keys spanning at most this many combinations are counted densely.
+DENSE_GROUPS = 1 << 22
+
+# Expressions whose value can change within a day are evaluated on every
+# query; the rest are cached per UTC day.
+_VOLATILE = re.compile(r"(?i:random|current_time|julianday)|%[HMSsfJ]")
+
+_EPOCH = datetime.date(1970, 1, 1)
+_NAT = np.iinfo(np.int64).min if np is not None else None
+
+
+def available():
+    return np is not None
+
+
+class _Buffer:
+    """Growable 1-D array; slices taken earlier keep the rows they saw."""
+
+    def __init__(self, dtype):
+        self.data = np.empty(1024, dtype)
+        self.size = 0
+
+    def extend(self, values):
+        end = self.size + len(values)
+        if end > len(self.data):
+            grown = np.empty(max(end, 2 * len(self.data)), self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = values
+        self.size = end
+
+    def view(self, size):
+        return self.data[:size]
+
+
+class _Dictionary:
+    """Append-only mapping between values and int32 codes."""
+
+    def __init__(self):
+        self.labels = []
+        self._codes = {}
+
+    def encode(self, values):
+        codes = self._codes
+        for value in set(values).difference(codes):
+            codes[value] = len(self.labels)
+            self.labels.append(value)
+        return np.fromiter(map(codes.__getitem__, values), np.int32, len(values))
+
+
+def _parse_day(value):
+    """Days since 1970-01-01 for a ``YYYY-MM-DD`` string, else None."""
+    if not (isinstance(value, str) and len(value) == 10 and value[4] == value[7] == "-"
+            and (value[:4] + value[5:7] + value[8:]).isdigit()):
+        return None
+    try:
+        return (datetime.date.fromisoformat(value) - _EPOCH).days
+    except ValueError:
+        return None
+
+
+class Snapshot:
+    """The demographic columns of ``entries`` as arrays, in id order."""
+
+    def __init__(self):
+        self.last_id = 0
+        self.ids = _Buffer(np.int64)
+        self.dob = _Buffer("datetime64[D]")
+        # 0 where dob is a date, otherwise 1 + the value's code in
+        # ``other_dob`` (NULL, blank and malformed values).
+        self.dob_other = _Buffer(np.int32)
+        self.other_dob = _Dictionary()
+        self.first_day = self.last_day = None
+        self.codes = {column: _Buffer(np.int32) for column in CATEGORIES}
+        self.dictionaries = {column: _Dictionary() for column in CATEGORIES}
+        self._days = {}
+
+    @property
+    def size(self):
+        return self.ids.size
+
+    def append(self, rows):
+        ids, dobs, *categories = zip(*rows)
+        for value in set(dobs).difference(self._days):
+            day = _parse_day(value)
+            self._days[value] = _NAT if day is None else day
+        days = np.fromiter(map(self._days.__getitem__, dobs), np.int64, len(dobs))
+        dates = days != _NAT
+        other = np.zeros(len(dobs), np.int32)
+        if not dates.all():
+            missing = np.flatnonzero(~dates)
+            other[missing] = 1 + self.other_dob.encode([dobs[i] for i in missing.tolist()])
+        if dates.any():
+            low, high = int(days[dates].min()), int(days[dates].max())
+            self.first_day = low if self.first_day is None else min(self.first_day, low)
+            self.last_day = high if self.last_day is None else max(self.last_day, high)
+        self.ids.extend(np.array(ids, np.int64))
+        self.dob.extend(days.view("datetime64[D]"))
+        self.dob_other.extend(other)
+        for column, values in zip(CATEGORIES, categories):
+            self.codes[column].extend(self.dictionaries[column].encode(values))
+        self.last_id = ids[-1]
+
+
+class _View:
+    """A consistent read of a Snapshot: its first ``size`` rows and their labels."""
+
+    def __init__(self, snapshot):
+        self.size = size = snapshot.size
+        self.dob = snapshot.dob.view(size)
+        self.dob_other = snapshot.dob_other.view(size)
+        self.first_day, self.last_day = snapshot.first_day, snapshot.last_day
+        self.other_dob = list(snapshot.other_dob.labels)
+        self.codes = {column: snapshot.codes[column].view(size) for column in CATEGORIES}
+        self.categories = {column: list(snapshot.dictionaries[column].labels) for column in CATEGORIES}
+        self._dob_codes = None
+
+    def column(self, name):
+        """``(codes, signature)``: per-row codes into ``labels(name)``.
+
+        dob is coded by day: every day from the earliest date to the latest,
+        then the non-date values. No column at all is a single NULL label.
+        ``signature`` identifies the label list for caching evaluations.
+        """
+        if name is None:
+            return np.zeros(self.size, np.int32), ()
+        if name != "dob":
+            return self.codes[name], len(self.categories[name])
+        first, last = self.first_day, self.last_day
+        if self._dob_codes is None:
+            span = 0 if first is None else last - first + 1
+            days = self.dob.view(np.int64)
+            self._dob_codes = np.where(self.dob_other == 0, days - (first or 0), span - 1 + self.dob_other).astype(np.int32)
+        return self._dob_codes, (first, last, len(self.other_dob))
+
+    def labels(self, name):
+        if name is None:
+            return [None]
+        if name != "dob":
+            return self.categories[name]
+        first, last = self.first_day, self.last_day
+        dates = [] if first is None else np.arange(first, last + 1).astype("datetime64[D]").astype(str).tolist()
+        return dates + self.other_dob
+
+
+class _Evaluated:
+    """An expression evaluated over a column's labels: a value code per label and the values."""
+
+    __slots__ = ("mapping", "values", "_order")
+
+    def __init__(self, results):
+        dictionary = _Dictionary()
+        self.mapping = dictionary.encode(results)
+        self.values = dictionary.labels
+        self._order = None
+
+    def order(self):
+        """Value codes sorted as SQLite's min() and max() compare: numbers, text, then blobs."""
+        if self._order is None:
+            self._order = sorted(range(len(self.values)), key=lambda code: aggregate.sort_key(self.values[code]))
+        return self._order
+
+
+class ColumnarEngine:
+    """Answers aggregate report queries from an in-memory Snapshot of ``entries``."""
+
+    def __init__(self, batch_size=50000, cache_size=256):
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.snapshot = Snapshot()
+        self.queries = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._evaluated = {}
+
+    def refresh(self, db):
+        """Load entries added since the last refresh and return a view of the snapshot."""
+        with self._lock:
+            max_id, count = db.execute(STATE_SQL).fetchone()
+            snapshot = self.snapshot
+            if (max_id or 0) < snapshot.last_id or (count is not None and count < snapshot.size):
+                snapshot = Snapshot()
+                self.reloads += 1
+            cursor = db.execute(LOAD_SQL, (snapshot.last_id, max_id or 0))
+            try:
+                while True:
+                    rows = cursor.fetchmany(self.batch_size)
+                    if not rows:
+                        break
+                    snapshot.append(rows)
+            finally:
+                cursor.close()
+            self.snapshot = snapshot
+            return _View(snapshot)
+
+    def execute(self, db, sql):
+        """Return ``(columns, rows)`` for ``sql``, or raise aggregate.Unsupported."""
+        query = aggregate.parse(sql)
+        if not query.is_aggregate:
+            raise aggregate.Unsupported("Not an aggregate query")
+        exprs = [query.where or [], *query.group_by]
+        exprs += [arg for call in query.aggregates.values() for arg in call.args]
+        unknown = set().union(*(aggregate.columns(expr) for expr in exprs)) - set(COLUMNS)
+        if unknown:
+            raise aggregate.Unsupported(f"Column {sorted(unknown)[0]} is not in the columnar snapshot")
+        view = self.refresh(db)
+        try:
+            result = self._execute(query, view)
+        except sqlite3.Error as e:
+            raise aggregate.Unsupported(f"Could not evaluate the query over the snapshot: {e}") from e
+        self.queries += 1
+        return result
+
+    def _execute(self, query, view):
+        mask = None
+        for part in aggregate.conjuncts(query.where) if query.where is not None else []:
+            codes, evaluated = self._values(view, part, None, "CASE WHEN ({}) THEN 1 ELSE 0 END")
+            truth = np.array([value == 1 for value in evaluated.values], bool)[codes]
+            mask = truth if mask is None else mask & truth
+        rows = None if mask is None else np.flatnonzero(mask)
+        count = view.size if rows is None else len(rows)
+
+        keys = [self._values(view, expr, rows) for expr in query.group_by]
+        group, groups, key_values = _group([(codes, evaluated.values) for codes, evaluated in keys], count)
+        results = [self._aggregate(view, call, rows, group, groups) for call in query.aggregates.values()]
+        return aggregate.project(self._db(), query, [key + tuple(result[i] for result in results)
+                                                     for i, key in enumerate(key_values)])
+
+    def _values(self, view, expr, rows, template="{}"):
+        """Per-row value codes of ``expr`` (restricted to ``rows``) and its _Evaluated labels."""
+        columns = aggregate.columns(expr)
+        if len(columns) > 1:
+            raise aggregate.Unsupported("Expression reads more than one column")
+        column = next(iter(columns), None)
+        codes, signature = view.column(column)
+        sql = template.format(aggregate.render(expr, lambda item: "__v" if isinstance(item, aggregate.Column) else None))
+        evaluated = self._evaluate(sql, lambda: view.labels(column), (column, signature))
+        return evaluated.mapping[codes if rows is None else codes[rows]], evaluated
+
+    def _evaluate(self, sql, labels, signature=None):
+        """Evaluate ``sql`` over ``__v`` for each of ``labels()``, cached by ``signature`` if given."""
+        volatile = signature is None or _VOLATILE.search(sql) is not None
+        key = (sql, signature, datetime.datetime.now(datetime.timezone.utc).date())
+        evaluated = None if volatile else self._evaluated.get(key)
+        if evaluated is None:
+            results = self._db().execute(
+                f"SELECT {sql} FROM (SELECT key AS __k, value AS __v FROM json_each(?)) ORDER BY __k",
+                (json.dumps(labels()),),
+            )
+            evaluated = _Evaluated([row[0] for row in results])
+            if not volatile:
+                if len(self._evaluated) >= self.cache_size:
+                    self._evaluated.clear()
+                self._evaluated[key] = evaluated
+        return evaluated
+
+    def _reals(self, values):
+        """``values`` as SQLite's sum() and avg() read them: CAST AS REAL."""
+        reals = self._evaluate("CAST(__v AS REAL)", lambda: values)
+        return np.array([np.nan if real is None else real for real in reals.values], float)[reals.mapping]
+
+    def _aggregate(self, view, call, rows, group, groups):
+        """One value per group for the aggregate ``call``."""
+        if call.star:
+            return np.bincount(group, minlength=groups).tolist()
+        if len(call.args) != 1:
+            raise aggregate.Unsupported(f"{call.name}() with {len(call.args)} arguments")
+        codes, evaluated = self._values(view, call.args[0], rows)
+        values = evaluated.values
+        present = np.array([value is not None for value in values], bool)[codes]
+        group, codes = group[present], codes[present]
+        if call.distinct:
+            pairs = np.unique(group.astype(np.int64) * len(values) + codes)
+            group, codes = pairs // len(values), (pairs % len(values)).astype(np.int32)
+        counts = np.bincount(group, minlength=groups)
+        if call.name == "count":
+            return counts.tolist()
+        if call.name in ("sum", "total", "avg"):
+            used = [values[code] for code in np.unique(codes).tolist()]
+            if call.name == "sum" and any(isinstance(value, (str, bytes)) for value in used):
+                raise aggregate.Unsupported("sum() of text")
+            sums = np.bincount(group, weights=self._reals(values)[codes], minlength=groups).tolist()
+            counts = counts.tolist()
+            if call.name == "total":
+                return sums
+            if call.name == "avg":
+                return [s / n if n else None for s, n in zip(sums, counts)]
+            integral = all(isinstance(value, int) for value in used)
+            return [(int(s) if integral else s) if n else None for s, n in zip(sums, counts)]
+        order = evaluated.order()
+        rank = np.empty(len(values), np.int64)
+        rank[order] = np.arange(len(values))
+        if call.name == "min":
+            best = np.full(groups, len(values), np.int64)
+            np.minimum.at(best, group, rank[codes])
+        else:
+            best = np.full(groups, -1, np.int64)
+            np.maximum.at(best, group, rank[codes])
+        return [values[order[r]] if n else None for r, n in zip(best.tolist(), counts.tolist())]
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(":memory:")
+        return db
+
+    def stats(self):
+        return {"rows": self.snapshot.size, "queries": self.queries, "reloads": self.reloads}
+
+
+def _group(keys, count):
+    """Group id per row, the number of groups, and each group's key values."""
+    if not keys:
+        return np.zeros(count, np.intp), 1, [()]
+    combined = np.zeros(count, np.int64)
+    space = 1
+    for codes, values in keys:
+        space *= len(values)
+        if space >= 1 << 62:
+            raise aggregate.Unsupported("Too many combinations of group keys")
+        combined = combined * len(values) + codes
+    if space <= DENSE_GROUPS:
+        present = np.flatnonzero(np.bincount(combined, minlength=space))
+        index = np.zeros(space, np.intp)
+        index[present] = np.arange(len(present))
+        group = index[combined]
+    else:
+        present, group = np.unique(combined, return_inverse=True)
+    columns = []
+    for codes, values in reversed(keys):
+        columns.append([values[code] for code in (present % len(values)).tolist()])
+        present = present // len(values)
+    return group, len(columns[0]), list(zip(*reversed(columns)))
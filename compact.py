@@ -0,0 +1,194 @@
+"""Compact, typed storage for ``entries``.
+
+The default layout keeps each record's demographics as the JSON text the
+page posts, repeating category names on every row. In the compact layout
+the rows live in ``entries_compact`` instead:
+
+- ``dob`` is a day number (days since 1970-01-01);
+- ``zip`` is an integer;
+- ``race`` and ``ethnicity`` are small-integer codes into ``race_codes``
+  and ``ethnicity_codes``.
+
+NULL stands for the blank string the page sends for an unanswered field.
+``entries`` becomes a view with the original columns, rebuilding ``value``
+from the typed columns, and triggers on the view accept the same INSERTs and
+DELETEs the table did, so the rest of the app works on either layout.
+Values that do not round-trip exactly (non-JSON, extra keys, malformed
+dates) keep their original text in ``raw``.
+"""
+
+TABLE = "entries_compact"
+LEGACY_TABLE = "entries_legacy"
+
+# field -> lookup table, seeded with the page's categories so they get the
+# smallest codes. Other labels are added as they are stored.
+CODES = {
+    "race": (
+        "race_codes",
+        [
+            "White", "Black or African American", "Asian", "American Indian or Alaska Native",
+            "Native Hawaiian or Other Pacific Islander", "Two or more races", "Prefer not to say",
+        ],
+    ),
+    "ethnicity": ("ethnicity_codes", ["Hispanic or Latino", "Not Hispanic or Latino", "Prefer not to say"]),
+}
+
+# julianday() of 1970-01-01T00:00:00.
+_UNIX_EPOCH_JD = 2440587.5
+
+
+def _decode(column, field, label=None):
+    """Text of ``field`` for a compact row, as the default layout returns it."""
+    if field == "dob":
+        return f"date({column} * 86400, 'unixepoch')"
+    if field == "zip":
+        return f"substr('0000' || {column}, -5)"
+    return label
+
+
+def _value(row, labels):
+    # Exactly what JSON.stringify() on the page produces for a record.
+    parts = []
+    for field in ("dob", "zip", "race", "ethnicity"):
+        parts.append(f"'{field}', IFNULL({_decode(f'{row}.{field}', field, labels.get(field))}, '')")
+    return f"json_object({', '.join(parts)})"
+
+
+def _encode(source):
+    """SELECT compact rows from ``source``, a relation with the default layout's columns."""
+    codes = {
+        field: f"(SELECT code FROM {table} WHERE label = s.{field} AND typeof(s.{field}) = 'text')"
+        for field, (table, _) in CODES.items()
+    }
+    labels = {field: f"(SELECT label FROM {table} WHERE code = t.{field})" for field, (table, _) in CODES.items()}
+    return f"""
+        SELECT t.id, t.name, t.dob, t.zip, t.race, t.ethnicity,
+               CASE WHEN t.value IS NOT {_value('t', labels)} THEN t.value END
+        FROM (
+            SELECT s.id, s.name, s.value,
+                   CASE WHEN date(julianday(s.dob)) IS s.dob
+                        THEN CAST(julianday(s.dob) - {_UNIX_EPOCH_JD} AS INTEGER) END AS dob,
+                   CASE WHEN typeof(s.zip) = 'text' AND s.zip GLOB '[0-9][0-9][0-9][0-9][0-9]'
+                        THEN CAST(s.zip AS INTEGER) END AS zip,
+                   {codes['race']} AS race,
+                   {codes['ethnicity']} AS ethnicity
+            FROM {source} AS s
+        ) AS t
+    """
+
+
+def _fields(row):
+    return ", ".join(
+        f"CASE WHEN json_valid({row}.value) THEN json_extract({row}.value, '$.{field}') END AS {field}"
+        for field in ("dob", "zip", "race", "ethnicity")
+    )
+
+
+def _view():
+    labels = {"race": "r.label", "ethnicity": "e.label"}
+    columns = []
+    for field in ("dob", "zip", "race", "ethnicity"):
+        decoded = _decode(f"c.{field}", field, labels.get(field))
+        columns.append(
+            f"CASE WHEN c.{field} IS NOT NULL THEN {decoded} "
+            f"WHEN c.raw IS NULL THEN '' "
+            f"WHEN json_valid(c.raw) THEN json_extract(c.raw, '$.{field}') END AS {field}"
+        )
+    return (
+        f"CREATE VIEW IF NOT EXISTS entries AS SELECT c.id, c.name, IFNULL(c.raw, {_value('c', labels)}) AS value, "
+        f"{', '.join(columns)} FROM {TABLE} AS c "
+        f"LEFT JOIN race_codes AS r ON r.code = c.race "
+        f"LEFT JOIN ethnicity_codes AS e ON e.code = c.ethnicity"
+    )
+
+
+def installed(db):
+    """True once ``entries`` is the compact layout's view."""
+    row = db.execute("SELECT type FROM sqlite_master WHERE name = 'entries'").fetchone()
+    return row is not None and row[0] == "view"
+
+
+def install(db):
+    """Create the compact tables, the ``entries`` view and its triggers if missing."""
+    for table, labels in CODES.values():
+        db.execute(f"CREATE TABLE IF NOT EXISTS {table} (code INTEGER PRIMARY KEY, label TEXT NOT NULL UNIQUE)")
+        db.executemany(f"INSERT OR IGNORE INTO {table} (label) VALUES (?)", [(label,) for label in labels])
+    db.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE} (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+        "dob INTEGER, zip INTEGER, race INTEGER, ethnicity INTEGER, raw TEXT)"
+    )
+    db.execute(_view())
+    register = "\n".join(
+        f"  INSERT OR IGNORE INTO {table} (label) SELECT json_extract(NEW.value, '$.{field}') "
+        f"WHERE json_valid(NEW.value) AND json_type(NEW.value, '$.{field}') = 'text' "
+        f"AND json_extract(NEW.value, '$.{field}') > '';"
+        for field, (table, _) in CODES.items()
+    )
+    source = f"(SELECT NEW.id AS id, NEW.name AS name, NEW.value AS value, {_fields('NEW')})"
+    db.execute(
+        "CREATE TRIGGER IF NOT EXISTS entries_compact_insert INSTEAD OF INSERT ON entries BEGIN\n"
+        f"{register}\n"
+        f"  INSERT INTO {TABLE} (id, name, dob, zip, race, ethnicity, raw) {_encode(source)};\n"
+        "END"
+    )
+    db.execute(
+        "CREATE TRIGGER IF NOT EXISTS entries_compact_delete INSTEAD OF DELETE ON entries BEGIN\n"
+        f"  DELETE FROM {TABLE} WHERE id = OLD.id;\n"
+        "END"
+    )
+
+
+def convert(db, batch_size=50000, progress=None):
+    """Move rows from the default layout into the compact one, committing per batch.
+
+    The ``entries`` table is renamed to ``entries_legacy`` and dropped once
+    every row has been copied, so an interrupted conversion resumes where
+    it stopped. ``entries`` must have the generated demographic columns
+    (``app.migrate_db``). Triggers on the old table (rollups, search) are
+    dropped; reinstall them on ``entries_compact`` afterwards.
+    """
+    if not installed(db):
+        db.execute(f"ALTER TABLE entries RENAME TO {LEGACY_TABLE}")
+        triggers = db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (LEGACY_TABLE,)
+        ).fetchall()
+        for (name,) in triggers:
+            db.execute(f"DROP TRIGGER {name}")
+        install(db)
+        for field, (table, _) in CODES.items():
+            db.execute(
+                f"INSERT OR IGNORE INTO {table} (label) SELECT DISTINCT {field} FROM {LEGACY_TABLE} "
+                f"WHERE typeof({field}) = 'text' AND {field} > ''"
+            )
+        db.commit()
+    if not db.execute(f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{LEGACY_TABLE}'").fetchone():
+        return
+
+    total = db.execute(f"SELECT COUNT(*) FROM {LEGACY_TABLE}").fetchone()[0]
+    after = db.execute(f"SELECT IFNULL(MAX(id), 0) FROM {TABLE}").fetchone()[0]
+    done = db.execute(f"SELECT COUNT(*) FROM {LEGACY_TABLE} WHERE id <= ?", (after,)).fetchone()[0]
+    source = (
+        f"(SELECT id, name, value, dob, zip, race, ethnicity FROM {LEGACY_TABLE} "
+        "WHERE id > ? ORDER BY id LIMIT ?)"
+    )
+    while True:
+        copied = db.execute(
+            f"INSERT INTO {TABLE} (id, name, dob, zip, race, ethnicity, raw) {_encode(source)}",
+            (after, batch_size),
+        ).rowcount
+        if not copied:
+            break
+        after = db.execute(f"SELECT MAX(id) FROM {TABLE}").fetchone()[0]
+        db.commit()
+        done += copied
+        if progress is not None:
+            progress(done, total)
+
+    # Keep AUTOINCREMENT from reusing the ids of deleted trailing rows.
+    db.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, IFNULL((SELECT seq FROM sqlite_sequence WHERE name = ?), 0)) "
+        "WHERE name = ?",
+        (LEGACY_TABLE, TABLE),
+    )
+    db.execute(f"DROP TABLE {LEGACY_TABLE}")
+    db.commit()
@@ -0,0 +1,112 @@
+"""Pooled, tuned SQLite connections shared across requests."""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# Connections (or pools of them) a forked child inherited from its parent.
+# Closing one in the child would run SQLite's cleanup on locks and WAL state
+# the parent still uses, and freeing a sqlite3.Connection closes it, so they
+# are kept referenced here for the life of the process.
+_inherited = []
+
+
+def abandon(connections):
+    """Keep ``connections``, inherited across fork(), open and unused from now on."""
+    _inherited.append(connections)
+
+
+class ConnectionManager:
+    """Keeps idle connections around between requests instead of reopening the file.
+
+    Separate pools are kept for read-write and read-only (``mode=ro``)
+    connections. A connection is only ever used by one thread at a time but
+    may move between threads, since servers commonly start a thread per
+    request. A forked child abandons the parent's pools and starts its own, so
+    processes never share a connection. ``on_connect(db, readonly)``, if given, runs on every new
+    connection.
+    """
+
+    def __init__(self, path, journal_mode="WAL", synchronous="NORMAL", mmap_size=256 * 1024 * 1024,
+                 cache_size=-64 * 1024, busy_timeout=5000, pool_size=8, on_connect=None):
+        self.path = path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.busy_timeout = busy_timeout
+        self.pool_size = pool_size
+        self.on_connect = on_connect
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._reset()
+
+    def _reset(self):
+        abandon(list(self._pools.values()))
+        self._pid = os.getpid()
+        self._pools = {False: queue.LifoQueue(self.pool_size), True: queue.LifoQueue(self.pool_size)}
+        # ids of the connections acquire() opened in this process. Inherited
+        # ones are never freed, so their ids are not reused.
+        self._opened = set()
+
+    def connect(self, readonly=False):
+        if readonly:
+            db = sqlite3.connect(f"file:{quote(os.path.abspath(self.path))}?mode=ro", uri=True,
+                                 timeout=self.busy_timeout / 1000, check_same_thread=False)
+        else:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, check_same_thread=False)
+            # journal_mode is persistent in the file, so only writers set it.
+            db.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        db.execute(f"PRAGMA synchronous = {self.synchronous}")
+        db.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        db.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        db.row_factory = sqlite3.Row
+        if self.on_connect is not None:
+            self.on_connect(db, readonly)
+        return db
+
+    def acquire(self, readonly=False):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            pool = self._pools[readonly]
+        try:
+            return pool.get_nowait()
+        except queue.Empty:
+            db = self.connect(readonly)
+            self._opened.add(id(db))
+            return db
+
+    def release(self, db, readonly=False):
+        if self._pid != os.getpid() or id(db) not in self._opened:
+            # Checked out before a fork; the parent's to close, not ours.
+            abandon(db)
+            return
+        if db.in_transaction:
+            db.rollback()
+        try:
+            self._pools[readonly].put_nowait(db)
+        except queue.Full:
+            self._opened.discard(id(db))
+            db.close()
+
+    @contextmanager
+    def connection(self, readonly=False):
+        db = self.acquire(readonly)
+        try:
+            yield db
+        finally:
+            self.release(db, readonly)
+
+    def close_all(self):
+        for pool in self._pools.values():
+            while True:
+                try:
+                    db = pool.get_nowait()
+                except queue.Empty:
+                    break
+                self._opened.discard(id(db))
+                db.close()
@@ -0,0 +1,143 @@
+"""Streaming export of ``entries`` with the demographic fields as columns."""
+
+import csv
+import io
+import json
+from datetime import date
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet and Arrow output are optional.
+    pa = None
+
+COLUMNS = ("id", "name", "dob", "zip", "race", "ethnicity")
+QUERY = f"SELECT {', '.join(COLUMNS)} FROM entries ORDER BY id"
+
+# format -> (mimetype, file extension, needs pyarrow)
+FORMATS = {
+    "csv": ("text/csv", "csv", False),
+    "ndjson": ("application/x-ndjson", "ndjson", False),
+    "parquet": ("application/vnd.apache.parquet", "parquet", True),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows", True),
+}
+
+
+def available(fmt):
+    return fmt in FORMATS and (pa is not None or not FORMATS[fmt][2])
+
+
+def _batches(db, batch_size):
+    cursor = db.execute(QUERY)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson(batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows)
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands its contents back after each batch."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parse_date(text):
+    try:
+        return date.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _arrow_schema():
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.int64()),
+        ("name", pa.string()),
+        ("dob", pa.date32()),
+        ("zip", pa.string()),
+        ("race", category),
+        ("ethnicity", category),
+    ])
+
+
+def _record_batch(schema, rows):
+    ids, names, dobs, zips, races, ethnicities = (list(col) for col in zip(*rows))
+    arrays = [
+        pa.array(ids, pa.int64()),
+        pa.array(names, pa.string()),
+        pa.array([_parse_date(d) for d in dobs], pa.date32()),
+        pa.array([None if z is None else str(z) for z in zips], pa.string()),
+        pa.array(races, pa.string()).dictionary_encode(),
+        pa.array(ethnicities, pa.string()).dictionary_encode(),
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _columnar(batches, fmt):
+    schema = _arrow_schema()
+    sink = _Sink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    try:
+        for rows in batches:
+            # Each database batch becomes one Parquet row group / IPC message.
+            write(_record_batch(schema, rows))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream(db, fmt, batch_size):
+    """Yield the export of ``entries`` in ``fmt``, ``batch_size`` rows at a time."""
+    batches = _batches(db, batch_size)
+    if fmt == "csv":
+        return _csv(batches)
+    if fmt == "ndjson":
+        return _ndjson(batches)
+    return _columnar(batches, fmt)
@@ -0,0 +1,83 @@
+"""Process-wide Anthropic client with a concurrency cap and call coalescing."""
+
+import os
+import threading
+
+import anthropic
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers share its outcome."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class LLMClient:
+    """Lazily builds one ``anthropic.Anthropic`` client and reuses its connection pool.
+
+    At most ``max_concurrency`` requests are in flight from this process;
+    further callers block until a slot frees. The client is rebuilt in a
+    forked child since its HTTP connections cannot be shared across processes.
+    """
+
+    def __init__(self, max_concurrency=8, base_url=None, timeout=30.0, max_retries=2):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = anthropic.Anthropic(
+                    base_url=self.base_url, timeout=self.timeout, max_retries=self.max_retries
+                )
+                self._pid = os.getpid()
+            return self._client
+
+    def set_client(self, client):
+        """Use ``client`` (anything with ``messages.create``) instead of building one."""
+        with self._lock:
+            self._client = client
+            self._pid = os.getpid()
+
+    def create_message(self, **kwargs):
+        with self._slots:
+            return self.client.messages.create(**kwargs)
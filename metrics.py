@@ -0,0 +1,253 @@
+"""Minimal Prometheus-style metrics and per-request stage timing."""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Returned by timers when metrics are disabled, so instrumented code pays for
+# one function call and an empty with-block.
+NULL_STAGE = nullcontext()
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def combine(left, right):
+        return left + right
+
+    def render(self, state=None):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted((self.state() if state is None else state).items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count.
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def state(self):
+        with self._lock:
+            return {key: ([*s[0]], s[1], s[2]) for key, s in self._series.items()}
+
+    @staticmethod
+    def combine(left, right):
+        return [a + b for a, b in zip(left[0], right[0])], left[1] + right[1], left[2] + right[2]
+
+    def render(self, state=None):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total, count) in sorted((self.state() if state is None else state).items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    """Metrics of this process, or of every process sharing a directory.
+
+    After ``share(directory)``, each process writes a snapshot of its values
+    to ``directory`` every ``interval`` seconds and before rendering, and
+    ``render()`` merges the snapshots of all of them. Counters and
+    histograms are summed, including those of processes that have exited,
+    so totals never go backwards when a worker is replaced. Collector
+    gauges are per-process values, so each one keeps a ``worker`` label;
+    processes whose snapshot is older than three intervals are left out.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self.directory = None
+        self.interval = None
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register ``fn`` returning ``[(name, type, help, value), ...]`` read at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        if self.directory is not None:
+            return self._render_shared()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            for name, kind, help, value in fn():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+    # Sharing between processes
+
+    def share(self, directory, interval=1.0):
+        """Merge with the other processes writing to ``directory``; call once in each process, after forking."""
+        self.directory = directory
+        self.interval = interval
+        self.flush()
+        threading.Thread(target=self._run, name="metrics-flush", daemon=True).start()
+
+    def snapshot(self):
+        return {
+            "metrics": {
+                metric.name: [[list(key), value] for key, value in metric.state().items()]
+                for metric in self._metrics
+            },
+            "collected": [list(sample) for fn in self._collectors for sample in fn()],
+        }
+
+    def flush(self):
+        """Write this process's snapshot for the others to read."""
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing the metrics snapshot failed")
+
+    def _snapshots(self):
+        self.flush()
+        now = time.time()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+                age = now - os.stat(path).st_mtime
+            except (OSError, ValueError):
+                continue  # Replaced or removed while reading.
+            yield name[:-len(".json")], snapshot, age <= 3 * self.interval
+
+    def _render_shared(self):
+        states = {metric.name: {} for metric in self._metrics}
+        counters = {}
+        gauges = {}
+        for worker, snapshot, live in self._snapshots():
+            for metric in self._metrics:
+                state = states[metric.name]
+                for key, value in snapshot["metrics"].get(metric.name, []):
+                    key = tuple(key)
+                    state[key] = metric.combine(state[key], value) if key in state else value
+            for name, kind, help, value in snapshot["collected"]:
+                if kind == "counter":
+                    entry = counters.setdefault(name, [help, 0])
+                    entry[1] += value
+                elif live:
+                    gauges.setdefault(name, [help, kind, []])[2].append((worker, value))
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(states[metric.name]))
+        for name, (help, value) in counters.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter", f"{name} {_format_value(value)}"]
+        for name, (help, kind, values) in gauges.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(('worker',), (worker,))} {_format_value(value)}" for worker, value in values]
+        return "\n".join(lines) + "\n"
+
+
+class Stage:
+    """Times a block, appending ``(name, seconds)`` to ``sink`` and observing ``histogram``."""
+
+    __slots__ = ("name", "sink", "histogram", "labels", "start")
+
+    def __init__(self, name, sink, histogram=None, labels=None):
+        self.name = name
+        self.sink = sink
+        self.histogram = histogram
+        self.labels = labels or {}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.sink is not None:
+            self.sink.append((self.name, elapsed))
+        if self.histogram is not None:
+            self.histogram.observe(elapsed, **self.labels)
+        return False
+
+
+def server_timing(timings, total=None):
+    """Format ``(name, seconds)`` pairs as a Server-Timing header value."""
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
@@ -0,0 +1,240 @@
+"""A snapshot of the database that report queries read instead of the live file.
+
+``Replica.refresh`` copies each source file (the database, or each shard in
+partitioned mode) with SQLite's online backup API into a temporary file,
+adds indexes that only pay off for reports, runs ANALYZE and renames the
+copy over the previous snapshot. A snapshot never changes once in place,
+so readers open it immutable (no locking at all), and connections still
+reading a replaced snapshot finish on the old file.
+
+A background thread refreshes the snapshot once it is ``interval`` seconds
+old or at least ``writes`` entries behind the live database. A lock file
+keeps several server processes from refreshing at the same time; the
+others pick up the new snapshot the next time they check out a connection.
+"""
+
+import fcntl
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+META_TABLE = "replica_meta"
+
+# Indexes that would slow every insert into the live database but speed up
+# report queries. (race, dob) covers "age by race" style reports.
+ANALYTICS_INDEXES = {
+    "idx_replica_race_dob": "race, dob",
+}
+
+
+class Replica:
+    """Snapshot copies of ``sources`` at ``targets`` (the main database first).
+
+    ``count()`` returns the live number of entries and is compared with the
+    count at the time of the snapshot to tell how far behind it is.
+    ``on_connect(db, readonly)`` runs on every new reader connection, as in
+    db.ConnectionManager. 0 disables either refresh trigger.
+    """
+
+    def __init__(self, sources, targets, count, interval=60.0, writes=10000, on_connect=None,
+                 mmap_size=256 * 1024 * 1024, cache_size=-64 * 1024, pool_size=8, poll=1.0):
+        self.sources = list(sources)
+        self.targets = list(targets)
+        self.count = count
+        self.interval = interval
+        self.writes = writes
+        self.on_connect = on_connect
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.pool_size = pool_size
+        self.poll = poll
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+        self._thread = None
+        # Snapshot generation each checked-out or pooled connection reads.
+        self._generations = {}
+        self._meta = (None, None)
+
+    @property
+    def path(self):
+        return self.targets[0]
+
+    def exists(self):
+        return all(os.path.exists(target) for target in self.targets)
+
+    def generation(self):
+        """Identifies the snapshot in place; changes with every refresh."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    # Reading
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = queue.LifoQueue(self.pool_size)
+                self._generations = {}
+                self._thread = threading.Thread(target=self._run, name="replica-refresh", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def connect(self):
+        db = sqlite3.connect(f"file:{quote(os.path.abspath(self.path))}?mode=ro&immutable=1", uri=True,
+                             check_same_thread=False)
+        db.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        db.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        db.row_factory = sqlite3.Row
+        if self.on_connect is not None:
+            self.on_connect(db, True)
+        return db
+
+    def acquire(self):
+        """A read-only connection to the current snapshot."""
+        self._ensure_started()
+        generation = self.generation()
+        while True:
+            try:
+                db = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            if self._generations[id(db)] == generation:
+                return db
+            del self._generations[id(db)]
+            db.close()
+        db = self.connect()
+        # The snapshot may have been replaced while connecting; an older
+        # generation only means the connection is dropped on release.
+        self._generations[id(db)] = generation
+        return db
+
+    def release(self, db):
+        created = self._generations.get(id(db))
+        if self._pid != os.getpid() or created != self.generation():
+            self._generations.pop(id(db), None)
+            db.close()
+            return
+        try:
+            self._pool.put_nowait(db)
+        except queue.Full:
+            self._generations.pop(id(db), None)
+            db.close()
+
+    @contextmanager
+    def connection(self):
+        db = self.acquire()
+        try:
+            yield db
+        finally:
+            self.release(db)
+
+    def info(self, db):
+        """``{"taken_at", "age_seconds", "behind"}`` for the snapshot ``db`` reads."""
+        taken_at, entries = db.execute(f"SELECT taken_at, entries FROM {META_TABLE}").fetchone()
+        return {
+            "taken_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(taken_at)),
+            "age_seconds": round(max(time.time() - taken_at, 0), 3),
+            "behind": abs(self.count() - entries),
+        }
+
+    def snapshot(self):
+        """``(taken_at, entries)`` of the snapshot in place, or None if there is none yet."""
+        generation = self.generation()
+        if generation is None:
+            return None
+        if self._meta[0] != generation:
+            db = sqlite3.connect(f"file:{quote(os.path.abspath(self.path))}?mode=ro&immutable=1", uri=True)
+            try:
+                self._meta = generation, db.execute(f"SELECT taken_at, entries FROM {META_TABLE}").fetchone()
+            finally:
+                db.close()
+        return self._meta[1]
+
+    def stats(self):
+        snapshot = self.snapshot()
+        return {
+            "path": self.path,
+            "age_seconds": round(time.time() - snapshot[0], 3) if snapshot else None,
+            "entries": snapshot[1] if snapshot else None,
+            "refreshes": self.refreshes,
+        }
+
+    # Refreshing
+
+    def due(self):
+        """True once the snapshot is older than ``interval`` or ``writes`` entries behind."""
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return True
+        taken_at, entries = snapshot
+        if self.interval and time.time() - taken_at >= self.interval:
+            return True
+        return bool(self.writes) and abs(self.count() - entries) >= self.writes
+
+    def refresh(self):
+        """Take a new snapshot; returns False if another process is already taking one."""
+        lock = open(self.path + ".lock", "w")
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            taken_at, entries = time.time(), self.count()
+            # The main database goes last: its replacement is what readers
+            # notice, so they only move on once every shard is in place.
+            for source, target in reversed(list(zip(self.sources, self.targets))):
+                self._copy(source, target, (taken_at, entries) if target == self.path else None)
+            self.refreshes += 1
+            return True
+        finally:
+            lock.close()
+
+    def _copy(self, source, target, meta):
+        temporary = target + ".tmp"
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        src = sqlite3.connect(f"file:{quote(os.path.abspath(source))}?mode=ro", uri=True)
+        dst = sqlite3.connect(temporary)
+        try:
+            # One step: a backup done in steps restarts whenever another
+            # connection writes to the source, which under steady ingest
+            # could be forever. WAL lets the writes go on meanwhile.
+            src.backup(dst)
+            dst.execute("PRAGMA journal_mode = DELETE")
+            if meta is not None:
+                dst.execute(f"CREATE TABLE {META_TABLE} (taken_at REAL NOT NULL, entries INTEGER NOT NULL)")
+                dst.execute(f"INSERT INTO {META_TABLE} VALUES (?, ?)", meta)
+            # In the compact layout entries is a view; it keeps the live indexes.
+            if dst.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries'").fetchone():
+                for index, indexed in ANALYTICS_INDEXES.items():
+                    dst.execute(f"CREATE INDEX IF NOT EXISTS {index} ON entries ({indexed})")
+            dst.commit()
+            # Sampled statistics are enough for the planner and cost a
+            # fraction of a full ANALYZE.
+            dst.execute("PRAGMA analysis_limit = 1000")
+            dst.execute("ANALYZE")
+            dst.commit()
+        finally:
+            src.close()
+            dst.close()
+        os.replace(temporary, target)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll)
+            try:
+                if self.due():
+                    self.refresh()
+            except Exception:
+                logger.exception("Refreshing the report snapshot failed")
@@ -0,0 +1,96 @@
+"""Cache of report query results, invalidated by a data version counter."""
+
+import multiprocessing
+import sys
+import threading
+from collections import OrderedDict
+
+
+class DataVersion:
+    """Monotonic counter bumped by every writer to ``entries``.
+
+    The counter lives in shared memory, so processes forked after it is
+    created (the workers in server.py) see each other's writes.
+    """
+
+    def __init__(self):
+        self._value = multiprocessing.Value("q", 0)
+
+    @property
+    def value(self):
+        return self._value.value
+
+    def bump(self):
+        with self._value.get_lock():
+            self._value.value += 1
+            return self._value.value
+
+
+def estimate_size(sql, columns, rows):
+    """Approximate bytes held by a cached result, for eviction accounting."""
+    size = sys.getsizeof(sql) + sys.getsizeof(columns) + sum(sys.getsizeof(c) for c in columns)
+    size += sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return size
+
+
+class ResultCache:
+    """LRU map from SQL text to ``(columns, rows)``, capped by estimated memory.
+
+    An entry is only served while the data version it was computed at is
+    still current; stale entries are dropped on lookup. Results larger than
+    ``max_entry_bytes`` are never stored so one huge report cannot flush the
+    whole cache.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sql, version):
+        with self._lock:
+            entry = self._entries.get(sql)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(sql)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry is not None:
+                self._discard(sql)
+            self.misses += 1
+            return None
+
+    def put(self, sql, version, columns, rows):
+        size = estimate_size(sql, columns, rows)
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            if sql in self._entries:
+                self._discard(sql)
+            self._entries[sql] = (version, columns, rows, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, sql):
+        self.bytes -= self._entries.pop(sql)[3]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
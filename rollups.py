@@ -0,0 +1,126 @@
+"""Demographic count tables kept current by triggers on ``entries``.
+
+Each rollup holds one row per distinct key with the number of entries
+carrying it, so the common "how many people by ..." reports are answered
+by reading a handful of rows instead of scanning the table. Missing or
+non-JSON fields are counted under the empty string.
+"""
+
+from sql_cache import normalize_question
+
+# table -> [(key column, expression over the inserted or deleted row)]
+ROLLUPS = {
+    "rollup_race": [("race", "IFNULL({row}.race, '')")],
+    "rollup_ethnicity": [("ethnicity", "IFNULL({row}.ethnicity, '')")],
+    "rollup_race_ethnicity": [("race", "IFNULL({row}.race, '')"), ("ethnicity", "IFNULL({row}.ethnicity, '')")],
+    "rollup_birth_year": [("birth_year", "IFNULL(substr({row}.dob, 1, 4), '')")],
+    "rollup_zip": [("zip", "IFNULL({row}.zip, '')")],
+}
+
+# Answers for the example questions (and close variants), keyed on the
+# normalized question text.
+QUERIES = {
+    ("how many people by race", "count by race", "people by race"): (
+        'SELECT race AS "Race", n AS "Count" FROM rollup_race WHERE n > 0 ORDER BY n DESC'
+    ),
+    ("how many people by ethnicity", "count by ethnicity", "people by ethnicity"): (
+        'SELECT ethnicity AS "Ethnicity", n AS "Count" FROM rollup_ethnicity WHERE n > 0 ORDER BY n DESC'
+    ),
+    ("count by race and ethnicity", "how many people by race and ethnicity"): (
+        'SELECT race AS "Race", ethnicity AS "Ethnicity", n AS "Count" FROM rollup_race_ethnicity '
+        "WHERE n > 0 ORDER BY race, ethnicity"
+    ),
+    ("how many people born each year", "count by birth year", "how many people by birth year"): (
+        'SELECT birth_year AS "Year", n AS "Count" FROM rollup_birth_year '
+        "WHERE birth_year > '' AND n > 0 ORDER BY birth_year"
+    ),
+    ("top 10 most common zip codes", "top 10 zip codes", "most common zip codes"): (
+        'SELECT zip AS "Zip Code", n AS "Count" FROM rollup_zip '
+        "WHERE zip > '' AND n > 0 ORDER BY n DESC LIMIT 10"
+    ),
+}
+
+_LOOKUP = {phrase: sql for phrases, sql in QUERIES.items() for phrase in phrases}
+
+
+def match(question):
+    """Return rollup SQL answering ``question``, or None if it needs the model."""
+    return _LOOKUP.get(normalize_question(question))
+
+
+def _statements(row, template, source=None):
+    statements = []
+    for table, keys in ROLLUPS.items():
+        columns = [column for column, _ in keys]
+        exprs = [expr.format(row=row) for _, expr in keys]
+        statements.append(template(table, columns, exprs, source))
+    return "\n".join(statements)
+
+
+def _increment(table, columns, exprs, source):
+    values = f"SELECT {', '.join(exprs)}, 1 FROM {source}" if source else f"VALUES ({', '.join(exprs)}, 1)"
+    return (
+        f"  INSERT INTO {table} ({', '.join(columns)}, n) {values} "
+        f"ON CONFLICT ({', '.join(columns)}) DO UPDATE SET n = n + 1;"
+    )
+
+
+def _decrement(table, columns, exprs, source):
+    where = " AND ".join(f"{table}.{c} = {e}" for c, e in zip(columns, exprs))
+    if source:
+        source, _, condition = source.partition(" WHERE ")
+        return f"  UPDATE {table} SET n = n - 1 FROM {source} WHERE {condition} AND {where};"
+    return f"  UPDATE {table} SET n = n - 1 WHERE {where};"
+
+
+def install(db, storage="entries"):
+    """Create rollup tables and triggers, populating them on first install.
+
+    ``storage`` is the table entry rows are stored in. For any table other than
+    ``entries`` (the compact layout) the triggers go on that table and read
+    each row back through the ``entries`` view.
+    """
+    existing = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'entries_rollup_insert'"
+    ).fetchone()
+    for table, keys in ROLLUPS.items():
+        columns = [column for column, _ in keys]
+        db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(f'{c} TEXT NOT NULL' for c in columns)}, "
+            f"n INTEGER NOT NULL, PRIMARY KEY ({', '.join(columns)})) WITHOUT ROWID"
+        )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_rollup_zip_n ON rollup_zip (n)")
+    if storage == "entries":
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS entries_rollup_insert AFTER INSERT ON entries BEGIN\n"
+            + _statements("NEW", _increment)
+            + "\nEND"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS entries_rollup_delete AFTER DELETE ON entries BEGIN\n"
+            + _statements("OLD", _decrement)
+            + "\nEND"
+        )
+    else:
+        # The row is still visible through the view before it is deleted.
+        db.execute(
+            f"CREATE TRIGGER IF NOT EXISTS entries_rollup_insert AFTER INSERT ON {storage} BEGIN\n"
+            + _statements("e", _increment, "entries AS e WHERE e.id = NEW.id")
+            + "\nEND"
+        )
+        db.execute(
+            f"CREATE TRIGGER IF NOT EXISTS entries_rollup_delete BEFORE DELETE ON {storage} BEGIN\n"
+            + _statements("e", _decrement, "entries AS e WHERE e.id = OLD.id")
+            + "\nEND"
+        )
+    if existing is None:
+        rebuild(db)
+
+
+def rebuild(db):
+    """Recompute every rollup from ``entries``; the caller commits."""
+    for table, keys in ROLLUPS.items():
+        columns = ", ".join(column for column, _ in keys)
+        exprs = ", ".join(expr.format(row="entries") for _, expr in keys)
+        db.execute(f"DELETE FROM {table}")
+        db.execute(f"INSERT INTO {table} ({columns}, n) SELECT {exprs}, COUNT(*) FROM entries GROUP BY {exprs}")
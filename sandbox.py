@@ -0,0 +1,190 @@
+"""Budgeted execution of model-generated SQL."""
+
+import itertools
+import re
+import sqlite3
+import time
+from contextlib import contextmanager, nullcontext
+
+# How many SQLite VM instructions run between progress handler calls.
+PROGRESS_INTERVAL = 1000
+FETCH_BATCH = 500
+
+_FULL_SCAN = re.compile(r"^SCAN (?:(\w+)\.)?(\w+)$")
+
+
+class QueryLimitError(Exception):
+    """A query was stopped or refused for exceeding one of its budgets.
+
+    ``limit`` names the budget: ``"timeout"``, ``"steps"``, ``"rows"`` or
+    ``"scan"``.
+    """
+
+    def __init__(self, limit, message):
+        super().__init__(message)
+        self.limit = limit
+
+    def __reduce__(self):
+        # Keep ``limit`` when raised in a worker process and pickled back.
+        return type(self), (self.limit, str(self))
+
+
+def _resolve_table(db, sql, name):
+    # Plans name aliased tables by their alias; map it back through the SQL.
+    if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone():
+        return name
+    pattern = rf"\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?{re.escape(name)}\b"
+    m = re.search(pattern, sql, re.IGNORECASE)
+    if m:
+        return m.group(1)
+    # Or an alias inside a view the query reads, such as the compact layout's entries.
+    for (view_sql,) in db.execute("SELECT sql FROM sqlite_master WHERE type = 'view'"):
+        m = re.search(pattern, view_sql, re.IGNORECASE)
+        if m:
+            return m.group(1)
+    return None
+
+
+def full_scans(db, sql, min_rows):
+    """Return ``(table, approx_rows)`` for each full table scan of ``min_rows`` or more."""
+    scans = []
+    # Scans of one table's shards in attached databases (partitioned
+    # storage). The shards share one id sequence, so the largest id among
+    # them approximates the size of the whole table.
+    sharded = {}
+    for row in db.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        m = _FULL_SCAN.match(row[-1])
+        if not m:
+            continue
+        schema, name = m.groups()
+        table = f"{schema}.{name}" if schema else _resolve_table(db, sql, name)
+        if table is None:
+            continue
+        try:
+            approx = db.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID tables; only the small rollups use them.
+            continue
+        if schema:
+            sharded[name] = max(sharded.get(name, 0), approx)
+        elif approx >= min_rows:
+            scans.append((table, approx))
+    scans += [(table, approx) for table, approx in sharded.items() if approx >= min_rows]
+    return scans
+
+
+def _untimed(name):
+    return nullcontext()
+
+
+class Query:
+    """A statement running within its budgets, read in batches.
+
+    The progress handler aborts the statement once ``timeout`` seconds or
+    ``max_steps`` VM instructions are exceeded (0 disables either). Both
+    budgets span the whole read but only count time inside SQLite, not time
+    the caller spends between batches, such as a stream waiting for a slow
+    client. ``timer(stage)`` wraps the ``"sql"`` phase (prepare and first
+    step). Close the query (or use it as a context manager) to end the read
+    and remove the handler.
+    """
+
+    def __init__(self, db, sql, timeout, max_steps, timer=_untimed):
+        self.db = db
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.cursor = None
+        self._elapsed = 0.0
+        self._resumed = None
+        self._steps = 0
+        self._tripped = None
+        db.set_progress_handler(self._progress, PROGRESS_INTERVAL)
+        try:
+            with timer("sql"), self._limits():
+                self.cursor = db.execute(sql)
+                self.columns = [d[0] for d in self.cursor.description]
+        except BaseException:
+            self.close()
+            raise
+
+    def _progress(self):
+        self._steps += PROGRESS_INTERVAL
+        if self.max_steps and self._steps > self.max_steps:
+            self._tripped = "steps"
+        elif self.timeout and self._elapsed + time.monotonic() - self._resumed > self.timeout:
+            self._tripped = "timeout"
+        return 1 if self._tripped else 0
+
+    @contextmanager
+    def _limits(self):
+        self._resumed = time.monotonic()
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if self._tripped == "steps":
+                raise QueryLimitError("steps", f"Query exceeded {self.max_steps} VM steps.") from e
+            if self._tripped == "timeout":
+                raise QueryLimitError("timeout", f"Query ran longer than {self.timeout:g}s.") from e
+            raise
+        finally:
+            self._elapsed += time.monotonic() - self._resumed
+
+    def batches(self, size=FETCH_BATCH):
+        """Yield the remaining rows as lists of lists, ``size`` at a time."""
+        while True:
+            with self._limits():
+                batch = self.cursor.fetchmany(size)
+            if not batch:
+                return
+            yield [list(row) for row in batch]
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+        self.db.set_progress_handler(None, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def execute(db, sql, max_rows, timeout, max_steps, timer=_untimed):
+    """Run ``sql`` and return ``(columns, rows)`` within the given budgets.
+
+    See ``Query`` for ``timeout``, ``max_steps`` and ``timer``; the
+    remaining rows are fetched under ``timer("fetch")``. The query is
+    abandoned as soon as more than ``max_rows`` arrive, rather than after
+    the whole result is materialized.
+    """
+    with Query(db, sql, timeout, max_steps, timer) as query:
+        rows = []
+        with timer("fetch"):
+            for batch in query.batches():
+                rows.extend(batch)
+                if max_rows and len(rows) > max_rows:
+                    raise QueryLimitError("rows", f"Query returned more than {max_rows} rows.")
+        return query.columns, rows
+
+
+def page(db, sql, offset, limit, timeout, max_steps, timer=_untimed):
+    """``(columns, rows, has_more)`` for up to ``limit`` rows of ``sql`` after the first ``offset``.
+
+    Skipped rows are read and dropped as they arrive, so memory is bounded
+    by ``limit`` however deep the page; time is not, and the skipped rows
+    count against the budgets. Running out of one before reaching ``offset``
+    raises QueryLimitError with limit ``"offset"``.
+    """
+    with Query(db, sql, timeout, max_steps, timer) as query:
+        rows = itertools.chain.from_iterable(query.batches())
+        with timer("fetch"):
+            try:
+                skipped = sum(1 for _ in itertools.islice(rows, offset))
+            except QueryLimitError as e:
+                raise QueryLimitError(
+                    "offset", f"{e} It stopped while skipping to row {offset}; stream the query to read that far."
+                ) from e
+            page = list(itertools.islice(rows, limit + 1)) if skipped == offset else []
+        return query.columns, page[:limit], len(page) > limit
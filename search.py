@@ -0,0 +1,81 @@
+"""Full-text search over entry names with an FTS5 index kept current by triggers.
+
+``entries_fts`` is an external-content FTS5 table over ``entries`` (the table
+or, in the compact layout, the view), so names are not stored twice; only
+the index is. Tokens are case- and diacritic-insensitive, and one- to
+three-character prefix indexes keep short prefix queries cheap.
+"""
+
+import re
+
+TABLE = "entries_fts"
+
+_TOKEN = re.compile(r"\w+")
+
+
+def match_expression(query, any_token=False):
+    """FTS5 MATCH text for ``query``: every token as a prefix, ANDed (or ORed).
+
+    Returns None if ``query`` holds no searchable tokens. Tokens are quoted,
+    so FTS5 syntax in user input is matched literally.
+    """
+    tokens = _TOKEN.findall(query)
+    if not tokens:
+        return None
+    return (" OR " if any_token else " ").join(f'"{token}"*' for token in tokens)
+
+
+def search(db, query, limit, schemas=("main",)):
+    """Return ``(rows, match)`` for the best ``limit`` entries by bm25 rank.
+
+    Entries matching every token are preferred; only when there are none
+    does any single token match (``match`` is ``"all"`` or ``"any"``).
+    Every match is ranked, keeping only the best ``limit`` as it goes, so a
+    short prefix matching much of the table costs a pass over its matches
+    but never a full sort. Equal ranks go to the newest entry first.
+
+    With several ``schemas`` (attached shards) each index is searched and
+    the results merged by rank; ranks are computed per shard, so the merge
+    is approximate when shards differ a lot in content.
+    """
+    for match in ("all", "any"):
+        expression = match_expression(query, any_token=match == "any")
+        rows = []
+        for schema in schemas:
+            rows += db.execute(
+                f"SELECT e.id, e.name, e.value, f.rank FROM ("
+                f"  SELECT rowid, rank FROM {schema}.{TABLE} WHERE {TABLE} MATCH ? ORDER BY rank, rowid DESC LIMIT ?"
+                f") AS f JOIN {schema}.entries AS e ON e.id = f.rowid ORDER BY f.rank, f.rowid DESC",
+                (expression, limit),
+            ).fetchall()
+        if len(schemas) > 1:
+            rows = sorted(rows, key=lambda row: (row[3], -row[0]))[:limit]
+        if rows or len(_TOKEN.findall(query)) < 2:
+            break
+    return rows, match
+
+
+def install(db, storage="entries"):
+    """Create the index and its triggers on ``storage``, populating it on first install."""
+    existing = db.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (TABLE,)).fetchone()
+    db.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(name, content='entries', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+    )
+    db.execute(
+        f"CREATE TRIGGER IF NOT EXISTS entries_search_insert AFTER INSERT ON {storage} BEGIN\n"
+        f"  INSERT INTO {TABLE} (rowid, name) VALUES (NEW.id, NEW.name);\n"
+        "END"
+    )
+    db.execute(
+        f"CREATE TRIGGER IF NOT EXISTS entries_search_delete AFTER DELETE ON {storage} BEGIN\n"
+        f"  INSERT INTO {TABLE} ({TABLE}, rowid, name) VALUES ('delete', OLD.id, OLD.name);\n"
+        "END"
+    )
+    if existing is None:
+        rebuild(db)
+
+
+def rebuild(db):
+    """Reindex every entry name; the caller commits."""
+    db.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
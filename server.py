@@ -0,0 +1,201 @@
+"""Pre-forking production server for app.py.
+
+The master process imports the app (and with it Flask, the Anthropic SDK and
+pyarrow), runs ``init_db()`` once, opens the listening socket and forks the
+workers. Each worker serves requests from that shared socket with a fixed
+pool of threads, so one request waiting on the model ties up one thread
+rather than the whole server.
+
+    python server.py --workers 4 --threads 8 --port 8000
+
+SIGTERM or SIGINT stops accepting new connections, lets in-flight requests
+finish for up to ``--graceful-timeout`` seconds, then kills what is left.
+Workers that exit unexpectedly are replaced; one that dies within
+``CRASH_SECONDS`` of starting is replaced after a delay that doubles with
+each such crash, up to ``MAX_RESPAWN_DELAY``.
+
+Workers write their metrics to a directory the master creates, so
+``/metrics`` reports the whole server whichever worker answers it.
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# A worker exiting sooner than this after it was forked counts as a crash
+# loop, not a one-off failure, and is replaced after a growing delay.
+CRASH_SECONDS = 5.0
+MAX_RESPAWN_DELAY = 30.0
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server handing each connection to one of ``threads`` pool threads.
+
+    Once every thread is busy the worker stops accepting, leaving new
+    connections in the shared backlog for a less busy worker.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, handler, multiprocess=False, fd=None):
+        self.multiprocess = multiprocess
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        # Workers share the listening socket; whichever loses the race for a
+        # connection must not block in accept().
+        self.socket.setblocking(False)
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="request")
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        """Wait for requests already accepted to finish."""
+        self._pool.shutdown(wait=True)
+
+
+def handler_class(timeout):
+    # Bounds how long an idle keep-alive connection can hold a pool thread.
+    return type("RequestHandler", (WSGIRequestHandler,), {"timeout": timeout})
+
+
+def run_worker(sock, args):
+    import app
+
+    app.metrics.share(args.metrics_dir)
+    server = PooledWSGIServer(
+        args.host, args.port, app.app, args.threads, handler_class(args.timeout),
+        multiprocess=args.workers > 1, fd=sock.fileno(),
+    )
+    # shutdown() waits for serve_forever() to return, so it can't be called
+    # from a handler running on the same thread.
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    server.serve_forever()
+    server.drain()
+    app.close_writers()
+    app.connections.close_all()
+    app.metrics.flush()
+
+
+def fork_worker(sock, args):
+    pid = os.fork()
+    if pid:
+        return pid
+    # Ctrl+C reaches the whole process group; the master turns it into a
+    # SIGTERM for each worker.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    status = 0
+    try:
+        run_worker(sock, args)
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.environ.get("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SERVER_PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVER_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("SERVER_THREADS", "8")))
+    parser.add_argument(
+        "--timeout", type=float, default=float(os.environ.get("SERVER_TIMEOUT", "30")),
+        help="seconds a connection may sit idle, or blocked on the client, before it is closed",
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30")),
+        help="seconds workers get to finish in-flight requests on shutdown",
+    )
+    args = parser.parse_args()
+
+    # Preload: everything imported or built here is shared copy-on-write
+    # with the workers instead of being loaded again in each of them.
+    import app
+
+    app.init_db()
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    args.metrics_dir = tempfile.mkdtemp(prefix="server-metrics-")
+    gc.freeze()
+
+    workers = {}  # pid -> when it was forked
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        signal_workers(signal.SIGTERM)
+        signal.alarm(args.graceful_timeout)
+
+    def signal_workers(signum):
+        for pid in list(workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGALRM, lambda signum, frame: signal_workers(signal.SIGKILL))
+
+    def spawn():
+        workers[fork_worker(sock, args)] = time.monotonic()
+
+    for _ in range(args.workers):
+        spawn()
+    print(
+        f"Serving on http://{args.host}:{args.port} with {args.workers} workers x {args.threads} threads",
+        file=sys.stderr,
+    )
+
+    delay = 0.0
+    while workers:
+        pid, status = os.wait()
+        forked = workers.pop(pid, None)
+        if forked is None or stopping:
+            continue
+        lived = time.monotonic() - forked
+        delay = 0.0 if lived >= CRASH_SECONDS else min(max(2 * delay, 0.1), MAX_RESPAWN_DELAY)
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting"
+              + (f" in {delay:g}s" if delay else ""), file=sys.stderr)
+        # Sleeps in steps so a shutdown signal is not held up by the delay.
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(max(0.0, min(0.1, deadline - time.monotonic())))
+        if not stopping:
+            spawn()
+    sock.close()
+    shutil.rmtree(args.metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Partitioned storage: ``entries`` split across several SQLite files.
+
+Each shard file holds an ordinary ``entries`` table with its own generated
+columns, indexes, rollups and search index. A connection to the main
+database attaches every shard (``attach``) and sees them through TEMP views
+named like the tables they replace: ``entries`` is the UNION ALL of the
+shards and each rollup table sums the shards' counts, so reads and report
+SQL run unchanged.
+
+New rows go to the shard picked by the partition key: ``"id"`` spreads them
+round-robin, ``"zip"`` hashes the first ``zip_prefix`` digits of the zip so
+a neighbourhood stays in one file. Shards allocate ids from disjoint
+residue classes (shard ``i`` of ``n`` only uses ids with ``(id - 1) % n ==
+i``), always above the highest id in any shard, so ids stay unique. Write
+connections begin their transactions IMMEDIATE, which locks the main
+database and every shard until commit, so each new id is computed after the
+previous write committed and ids become visible in increasing order, as
+``since_id`` readers and the columnar refresh expect. Writes to different
+shards therefore do not run concurrently.
+
+``ShardSet.execute`` answers a report query by running it against every
+shard in a process pool and merging the partial results. It handles
+aggregates that decompose (COUNT, SUM, TOTAL, MIN, MAX and AVG, grouped or
+not) and row queries with ORDER BY ... LIMIT; anything else raises
+``aggregate.Unsupported`` and should run serially through the views.
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import quote
+
+import aggregate
+import rollups
+import sandbox
+
+KEYS = ("id", "zip")
+
+# Rows a single shard may return for the merge. Partial results past this
+# are not worth shipping between processes; the query runs serially.
+PARTIAL_ROWS = 100000
+
+
+def paths(database, count):
+    """Shard file paths next to ``database``: data.db -> data.shard0.db, ..."""
+    root, extension = os.path.splitext(database)
+    return [f"{root}.shard{i}{extension or '.db'}" for i in range(count)]
+
+
+class ShardSet:
+    """The shard files of one database and the pool that queries them."""
+
+    def __init__(self, paths, key="id", zip_prefix=3, processes=None):
+        if key not in KEYS:
+            raise ValueError(f"Shard key must be one of {', '.join(KEYS)}, not {key!r}")
+        if len(paths) < 2:
+            raise ValueError("Partitioning needs at least two shards")
+        self.paths = list(paths)
+        self.key = key
+        self.zip_prefix = zip_prefix
+        self.processes = processes or min(len(self.paths), os.cpu_count() or 1)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+
+    @property
+    def count(self):
+        return len(self.paths)
+
+    @property
+    def schemas(self):
+        """Schema names the shards are attached under."""
+        return [f"shard{i}" for i in range(self.count)]
+
+    def shard_for(self, value):
+        """Shard index for a new entry whose stored ``value`` text is ``value``."""
+        if self.key == "id":
+            return next(self._next) % self.count
+        try:
+            zip_code = json.loads(value).get("zip")
+        except (ValueError, AttributeError):
+            zip_code = None
+        prefix = str(zip_code or "")[:self.zip_prefix]
+        return zlib.crc32(prefix.encode()) % self.count
+
+    def insert_sql(self, shard):
+        """INSERT of ``(name, value)`` into ``shard``, run on an attached connection.
+
+        The id is the next one in the shard's residue class above both the
+        highest id in any shard and the shard's own AUTOINCREMENT sequence,
+        so deleted ids are not reused. It is only ordered by commit on a
+        connection set up by ``attach``.
+        """
+        schema = f"shard{shard}"
+        return (
+            f"INSERT INTO {schema}.entries (id, name, value) "
+            f"SELECT top + 1 + (({shard} - top) % {self.count} + {self.count}) % {self.count}, ?, ? FROM ("
+            f"SELECT MAX(IFNULL((SELECT id FROM entries ORDER BY id DESC LIMIT 1), 0), "
+            f"IFNULL((SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'entries'), 0)) AS top)"
+        )
+
+    def attach(self, db, readonly=False):
+        """Attach every shard to ``db`` and create the TEMP views over them."""
+        if not readonly:
+            # BEGIN IMMEDIATE takes the write lock on every attached file at
+            # once, before insert_sql reads the highest id.
+            db.isolation_level = "IMMEDIATE"
+        # These settings are per schema; give the shards the main database's.
+        settings = {
+            name: db.execute(f"PRAGMA {name}").fetchone()[0] for name in ("synchronous", "mmap_size", "cache_size")
+        }
+        for schema, path in zip(self.schemas, self.paths):
+            if readonly:
+                db.execute("ATTACH ? AS " + schema, (f"file:{quote(os.path.abspath(path))}?mode=ro",))
+            else:
+                db.execute("ATTACH ? AS " + schema, (path,))
+            for name, value in settings.items():
+                db.execute(f"PRAGMA {schema}.{name} = {int(value)}")
+        union = " UNION ALL ".join(f"SELECT * FROM {schema}.entries" for schema in self.schemas)
+        db.execute(f"CREATE TEMP VIEW IF NOT EXISTS entries AS {union}")
+        for table, keys in rollups.ROLLUPS.items():
+            columns = ", ".join(column for column, _ in keys)
+            union = " UNION ALL ".join(f"SELECT {columns}, n FROM {schema}.{table}" for schema in self.schemas)
+            db.execute(
+                f"CREATE TEMP VIEW IF NOT EXISTS {table} AS "
+                f"SELECT {columns}, SUM(n) AS n FROM ({union}) GROUP BY {columns}"
+            )
+
+    def execute(self, sql, max_rows, timeout, max_steps):
+        """Return ``(columns, rows)`` for ``sql`` merged from every shard.
+
+        Raises aggregate.Unsupported if the query does not split into
+        per-shard parts, and sandbox.QueryLimitError if a shard exceeds
+        ``timeout`` or ``max_steps`` or the merged result has more than
+        ``max_rows`` rows.
+        """
+        plan = _Plan(aggregate.parse(sql))
+        pool = self._executor()
+        futures = [pool.submit(_run, path, plan.sql, timeout, max_steps) for path in self.paths]
+        try:
+            results = [future.result() for future in futures]
+        except sandbox.QueryLimitError as e:
+            if e.limit == "rows":
+                raise aggregate.Unsupported("A shard returned too many rows to merge")
+            raise
+        except sqlite3.Error as e:
+            # The rewritten SQL failed; the serial path reports the real error.
+            raise aggregate.Unsupported(str(e))
+        except BrokenProcessPool:
+            # A worker died; start a new pool next time.
+            self.close()
+            raise aggregate.Unsupported("The shard query pool failed")
+        finally:
+            for future in futures:
+                future.cancel()
+        columns, rows = plan.merge(_scratch(), results)
+        if max_rows and len(rows) > max_rows:
+            raise sandbox.QueryLimitError("rows", f"Query returned more than {max_rows} rows.")
+        return columns, rows
+
+    def _executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Spawned, not forked: the workers must not inherit the
+                # server's threads, sockets or open SQLite connections.
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+                self._pid = os.getpid()
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(cancel_futures=True)
+            self._pool = self._pid = None
+
+
+class _Plan:
+    """The per-shard SQL for a parsed query and how to merge its results."""
+
+    def __init__(self, query):
+        self.query = query
+        if query.is_aggregate:
+            self._aggregate()
+        elif query.order_by and query.limit is not None:
+            self._top()
+        else:
+            raise aggregate.Unsupported("Only aggregates and ORDER BY ... LIMIT queries can be merged")
+
+    def _aggregate(self):
+        query = self.query
+        select = [aggregate.render(expr) for expr in query.group_by]
+        # (aggregate name, position, width) of each call's partial columns.
+        self.partials = []
+        for call in query.aggregates.values():
+            arg = "*" if call.star else aggregate.render(call.args[0])
+            if call.distinct and call.name not in ("min", "max"):
+                raise aggregate.Unsupported(f"{call.name.upper()}(DISTINCT ...) cannot be merged across shards")
+            position = len(select) - len(query.group_by)
+            if call.name == "avg":
+                select += [f"total({arg})", f"count({arg})"]
+            else:
+                select.append(f"{call.name}({arg})")
+            self.partials.append((call.name, position, len(select) - len(query.group_by) - position))
+        self.sql = f"SELECT {', '.join(select)} FROM entries"
+        if query.where is not None:
+            self.sql += f" WHERE {aggregate.render(query.where)}"
+        if query.group_by:
+            self.sql += f" GROUP BY {', '.join(select[:len(query.group_by)])}"
+        self.merge = self._merge_aggregate
+
+    def _merge_aggregate(self, db, results):
+        width = len(self.query.group_by)
+        groups = {}
+        for _, rows in results:
+            for row in rows:
+                keys, values = tuple(row[:width]), row[width:]
+                merged = groups.setdefault(keys, values)
+                if merged is values:
+                    continue
+                for name, i, n in self.partials:
+                    merged[i:i + n] = _combine(name, merged[i:i + n], values[i:i + n])
+        rows = []
+        for keys, values in groups.items():
+            finished = []
+            for name, i, n in self.partials:
+                if name == "avg":
+                    total, count = values[i:i + n]
+                    finished.append(total / count if count else None)
+                else:
+                    finished.append(values[i])
+            rows.append(keys + tuple(finished))
+        return aggregate.project(db, self.query, rows)
+
+    def _top(self):
+        query = self.query
+        aliases = {(alias or "").lower(): expr for expr, alias in query.select if alias}
+        select = [f"{aggregate.render(expr)} AS c{i}" for i, (expr, _) in enumerate(query.select)]
+        order = []
+        for i, (expr, direction) in enumerate(query.order_by):
+            item = expr[0]
+            if len(expr) == 1 and isinstance(item, aggregate.Token) and item.kind == "num":
+                position = int(item.text)
+                if not 1 <= position <= len(query.select):
+                    raise aggregate.Unsupported("ORDER BY term out of range")
+                expr = query.select[position - 1][0]
+            elif len(expr) == 1 and isinstance(item, (aggregate.Token, aggregate.Column)):
+                name = item.name if isinstance(item, aggregate.Column) else (item.word or "")
+                expr = aliases.get(name, expr)
+            select.append(f"{aggregate.render(expr)} AS o{i}")
+            order.append(f"o{i} {direction}".rstrip())
+        # Each shard returns its own top limit + offset rows; the global top
+        # rows are among them.
+        self.sql = f"SELECT {', '.join(select)} FROM entries"
+        if query.where is not None:
+            self.sql += f" WHERE {aggregate.render(query.where)}"
+        self.sql += f" ORDER BY {', '.join(order)} LIMIT {query.limit + (query.offset or 0)}"
+        self.order = order
+        self.merge = self._merge_top
+
+    def _merge_top(self, db, results):
+        query = self.query
+        names = [f"c{i}" for i in range(len(query.select))] + [f"o{i}" for i in range(len(query.order_by))]
+        sql = f"SELECT {', '.join(names[:len(query.select)])} FROM temp.top ORDER BY {', '.join(self.order)}"
+        sql += f" LIMIT {query.limit}" + (f" OFFSET {query.offset}" if query.offset is not None else "")
+        db.execute("DROP TABLE IF EXISTS temp.top")
+        db.execute(f"CREATE TEMP TABLE top ({', '.join(names)})")
+        try:
+            for _, rows in results:
+                db.executemany(f"INSERT INTO temp.top VALUES ({', '.join('?' * len(names))})", rows)
+            rows = [list(row) for row in db.execute(sql)]
+        finally:
+            db.execute("DROP TABLE temp.top")
+        return [query.name(i) for i in range(len(query.select))], rows
+
+
+def _combine(name, left, right):
+    """Merge one aggregate's partial values from two shards."""
+    if name in ("count", "total"):
+        return [left[0] + right[0]]
+    if name == "avg":
+        return [left[0] + right[0], left[1] + right[1]]
+    if name == "sum":
+        values = [value for value in (left[0], right[0]) if value is not None]
+        return [sum(values) if values else None]
+    values = [value for value in (left[0], right[0]) if value is not None]
+    if not values:
+        return [None]
+    pick = min if name == "min" else max
+    return [pick(values, key=aggregate.sort_key)]
+
+
+_local = threading.local()
+
+
+def _scratch():
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = _local.db = sqlite3.connect(":memory:")
+    return db
+
+
+# Read-only connections held by each pool worker: path -> (inode, connection).
+_connections = {}
+
+
+def _run(path, sql, timeout, max_steps):
+    """Pool worker: run one shard's part of a query within the report budgets."""
+    # A report snapshot (replica.py) is replaced by renaming a new file over
+    # it; reopen when that happens.
+    inode = os.stat(path).st_ino
+    cached = _connections.get(path)
+    if cached is None or cached[0] != inode:
+        if cached is not None:
+            cached[1].close()
+        db = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+        cached = _connections[path] = inode, db
+    return sandbox.execute(cached[1], sql, PARTIAL_ROWS, timeout, max_steps)
@@ -0,0 +1,122 @@
+"""Cache of generated SQL keyed on the normalized question text."""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from db import abandon
+
+_WHITESPACE = re.compile(r"\s+")
+# Sentence punctuation ending a question. Anything inside it is kept:
+# operators, signs and decimal points change the SQL ("age > 65" is not
+# "age < 65").
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:]+$")
+
+
+def normalize_question(question):
+    """Fold case, whitespace and trailing punctuation so trivially different phrasings share an entry."""
+    text = _WHITESPACE.sub(" ", question.casefold()).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+class SQLCache:
+    """Bounded LRU/TTL map from question to SQL, optionally backed by a SQLite file.
+
+    Keys also cover the model name and a hash of the system prompt, so
+    changing either naturally misses instead of serving SQL written for an
+    older schema. The persistent tier is consulted on a memory miss and
+    survives restarts; expired rows are ignored and overwritten lazily. Its
+    connection is reopened in a forked child so processes never share one.
+    """
+
+    def __init__(self, maxsize=256, ttl=24 * 3600, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.path = path or None
+        self._db = None
+        self._pid = None
+        with self._lock:
+            self._connection()
+
+    def _connection(self):
+        """The persistent tier's connection for this process (None without one); call with the lock held."""
+        if self.path is not None and self._pid != os.getpid():
+            if self._db is not None:
+                # The parent's connection; see db.abandon.
+                abandon(self._db)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sql_cache (key TEXT PRIMARY KEY, sql TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+    @staticmethod
+    def key(question, model, prompt):
+        digest = hashlib.sha256()
+        for part in (model, hashlib.sha256(prompt.encode()).hexdigest(), normalize_question(question)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            db = self._connection()
+            if db is not None:
+                row = db.execute("SELECT sql, created FROM sql_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] < self.ttl:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, sql):
+        created = time.time()
+        with self._lock:
+            self._remember(key, sql, created)
+            db = self._connection()
+            if db is not None:
+                db.execute("INSERT OR REPLACE INTO sql_cache (key, sql, created) VALUES (?, ?, ?)", (key, sql, created))
+                db.commit()
+
+    def _remember(self, key, sql, created):
+        self._entries[key] = (sql, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM sql_cache")
+                db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "persistent": self.path is not None,
+            }
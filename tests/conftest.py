@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# app reads its configuration at import; keep test runs away from ./data.db.
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="app-tests-"), "data.db"))
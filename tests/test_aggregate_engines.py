@@ -0,0 +1,120 @@
+import math
+import sqlite3
+
+import pytest
+
+import aggregate
+import columnar
+import shards
+from benchmarks.datagen import create_app_db
+from benchmarks.shards import split
+
+# Entries the generator never produces: invalid JSON, missing fields,
+# impossible or non-text dates, numeric zips and case or spacing variants.
+ODD_ENTRIES = [
+    ("Odd 1", "{}"),
+    ("Odd 2", "not json"),
+    ("Odd 3", '{"dob": "1990-02-30", "zip": 12345, "race": ""}'),
+    ("Odd 4", '{"dob": "unknown", "zip": null, "race": "White"}'),
+    ("Odd 5", '{"dob": 19900101, "zip": "02134", "ethnicity": null}'),
+    ("Odd 6", '{"dob": "2001-07-04", "zip": "02134 ", "race": "WHITE"}'),
+    ("Odd 7", '{"dob": "2001-07-04T10:00:00", "zip": 2134.5, "race": "Asian"}'),
+]
+
+AGGREGATES = [
+    "SELECT race, COUNT(*) FROM entries GROUP BY race",
+    'SELECT race AS "Race", ethnicity AS e, COUNT(*) AS n FROM entries GROUP BY "Race", e ORDER BY n DESC, 1, 2',
+    "SELECT zip, COUNT(*) FROM entries WHERE zip > '' GROUP BY 1 HAVING COUNT(*) > 2 ORDER BY 2 DESC, 1 LIMIT 10",
+    "SELECT substr(dob, 1, 4) AS year, COUNT(*) FROM entries GROUP BY year ORDER BY year",
+    "SELECT ethnicity, AVG(CAST(substr(dob, 1, 4) AS INTEGER)), MIN(dob), MAX(dob) FROM entries GROUP BY ethnicity",
+    "SELECT race, MIN(DISTINCT zip), MAX(DISTINCT dob) FROM entries GROUP BY race HAVING MAX(zip) > '5'",
+    "SELECT COUNT(*), COUNT(dob), SUM(length(zip)), TOTAL(length(zip)), AVG(length(zip)) FROM entries",
+    "SELECT race, COUNT(*) FROM entries WHERE dob IS NULL GROUP BY race",
+    "SELECT dob, COUNT(*) FROM entries WHERE dob NOT GLOB '[0-9][0-9][0-9][0-9]-*' GROUP BY dob",
+    "SELECT zip, typeof(zip), COUNT(*) FROM entries WHERE zip NOT GLOB '[0-9][0-9][0-9][0-9][0-9]' GROUP BY zip",
+    "SELECT COUNT(*), MAX(dob), AVG(length(zip)) FROM entries WHERE race = 'nobody'",
+    "SELECT race, COUNT(*) FROM entries WHERE race = 'nobody' GROUP BY race",
+    "SELECT COUNT(*) * 2 + 1 AS twice, MAX(dob) || '!' FROM entries WHERE race = 'White' AND dob > '1980'",
+]
+
+# Only the columnar engine counts distinct values; shards cannot merge them.
+DISTINCT_COUNTS = [
+    "SELECT COUNT(DISTINCT race), COUNT(DISTINCT zip) FROM entries",
+    "SELECT ethnicity, COUNT(DISTINCT substr(dob, 1, 4)) FROM entries GROUP BY ethnicity",
+]
+
+ROWS = [
+    "SELECT name, dob FROM entries WHERE dob > '' ORDER BY dob DESC, name LIMIT 5",
+    "SELECT id, zip FROM entries ORDER BY zip, id LIMIT 20",
+]
+
+# Queries neither engine can merge; the app runs them serially.
+UNSUPPORTED = [
+    "SELECT DISTINCT race FROM entries",
+    "SELECT name FROM entries ORDER BY name",
+]
+
+
+@pytest.fixture(scope="module")
+def databases(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("engines") / "data.db")
+    create_app_db(path, 3000, seed=20)
+    db = sqlite3.connect(path)
+    db.executemany("INSERT INTO entries (name, value) VALUES (?, ?)", ODD_ENTRIES)
+    db.commit()
+    paths = shards.paths(path, 3)
+    split(path, paths)
+    shard_set = shards.ShardSet(paths, processes=2)
+    yield db, shard_set
+    shard_set.close()
+    db.close()
+
+
+def sqlite_result(db, sql):
+    cursor = db.execute(sql)
+    return [d[0] for d in cursor.description], [list(row) for row in cursor]
+
+
+def assert_same(result, expected, sql):
+    columns, rows = result
+    assert columns == expected[0]
+    if "ORDER BY" not in sql:
+        rows, expected = sorted(rows, key=repr), (expected[0], sorted(expected[1], key=repr))
+    assert len(rows) == len(expected[1])
+    for row, expected_row in zip(rows, expected[1]):
+        for value, expected_value in zip(row, expected_row):
+            # Partial sums are added in a different order than SQLite's.
+            if isinstance(value, float) and isinstance(expected_value, float):
+                assert math.isclose(value, expected_value, rel_tol=1e-9), (sql, row, expected_row)
+            else:
+                assert (type(value), value) == (type(expected_value), expected_value), (sql, row, expected_row)
+
+
+@pytest.mark.skipif(not columnar.available(), reason="numpy is not installed")
+@pytest.mark.parametrize("sql", AGGREGATES + DISTINCT_COUNTS)
+def test_columnar_matches_sqlite(databases, sql):
+    db, _ = databases
+    assert_same(columnar.ColumnarEngine().execute(db, sql), sqlite_result(db, sql), sql)
+
+
+@pytest.mark.parametrize("sql", AGGREGATES + ROWS)
+def test_shards_match_sqlite(databases, sql):
+    db, shard_set = databases
+    assert_same(shard_set.execute(sql, 0, 0, 0), sqlite_result(db, sql), sql)
+
+
+@pytest.mark.parametrize("sql", DISTINCT_COUNTS)
+def test_shards_refuse_distinct_counts(databases, sql):
+    _, shard_set = databases
+    with pytest.raises(aggregate.Unsupported):
+        shard_set.execute(sql, 0, 0, 0)
+
+
+@pytest.mark.parametrize("sql", UNSUPPORTED)
+def test_unmergeable_queries_are_refused(databases, sql):
+    db, shard_set = databases
+    with pytest.raises(aggregate.Unsupported):
+        shard_set.execute(sql, 0, 0, 0)
+    if columnar.available():
+        with pytest.raises(aggregate.Unsupported):
+            columnar.ColumnarEngine().execute(db, sql)
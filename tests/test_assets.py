@@ -0,0 +1,40 @@
+import pytest
+from flask import Flask, request
+
+import assets
+
+BODY = "<p>" + "hello " * 200 + "</p>"
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    asset = assets.Asset(BODY, "text/html", "no-cache")
+    app.add_url_rule("/", "index", lambda: asset.response(request))
+    return app.test_client()
+
+
+def test_each_encoding_has_its_own_etag(client):
+    identity = client.get("/", headers={"Accept-Encoding": "identity"})
+    compressed = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert identity.get_data(as_text=True) == BODY
+    assert identity.headers["ETag"] != compressed.headers["ETag"]
+    assert compressed.headers["ETag"].endswith('-gzip"')
+
+
+def test_if_none_match_is_checked_against_the_served_encoding(client):
+    identity_etag = client.get("/", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+    gzip_etag = client.get("/", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == gzip_etag
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": identity_etag})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    response = client.get("/", headers={"Accept-Encoding": "identity", "If-None-Match": gzip_etag})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
@@ -0,0 +1,25 @@
+import os
+
+import db
+from db import ConnectionManager
+
+
+def test_forked_child_abandons_the_parents_connections(tmp_path):
+    manager = ConnectionManager(str(tmp_path / "data.db"))
+    pooled, checked_out = manager.acquire(), manager.acquire()
+    manager.release(pooled)
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            child_db = manager.acquire()
+            manager.release(checked_out)
+            kept = [checked_out] if db._inherited[-1] is checked_out else []
+            kept += [conn for item in db._inherited if isinstance(item, list) for pool in item for conn in pool.queue]
+            ok = child_db not in (pooled, checked_out) and pooled in kept and checked_out in kept
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    manager.release(checked_out)
+    assert manager.acquire() is checked_out
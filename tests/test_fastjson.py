@@ -0,0 +1,34 @@
+import datetime
+
+import pytest
+from flask import Flask, jsonify, request
+
+import fastjson
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.json = fastjson.JSONProvider(app)
+
+    @app.post("/echo")
+    def echo():
+        return jsonify(request.get_json())
+
+    return app.test_client()
+
+
+def test_large_integers_round_trip(client):
+    body = b'{"id": 123456789012345678901234567890, "n": -9223372036854775809}'
+    response = client.post("/echo", data=body, content_type="application/json")
+    assert response.status_code == 200
+    assert response.get_json() == {"id": 123456789012345678901234567890, "n": -9223372036854775809}
+    assert fastjson.dumps([2 ** 70]) == "[1180591620717411303424]"
+
+
+def test_matches_flask_output(client):
+    body = {"b": [1, 2.5, None, "é"], "a": {"when": "x"}}
+    response = client.post("/echo", json=body)
+    assert response.get_json() == body
+    assert list(response.get_json()) == ["a", "b"]
+    assert client.application.json.dumps({"d": datetime.date(2020, 1, 2)}) == '{"d":"Thu, 02 Jan 2020 00:00:00 GMT"}'
@@ -0,0 +1,105 @@
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import shards
+from benchmarks import stub
+from benchmarks.datagen import fill
+from benchmarks.messages_stub import ANSWERS
+from benchmarks.shards import split
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    import app
+
+    app.init_db()
+    db = sqlite3.connect(app.DATABASE)
+    fill(db, 500, seed=9)
+    db.close()
+    return app
+
+
+@pytest.fixture
+def llm(app_module):
+    yield stub.install(app_module)
+    app_module.sql_cache.clear()
+    app_module.result_cache.clear()
+
+
+@pytest.mark.parametrize("question", sorted(ANSWERS))
+def test_questions_through_the_stub(app_module, llm, question):
+    response = app_module.app.test_client().post("/reports/query", json={"question": question, "cache": False})
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert body["rows"]
+    # Questions a rollup answers never reach the model.
+    if llm.calls:
+        assert body["sql"] == ANSWERS[question]
+
+
+@pytest.mark.parametrize("question", ["Average age by ethnicity", "Youngest and oldest person"])
+def test_model_questions_reach_the_stub(app_module, llm, question):
+    response = app_module.app.test_client().post("/reports/query", json={"question": question, "cache": False})
+    assert response.status_code == 200, response.get_json()
+    assert llm.calls == 1
+
+
+def test_reply_without_usage_is_not_an_error(app_module, llm):
+    llm.messages.create = lambda **kwargs: SimpleNamespace(
+        content=[SimpleNamespace(type="text", text="SELECT COUNT(*) AS n FROM entries")]
+    )
+    response = app_module.app.test_client().post(
+        "/reports/query", json={"question": "How many entries are there?", "cache": False}
+    )
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["rows"] == [[500]]
+
+
+def test_pages_stop_at_the_maximum_offset(app_module, llm, monkeypatch):
+    monkeypatch.setattr(app_module, "REPORT_MAX_OFFSET", 120)
+    monkeypatch.setattr(app_module, "get_sql", lambda question: ("SELECT id FROM entries ORDER BY id", False))
+    client = app_module.app.test_client()
+    body = client.post("/reports/query", json={"question": "every id", "page_size": 50, "cache": False}).get_json()
+    ids = [row[0] for row in body["rows"]]
+    while body["next"]:
+        body = client.post("/reports/query", json={"cursor": body["next"]}).get_json()
+        ids += [row[0] for row in body["rows"]]
+    assert ids == list(range(1, 151))
+    assert "stream the query" in body["warnings"][-1]
+
+    cursor = app_module.report_cursors.dumps({
+        "sql": "SELECT id FROM entries ORDER BY id", "source": "model", "offset": 200, "page_size": 50,
+        "version": app_module.report_version(),
+    })
+    response = client.post("/reports/query", json={"cursor": cursor})
+    assert response.status_code == 422
+    assert response.get_json()["limit"] == "offset"
+
+
+def test_sharded_streams_use_the_stream_row_limit(app_module, llm, monkeypatch, tmp_path):
+    paths = shards.paths(str(tmp_path / "data.db"), 2)
+    split(app_module.DATABASE, paths)
+    shard_set = shards.ShardSet(paths, processes=1)
+    monkeypatch.setattr(app_module, "report_shards", shard_set)
+    monkeypatch.setattr(app_module, "REPORT_MAX_ROWS", 100)
+    sql = "SELECT id, zip FROM entries ORDER BY id LIMIT 300"
+    monkeypatch.setattr(app_module, "get_sql", lambda question: (sql, False))
+    client = app_module.app.test_client()
+    try:
+        response = client.post("/reports/query", json={"question": "ids", "stream": "ndjson"})
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines[0]["engine"] == "shards"
+        assert sum(len(line.get("rows", [])) for line in lines) == 300
+        assert lines[-1] == {"done": True, "count": 300}
+
+        # Too many rows for a plain request: refused, and not cached to be refused again.
+        for _ in range(2):
+            response = client.post("/reports/query", json={"question": "ids"})
+            assert response.status_code == 422
+            assert response.get_json()["limit"] == "rows"
+        assert app_module.result_cache.get(sql, app_module.report_version()) is None
+    finally:
+        shard_set.close()
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+import pytest
+
+import sandbox
+
+COUNT_TO = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c{limit}) SELECT {select} FROM c"
+
+
+@pytest.fixture
+def db():
+    db = sqlite3.connect(":memory:")
+    yield db
+    db.close()
+
+
+def test_timeout_ignores_time_between_batches(db):
+    with sandbox.Query(db, COUNT_TO.format(limit=" LIMIT 3000", select="x"), 0.2, 0) as query:
+        rows = 0
+        for batch in query.batches(500):
+            rows += len(batch)
+            time.sleep(0.1)
+    assert rows == 3000
+
+
+def test_timeout_stops_a_long_query(db):
+    with pytest.raises(sandbox.QueryLimitError) as raised:
+        sandbox.execute(db, COUNT_TO.format(limit="", select="COUNT(*)"), 0, 0.2, 0)
+    assert raised.value.limit == "timeout"
+
+
+def test_step_budget(db):
+    with pytest.raises(sandbox.QueryLimitError) as raised:
+        sandbox.execute(db, COUNT_TO.format(limit="", select="COUNT(*)"), 0, 0, 100000)
+    assert raised.value.limit == "steps"
+
+
+def test_page_reports_running_out_of_budget_while_skipping(db):
+    sql = COUNT_TO.format(limit=" LIMIT 1000000", select="x")
+    assert sandbox.page(db, sql, 10, 5, 0, 0)[1:] == ([[11], [12], [13], [14], [15]], True)
+    with pytest.raises(sandbox.QueryLimitError) as raised:
+        sandbox.page(db, sql, 900000, 5, 0, 100000)
+    assert raised.value.limit == "offset"
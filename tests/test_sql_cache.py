@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+import db
+from sql_cache import SQLCache, normalize_question
+
+
+def key(question):
+    return SQLCache.key(question, "model", "prompt")
+
+
+@pytest.mark.parametrize("a, b", [
+    ("How many people by race?", "how many people by race"),
+    ("  How   many people\tby race ?! ", "how many people by race"),
+    ("Top 10 most common zip codes.", "top 10 most common zip codes"),
+])
+def test_trivial_differences_share_a_key(a, b):
+    assert normalize_question(a) == normalize_question(b)
+    assert key(a) == key(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("people with age > 65", "people with age < 65"),
+    ("people with age >= 65", "people with age > 65"),
+    ("entries where zip = 10001", "entries where zip != 10001"),
+    ("entries where zip = 10001", "entries where zip <> 10001"),
+    ("share of people over 6.5%", "share of people over 65"),
+    ("temperatures below -5", "temperatures below 5"),
+    ("income over 10,001", "income over 10 001"),
+])
+def test_operators_and_numbers_are_kept(a, b):
+    assert key(a) != key(b)
+
+
+def test_key_covers_model_and_prompt():
+    question = "How many people by race?"
+    assert SQLCache.key(question, "a", "prompt") != SQLCache.key(question, "b", "prompt")
+    assert SQLCache.key(question, "a", "prompt") != SQLCache.key(question, "a", "other prompt")
+
+
+def test_persistent_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "sql_cache.db")
+    SQLCache(path=path).put("k", "SELECT 1")
+    assert SQLCache(path=path).get("k") == "SELECT 1"
+
+
+def test_forked_child_opens_its_own_connection(tmp_path):
+    cache = SQLCache(path=str(tmp_path / "sql_cache.db"))
+    parent_db = cache._db
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            cache.put("child", "SELECT 2")
+            ok = cache._db is not parent_db and cache.get("child") == "SELECT 2"
+            # Kept open rather than freed, which would close it.
+            ok = ok and any(inherited is parent_db for inherited in db._inherited)
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert cache._db is parent_db
+    cache._entries.clear()
+    assert cache.get("child") == "SELECT 2"
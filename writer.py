@@ -0,0 +1,174 @@
+"""Group commit: a single writer thread batching inserts from many requests."""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class QueueFullError(Exception):
+    """The write queue is at capacity; the caller should retry later."""
+
+
+class WriteFailedError(Exception):
+    """The record's batch failed, or was not committed within the caller's timeout.
+
+    The original error, if any, is the ``__cause__``.
+    """
+
+
+class _Write:
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitWriter:
+    """Runs ``sql`` for queued parameter tuples in batches, one commit per batch.
+
+    A batch is closed after ``max_batch`` records or ``max_delay`` seconds
+    after its first record, whichever comes first, then written with one
+    ``executemany`` and one commit on a connection from ``connect()``.
+    ``on_commit(count)`` is called after each successful commit. At most
+    ``max_queue`` records wait at once; ``submit`` raises QueueFullError
+    beyond that. The thread starts on first use and is started afresh in a
+    forked child. A batch that fails, including failing to connect, fails
+    only its own records; the next batch runs on a new connection.
+    """
+
+    def __init__(self, connect, sql, max_batch=256, max_delay=0.005, max_queue=10000, on_commit=None):
+        self.connect = connect
+        self.sql = sql
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.on_commit = on_commit
+        self.batches = 0
+        self.records = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(self.max_queue)
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None or not self._thread.is_alive():
+                # Also replaces a thread that died, keeping what it had queued.
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def submit(self, params, wait=True, timeout=None):
+        """Queue one record; with ``wait`` block until its batch is committed.
+
+        Raises QueueFullError when the queue is full, and WriteFailedError
+        if the batch failed or was not committed within ``timeout`` seconds
+        (it may still be committed later then).
+        """
+        write = _Write() if wait else None
+        try:
+            self._ensure_started().put_nowait((params, write))
+        except queue.Full:
+            raise QueueFullError(f"Write queue is full ({self.max_queue} records waiting)")
+        if write is not None:
+            if not write.done.wait(timeout):
+                raise WriteFailedError(f"Write was not committed within {timeout:g}s")
+            if write.error is not None:
+                raise WriteFailedError(f"Write failed: {write.error}") from write.error
+
+    def depth(self):
+        return self._queue.qsize() if self._pid == os.getpid() else 0
+
+    def close(self):
+        """Commit everything queued so far and stop the thread."""
+        with self._lock:
+            started = self._pid == os.getpid()
+            self._pid = None
+        if started:
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        db = None
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                if db is None:
+                    db = self.connect()
+            except Exception as e:
+                self._fail(batch, e)
+                continue
+            if not self._commit(db, batch):
+                # The failure may have left the connection unusable.
+                _close(db)
+                db = None
+        if db is not None:
+            _close(db)
+
+    def _commit(self, db, batch):
+        """Write ``batch`` in one transaction; returns whether it was committed."""
+        try:
+            db.executemany(self.sql, [params for params, _ in batch])
+            db.commit()
+        except Exception as e:
+            try:
+                db.rollback()
+            except sqlite3.Error:
+                pass
+            self._fail(batch, e)
+            return False
+        self.batches += 1
+        self.records += len(batch)
+        if self.on_commit is not None:
+            try:
+                self.on_commit(len(batch))
+            except Exception:
+                # The records are committed; report them as written anyway.
+                logger.exception("on_commit after a group commit failed")
+        self._finish(batch, None)
+        return True
+
+    def _fail(self, batch, error):
+        if any(write is None for _, write in batch):
+            logger.error("Group commit of %d acknowledged records failed", len(batch), exc_info=error)
+        self._finish(batch, error)
+
+    @staticmethod
+    def _finish(batch, error):
+        for _, write in batch:
+            if write is not None:
+                write.error = error
+                write.done.set()
+
+
+def _close(db):
+    try:
+        db.close()
+    except sqlite3.Error:
+        pass